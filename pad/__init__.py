@@ -4,4 +4,11 @@ if sys.version_info < (3, 11):
 	print('Freepad require Python version 3.11 or greater, while Python version here is ' + str(sys.version_info.major) + '.' + str(sys.version_info.minor) + '.')
 	sys.exit()
 
-from .freepadapp import FreepadApp
\ No newline at end of file
+from .startup import StartupTiming # starts the startup clock
+
+# FreepadApp is imported when first used, so that importing pad.xxx does not load Qt and mido
+def __getattr__(name):
+	if name == 'FreepadApp':
+		from .freepadapp import FreepadApp
+		return FreepadApp
+	raise AttributeError("module 'pad' has no attribute '" + name + "'")
\ No newline at end of file
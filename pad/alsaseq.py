@@ -0,0 +1,73 @@
+import ctypes, ctypes.util, errno, sys, threading, time
+
+#
+# Listen to the ALSA sequencer announce port (System:Announce, 0:1) in a thread,
+# and call back when a MIDI port appears or disappears. Linux only, needs libasound.
+#
+
+SND_SEQ_OPEN_INPUT = 2
+SND_SEQ_PORT_CAP_WRITE = 1 << 1
+SND_SEQ_PORT_CAP_NO_EXPORT = 1 << 7
+SND_SEQ_PORT_TYPE_APPLICATION = 1 << 20
+SND_SEQ_CLIENT_SYSTEM = 0
+SND_SEQ_PORT_SYSTEM_ANNOUNCE = 1
+SND_SEQ_EVENT_PORT_START = 63
+SND_SEQ_EVENT_PORT_EXIT = 64
+
+# Clients started only to enumerate ports (as rtmidi does) never create ports,
+# so listening to port events does not loop when the callback enumerates ports.
+_PORT_EVENTS = (SND_SEQ_EVENT_PORT_START, SND_SEQ_EVENT_PORT_EXIT)
+
+class AlsaAnnounceListener(threading.Thread):
+	def __init__(self, callback):
+		super().__init__(name = 'Freepad ALSA announce', daemon = True)
+		self.callback = callback
+		self._lib = None
+		self._seq = ctypes.c_void_p()
+
+	# Open the sequencer and subscribe to the announce port. Return False if not available.
+	def open(self):
+		if not sys.platform.startswith('linux'):
+			return False
+		try:
+			try:
+				lib = ctypes.CDLL('libasound.so.2')
+			except OSError:
+				# find_library is slow (it runs ldconfig), only used when the usual name is not found
+				name = ctypes.util.find_library('asound')
+				if name is None:
+					return False
+				lib = ctypes.CDLL(name)
+			lib.snd_seq_open.argtypes = [ctypes.POINTER(ctypes.c_void_p), ctypes.c_char_p, ctypes.c_int, ctypes.c_int]
+			lib.snd_seq_set_client_name.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+			lib.snd_seq_create_simple_port.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_uint, ctypes.c_uint]
+			lib.snd_seq_connect_from.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+			lib.snd_seq_event_input.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p)]
+			if lib.snd_seq_open(ctypes.byref(self._seq), b'default', SND_SEQ_OPEN_INPUT, 0) < 0:
+				return False
+			lib.snd_seq_set_client_name(self._seq, b'Freepad hotplug')
+			# not exported, so it is not listed with the MIDI ports
+			port = lib.snd_seq_create_simple_port(self._seq, b'announce',
+				SND_SEQ_PORT_CAP_WRITE | SND_SEQ_PORT_CAP_NO_EXPORT, SND_SEQ_PORT_TYPE_APPLICATION)
+			if port < 0 or lib.snd_seq_connect_from(self._seq, port, SND_SEQ_CLIENT_SYSTEM, SND_SEQ_PORT_SYSTEM_ANNOUNCE) < 0:
+				return False
+		except Exception:
+			return False
+		self._lib = lib
+		return True
+
+	def run(self):
+		ev = ctypes.c_void_p()
+		while True:
+			r = self._lib.snd_seq_event_input(self._seq, ctypes.byref(ev))
+			if r < 0:
+				if r == -errno.ENOSPC:
+					# input overrun: some events were lost, check the ports anyway
+					self.callback()
+				else:
+					time.sleep(0.25)
+				continue
+			if ev.value is not None:
+				# the event type is the first byte of snd_seq_event_t
+				if ctypes.cast(ev, ctypes.POINTER(ctypes.c_ubyte))[0] in _PORT_EVENTS:
+					self.callback()
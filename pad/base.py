@@ -0,0 +1,21 @@
+#
+# Exception and debug output of Freepad, without Qt: used by the modules that also run
+# without a GUI (profiles, codec, presets, batch converter). Re-exported by pad.ui.common.
+#
+
+class Debug:
+	_debug = False
+	
+	@classmethod
+	def set(cls, tf):
+		cls._debug = tf
+	
+	@classmethod
+	def dbg(cls, msg):
+		if cls._debug:
+			print(msg)
+
+class PadException(Exception):
+	def __init__(self, err):
+		super().__init__(err)
+		Debug.dbg(err)
@@ -0,0 +1,284 @@
+import argparse, json, os, platform, sys, threading, time
+from collections import deque
+
+#
+# MIDI throughput and latency benchmark: "python -m pad.benchmark [-o results.json]".
+# Each device profile is opened in a FreepadWindow, offscreen, connected to an in-process
+# fake MIDI port. Synthetic bursts are injected from a thread, as rtmidi does, and timed
+# until the UI shows them. Results are printed, or written to a file, as JSON.
+#
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from qtpy import QT_VERSION
+from qtpy.QtCore import QEventLoop, QTimer
+from qtpy.QtWidgets import QApplication
+import mido
+
+from pad.path import FREEPAD_PATH
+from pad.ui import FreepadWindow
+from pad.profile import compileProfile
+from pad.midievent import SYSEX
+
+SCENARIOS = ['notes', 'knobs', 'sysex', 'output']
+
+# MIDI port replacing the device ports: injected messages go to the PadIO callback
+# (or are queued for polling), sent messages are only counted and timed.
+class FakePort(object):
+	def __init__(self, name):
+		self.name = name
+		self.callback = None
+		self._pending = deque()
+		self.sent = 0
+		self.lastSend = 0.0
+
+	def inject(self, msg):
+		callback = self.callback
+		if callback is not None:
+			callback(msg)
+		else:
+			self._pending.append(msg)
+
+	def iter_pending(self):
+		while len(self._pending) > 0:
+			yield self._pending.popleft()
+
+	def send(self, msg):
+		self.sent += 1
+		self.lastSend = time.perf_counter()
+
+	def close(self):
+		pass
+
+# Time from the arrival of each message to the UI update showing it.
+# Channel messages are shown at the next frame flush, programs (SysEx) when handled.
+class _LatencyProbe(object):
+	def __init__(self, window):
+		self.received = 0
+		self.latencies = []
+		self._waiting = []
+		io = window.io
+		# the probe must see each message before the window, which may flush at once
+		io.receivedMidi.disconnect(window.receivedMidi)
+		io.receivedMidi.connect(self._arrived)
+		io.receivedMidi.connect(window.receivedMidi)
+		io.receivedMidi.connect(self._handled)
+		window.uiFrame.flushed.connect(self._flushed)
+
+	def _arrived(self, event):
+		self.received += 1
+		if event.status != SYSEX:
+			self._waiting.append(event.time)
+
+	def _handled(self, event):
+		if event.status == SYSEX:
+			self.latencies.append(time.perf_counter() - event.time)
+
+	def _flushed(self):
+		now = time.perf_counter()
+		for arrival in self._waiting:
+			self.latencies.append(now - arrival)
+		self._waiting = []
+
+	def reset(self):
+		self.received = 0
+		self.latencies = []
+		self._waiting = []
+
+def _stats(seconds):
+	if len(seconds) == 0:
+		return None
+	ms = sorted(1000 * s for s in seconds)
+	def pct(p):
+		return round(ms[min(len(ms) - 1, int(p * len(ms)))], 4)
+	return {'count': len(ms), 'min': round(ms[0], 4), 'mean': round(sum(ms) / len(ms), 4),
+		'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99), 'max': round(ms[-1], 4)}
+
+class Bench(object):
+	def __init__(self, app, profile, args):
+		self.app = app
+		self.profile = profile
+		self.args = args
+		self.window = FreepadWindow({'profile': profile, 'defaultKit': {}, 'defaultControls': {}})
+		self.window.show()
+		self.port = FakePort(profile.midiname)
+		self.thru = FakePort('thru')
+		io = self.window.io
+		io.monitor.portsChanged.disconnect(io.listenMidiConnections) # the fake device must stay plugged
+		io.closeDevicePorts()
+		io.setInputMode(args.input_mode)
+		io.in_port = self.port
+		io.out_port = self.port
+		io.mtout_port = self.thru
+		io.isConnected = True
+		io.startListening()
+		self.window.setEnabled(True)
+		self.probe = _LatencyProbe(self.window)
+		self._wait(0.2)
+
+	def close(self):
+		self.window.io.stopListening()
+		self.window.io.in_port = None
+		self.window.io.out_port = None
+		self.window.close()
+		self.window.deleteLater()
+		self._wait(0.05)
+
+	# run the event loop for seconds
+	def _wait(self, seconds):
+		loop = QEventLoop()
+		QTimer.singleShot(int(1000 * seconds), loop.quit)
+		loop.exec()
+
+	# run the event loop until done() is True, timeout seconds at most
+	def _waitFor(self, done, timeout):
+		loop = QEventLoop()
+		deadline = time.perf_counter() + timeout
+		def check():
+			if done() or time.perf_counter() > deadline:
+				loop.quit()
+		timer = QTimer()
+		timer.timeout.connect(check)
+		timer.start(5)
+		loop.exec()
+		timer.stop()
+
+	# Inject messages at rate messages per second from a thread, wait until they are shown
+	def _inject(self, name, messages, rate):
+		window = self.window
+		frame = window.uiFrame
+		self.probe.reset()
+		requested, applied, frames = frame.requested, frame.applied, frame.frames
+		statusRequested, statusShown = frame.statusRequested, frame.statusShown
+		coalesced = frame.coalesced
+		def run():
+			t0 = time.perf_counter()
+			for i, msg in enumerate(messages):
+				due = t0 + i / rate
+				wait = due - time.perf_counter()
+				if wait > 0:
+					time.sleep(wait)
+				self.port.inject(msg)
+		cpu0 = time.process_time()
+		wall0 = time.perf_counter()
+		injector = threading.Thread(target = run, name = 'Freepad benchmark injector')
+		injector.start()
+		self._waitFor(lambda: not injector.is_alive() and self.probe.received >= len(messages) and frame.pending() == 0,
+			self.args.timeout + len(messages) / rate)
+		injector.join()
+		wall = time.perf_counter() - wall0
+		cpu = time.process_time() - cpu0
+		return {'scenario': name, 'messages': len(messages), 'rate': rate,
+			'received': self.probe.received, 'dropped': len(messages) - self.probe.received,
+			'ui_requested': frame.requested - requested, 'ui_applied': frame.applied - applied,
+			'ui_coalesced': frame.coalesced - coalesced, 'frames': frame.frames - frames,
+			'status_requested': frame.statusRequested - statusRequested, 'status_shown': frame.statusShown - statusShown,
+			'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4),
+			'input_to_ui_ms': _stats(self.probe.latencies)}
+
+	def _channel(self, ctl):
+		mc = ctl.cbMC.currentIndex() if hasattr(ctl, 'cbMC') else 16
+		return self.window.mc.currentIndex() if mc == 16 else mc
+
+	def notes(self):
+		pads = self.window._pads
+		if len(pads) == 0:
+			return None
+		messages = []
+		for i in range(self.args.count):
+			pad = pads[(i // 2) % len(pads)]
+			kind = 'note_on' if i % 2 == 0 else 'note_off'
+			messages.append(mido.Message(kind, channel = self._channel(pad), note = pad.spNote.value(), velocity = 1 + i % 127))
+		return self._inject('notes', messages, self.args.rate)
+
+	def knobs(self):
+		knobs = self.window._knobs
+		if len(knobs) == 0:
+			return None
+		messages = []
+		for i in range(self.args.count):
+			knob = knobs[(i // 128) % len(knobs)]
+			messages.append(mido.Message('control_change', channel = self._channel(knob), control = knob.spCC.value(), value = i % 128))
+		return self._inject('knobs', messages, self.args.rate)
+
+	def sysex(self):
+		codec = self.profile.codec
+		if codec is None or not codec.canDecode():
+			return None
+		values = bytes(max(0, v) for v in self.window.program()[1:])
+		# replies echo the request header after the device identity
+		filler = codec.request.bytes if codec.request is not None else bytes(codec.replyPidOffset)
+		header = codec.replyPrefix + filler[len(codec.replyPrefix):codec.replyPidOffset]
+		messages = []
+		for i in range(self.args.sysex_count):
+			data = header + bytes([1 + i % max(1, self.profile.nbPrograms)]) + values
+			messages.append(mido.Message('sysex', data = data))
+		return self._inject('sysex', messages, self.args.sysex_rate)
+
+	# Time from a UI action to the message written to the port
+	def output(self):
+		window = self.window
+		latencies = []
+		cpu0 = time.process_time()
+		for i in range(self.args.count):
+			pad = window._pads[i % len(window._pads)] if len(window._pads) > 0 else None
+			t0 = time.perf_counter()
+			if pad is not None:
+				window._sendNoteOn(16, pad.spNote.value(), 100)
+			else:
+				knob = window._knobs[i % len(window._knobs)]
+				window._sendControlChange(16, knob.spCC.value(), i % 128)
+			latencies.append(self.thru.lastSend - t0)
+		result = {'scenario': 'output', 'messages': self.args.count, 'cpu_s': round(time.process_time() - cpu0, 4),
+			'send_ms': _stats(latencies)}
+		if self.profile.codec is not None and self.profile.codec.canSend():
+			latencies = []
+			for i in range(self.args.sysex_count):
+				t0 = time.perf_counter()
+				window.sendProgram(1, force = True)
+				latencies.append(self.port.lastSend - t0)
+			result['program_send_ms'] = _stats(latencies)
+		self._wait(0.05)
+		return result
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(prog = 'python -m pad.benchmark',
+		description = 'Freepad MIDI throughput and latency benchmark.')
+	parser.add_argument('profiles', nargs = '*', help = 'device files of pads/ to run (lpd8, vp16...), all by default')
+	parser.add_argument('-s', '--scenario', action = 'append', choices = SCENARIOS, help = 'scenarios to run, all by default')
+	parser.add_argument('-n', '--count', type = int, default = 2000, help = 'notes and control changes per scenario')
+	parser.add_argument('-r', '--rate', type = float, default = 2000.0, help = 'notes and control changes per second')
+	parser.add_argument('--sysex-count', type = int, default = 50, help = 'programs per scenario')
+	parser.add_argument('--sysex-rate', type = float, default = 100.0, help = 'programs per second')
+	parser.add_argument('--input-mode', choices = ['callback', 'polling'], default = 'callback')
+	parser.add_argument('--timeout', type = float, default = 5.0, help = 'seconds to wait for the UI after the last message')
+	parser.add_argument('-o', '--output', help = 'JSON file to write, stdout by default')
+	args = parser.parse_args(argv)
+
+	app = QApplication.instance() or QApplication(sys.argv[:1])
+	app.setStyle('fusion')
+	pdir = FREEPAD_PATH.joinpath('pads')
+	names = args.profiles or sorted(p[:-5] for p in os.listdir(pdir) if p.endswith('.json'))
+	results = {'python': platform.python_version(), 'qt': QT_VERSION, 'platform': platform.platform(),
+		'input_mode': args.input_mode, 'profiles': {}}
+	for name in names:
+		profile = compileProfile(pdir.joinpath(name.lower() + '.json'))
+		bench = Bench(app, profile, args)
+		runs = []
+		for scenario in args.scenario or SCENARIOS:
+			result = getattr(bench, scenario)()
+			if result is not None:
+				runs.append(result)
+		bench.close()
+		results['profiles'][profile.midiname] = runs
+
+	text = json.dumps(results, indent = 2)
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(text + '\n')
+	else:
+		print(text)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,141 @@
+from pad.base import PadException
+
+#
+# SysEx program codec, built once per device profile from the "get_program", "send_program"
+# and optional "program_reply" JSON headers: comma separated hexadecimal bytes, and "pid"
+# where the program number goes. Programs are encoded and decoded as bytes, without F0 and F7.
+#
+
+class SysexError(PadException):
+	pass
+
+# Parse a JSON header. Return (header bytes with 0 as pid, pid offset).
+def parseHeader(text, key = 'header'):
+	header = bytearray()
+	pidOffset = None
+	for token in str(text).split(','):
+		token = token.strip()
+		if token == 'pid':
+			if pidOffset is not None:
+				raise SysexError('"pid" is set twice in "' + key + '"')
+			pidOffset = len(header)
+			header.append(0)
+			continue
+		try:
+			value = int(token, 16)
+		except ValueError:
+			raise SysexError('"' + token + '" is not an hexadecimal byte in "' + key + '"') from None
+		if not 0 <= value < 128:
+			raise SysexError('"' + token + '" is not a 7 bits byte in "' + key + '"')
+		header.append(value)
+	if pidOffset is None:
+		raise SysexError('"pid" not found in "' + key + '"')
+	return bytes(header), pidOffset
+
+class _Header(object):
+	__slots__ = ('bytes', 'pidOffset')
+
+	def __init__(self, text, key):
+		self.bytes, self.pidOffset = parseHeader(text, key)
+
+	def build(self, pid):
+		if not 0 <= pid < 128:
+			raise SysexError('program number ' + str(pid) + ' out of range')
+		buf = bytearray(self.bytes)
+		buf[self.pidOffset] = pid
+		return buf
+
+class ProgramCodec(object):
+	__slots__ = ('program', 'size', 'request', 'send', 'replyPrefix', 'replyPidOffset', 'replyLength')
+
+	# program: the flat variable names of a program, "pid" first
+	def __init__(self, raw, program):
+		self.program = program
+		self.size = len(program) # values, pid included
+		self.request = _Header(raw['get_program'], 'get_program') if 'get_program' in raw else None
+		self.send = _Header(raw['send_program'], 'send_program') if 'send_program' in raw else None
+		self.replyPrefix = None
+		if 'program_reply' in raw:
+			reply = _Header(raw['program_reply'], 'program_reply')
+			if reply.pidOffset != len(reply.bytes) - 1:
+				raise SysexError('"pid" must be the last byte of "program_reply"')
+			self.replyPrefix = reply.bytes[:reply.pidOffset]
+			self.replyPidOffset = reply.pidOffset
+		elif self.request is not None:
+			# Replies echo the request header, but the length bytes may differ:
+			# only match the device identity, the bytes shared by both headers.
+			self.replyPidOffset = self.request.pidOffset
+			self.replyPrefix = self.request.bytes[:self.replyPidOffset]
+			if self.send is not None:
+				common = 0
+				for a, b in zip(self.replyPrefix, self.send.bytes):
+					if a != b:
+						break
+					common += 1
+				self.replyPrefix = self.replyPrefix[:common]
+		if self.replyPrefix is not None:
+			self.replyLength = self.replyPidOffset + self.size
+
+	def canRequest(self):
+		return self.request is not None
+
+	def canSend(self):
+		return self.send is not None
+
+	def canDecode(self):
+		return self.replyPrefix is not None
+
+	# SysEx data requesting program pid
+	def encodeRequest(self, pid):
+		if self.request is None:
+			raise SysexError('"get_program" not found in JSON file')
+		return self.request.build(pid)
+
+	# SysEx data writing program values, program[0] (the pid) is replaced by pid
+	def encode(self, pid, program):
+		if self.send is None:
+			raise SysexError('"send_program" not found in JSON file')
+		if len(program) != self.size:
+			raise SysexError('program of ' + str(len(program)) + ' values, ' + str(self.size) + ' expected')
+		buf = self.send.build(pid)
+		try:
+			buf.extend(program[1:])
+		except (ValueError, TypeError):
+			self._checkValues(program)
+			raise
+		if not buf.isascii(): # a byte is above 127
+			self._checkValues(program)
+		return buf
+
+	def _checkValues(self, program):
+		for i in range(1, self.size):
+			value = program[i]
+			if not isinstance(value, int) or not 0 <= value < 128:
+				raise SysexError('value ' + repr(value) + ' of ' + self.program[i] + ' is not a 7 bits byte')
+
+	# True if data looks like a program sent by the device
+	def matches(self, data):
+		if self.replyPrefix is None:
+			return False
+		return bytes(data[:len(self.replyPrefix)]) == self.replyPrefix
+
+	# Program values of a program sent to the device (as in the dumps of the vendor editors),
+	# or of a reply, pid first
+	def decodeDump(self, data):
+		data = bytes(data)
+		send = self.send
+		if send is not None and len(data) == len(send.bytes) + self.size - 1:
+			pid = send.pidOffset
+			if data[:pid] == send.bytes[:pid] and data[pid + 1:len(send.bytes)] == send.bytes[pid + 1:]:
+				return [data[pid]] + list(data[len(send.bytes):])
+		return self.decode(data)
+
+	# Program values of a reply, pid first
+	def decode(self, data):
+		data = bytes(data)
+		if not self.matches(data):
+			raise SysexError('SysEx message is not a program of this device')
+		if len(data) != self.replyLength:
+			raise SysexError('received a program of ' + str(len(data) - self.replyPidOffset) \
+				+ ' values, ' + str(self.size) + ' expected')
+		return list(data[self.replyPidOffset:])
@@ -0,0 +1,148 @@
+import argparse, os, sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pad.path import FREEPAD_PATH
+from pad.base import PadException
+from pad.profile import compileProfile
+from pad.preset import FORMATS, checkPreset, decodeSyx, encodeSyx, presetFormat, readPreset, writePreset
+
+#
+# Batch conversion of presets between JSON, binary and SysEx dumps (.syx):
+# "python -m pad.convert presets/ -t binary -o out/", or "--check" to only validate them.
+# Files are converted by a pool of processes, each one validated against the compiled
+# profile of its device: the file suffix, the model of a binary preset, --model, or the
+# device whose codec reads the programs of a .syx file.
+#
+
+_profiles = None # midiname in lower case -> DeviceProfile, in each process
+
+def loadProfiles(pdir):
+	profiles = {}
+	for name in sorted(os.listdir(pdir)):
+		if name.endswith('.json'):
+			try:
+				profile = compileProfile(os.path.join(pdir, name))
+			except Exception as e:
+				print('Unable to read ' + name + ': ' + str(e), file = sys.stderr)
+				continue
+			profiles[profile.midiname.lower()] = profile
+	return profiles
+
+def _initWorker(pdir):
+	global _profiles
+	_profiles = loadProfiles(pdir)
+
+def _profileOf(src, data, fmt, model):
+	if model is not None:
+		profile = _profiles.get(model.lower())
+		if profile is None:
+			raise PadException('unknown model ' + model)
+		return profile
+	if fmt == 'syx':
+		for profile in _profiles.values():
+			try:
+				decodeSyx(data, profile)
+				return profile
+			except PadException:
+				pass
+		raise PadException('no known device reads this SysEx dump')
+	suffix = Path(src).suffix[1:].lower()
+	if suffix in _profiles:
+		return _profiles[suffix]
+	raise PadException('unknown model, use --model')
+
+# Convert (or only check if base is None) the preset file src to fmt, written to base plus the
+# suffix of fmt. Return (src, output files, problems), problems is empty on success.
+def convertFile(task):
+	src, base, fmt, model, pid = task
+	try:
+		with open(src, 'rb') as f:
+			data = f.read()
+		inFmt = presetFormat(data)
+		profile = _profileOf(src, data, inFmt, model)
+		if inFmt == 'syx':
+			programs = decodeSyx(data, profile, src)
+		else:
+			programs = [(pid, readPreset(src, profile))]
+		problems = []
+		for p, preset in programs:
+			prefix = 'program ' + str(p) + ': ' if len(programs) > 1 else ''
+			problems.extend(prefix + problem for problem in checkPreset(preset, profile))
+		if len(problems) > 0 or base is None:
+			return src, [], problems
+		os.makedirs(os.path.dirname(base) or '.', exist_ok = True)
+		if fmt == 'syx':
+			dst = base + '.syx'
+			data = encodeSyx(programs, profile) # before opening dst: no empty file on errors
+			with open(dst, 'wb') as f:
+				f.write(data)
+			return src, [dst], []
+		outputs = []
+		for p, preset in programs:
+			dst = base + ('-' + str(p) if len(programs) > 1 else '') + '.' + profile.midiname.lower()
+			writePreset(dst, preset, fmt, profile)
+			outputs.append(dst)
+		return src, outputs, []
+	except (OSError, PadException) as e:
+		return src, [], [str(e)]
+
+# (source file, path relative to the output directory) of the presets of sources
+def _sourceFiles(sources, suffixes):
+	for source in sources:
+		if os.path.isdir(source):
+			for dirpath, dirnames, filenames in os.walk(source):
+				dirnames.sort()
+				for name in sorted(filenames):
+					if os.path.splitext(name)[1].lower() in suffixes:
+						path = os.path.join(dirpath, name)
+						yield path, os.path.relpath(path, source)
+		else:
+			yield source, os.path.basename(source)
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(prog = 'python -m pad.convert',
+		description = 'Convert Freepad presets between JSON, binary and SysEx dumps, and validate them.')
+	parser.add_argument('sources', nargs = '+', help = 'preset files or directories, read recursively')
+	parser.add_argument('-t', '--to', choices = FORMATS, default = 'json', help = 'output format (default: json)')
+	parser.add_argument('-o', '--output', help = 'output directory, the tree of the source directories is kept')
+	parser.add_argument('--check', action = 'store_true', help = 'only validate the presets, nothing is written')
+	parser.add_argument('-m', '--model', help = 'device of all the presets, by default from the file suffix or content')
+	parser.add_argument('--pid', type = int, default = 1, help = 'program number of the SysEx dumps written (default: 1)')
+	parser.add_argument('-j', '--jobs', type = int, default = os.cpu_count() or 1, help = 'processes (default: one per CPU)')
+	parser.add_argument('-q', '--quiet', action = 'store_true', help = 'only print the failures')
+	args = parser.parse_args(argv)
+	if not args.check and args.output is None:
+		parser.error('an output directory is required, or --check')
+
+	pdir = str(FREEPAD_PATH.joinpath('pads'))
+	_initWorker(pdir)
+	suffixes = set('.' + name for name in _profiles) | {'.syx'}
+	tasks = []
+	for src, rel in _sourceFiles(args.sources, suffixes):
+		base = None if args.check else os.path.join(args.output, os.path.splitext(rel)[0])
+		tasks.append((src, base, args.to, args.model, args.pid))
+
+	jobs = max(1, min(args.jobs, len(tasks)))
+	failed = 0
+	if jobs == 1:
+		results = map(convertFile, tasks)
+		executor = None
+	else:
+		executor = ProcessPoolExecutor(jobs, initializer = _initWorker, initargs = (pdir,))
+		results = executor.map(convertFile, tasks, chunksize = max(1, len(tasks) // (jobs * 8)))
+	try:
+		for src, outputs, problems in results:
+			if len(problems) > 0:
+				failed += 1
+				print('FAILED ' + src + ': ' + '; '.join(problems))
+			elif not args.quiet:
+				print('ok ' + src + (' -> ' + ', '.join(outputs) if len(outputs) > 0 else ''))
+	finally:
+		if executor is not None:
+			executor.shutdown()
+	print(str(len(tasks)) + ' presets, ' + str(failed) + ' failed', file = sys.stderr)
+	return 1 if failed > 0 else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,14 +1,16 @@
-import json, os, argparse
+import os, argparse
 from pathlib import Path
 
 from qtpy.QtWidgets import QApplication, QMessageBox
-from qtpy.QtCore import QSharedMemory
+from qtpy.QtCore import QEvent, QObject, QSharedMemory, QStandardPaths, QTimer
 
 from pad.path import FREEPAD_PATH, FREEPAD_IS_COMPILED
+from pad.startup import StartupTiming
 from pad.ui.common import Debug, tr
 from pad.freepad_settings import Fsettings
 from pad.ui import FreepadWindow
-from pad.padio import Mid
+from pad.padio import HotplugMonitor, Mid
+from pad.profile import loadProfile
 
 
 
@@ -27,6 +29,7 @@ sys.excepthook = excepthook
 
 class FreepadApp(QApplication):
 	def __init__(self, args):
+		StartupTiming.mark('imports')
 		super().__init__(args)
 		self.setApplicationName('Freepad')
 		self.setApplicationVersion('0.9.10')
@@ -36,59 +39,98 @@ class FreepadApp(QApplication):
 		self.knownPadsNames = []
 		self.connectedPadsNames = {}
 		self.openedPads = {}
+		self.sharedMemories = {} # one per opened model, against a second instance
 		self.defaultKit = {}
 		self.defaultControls = {}
-		self.padname = None
-		# Read known pads
-		pdir = os.path.join(FREEPAD_PATH, "pads")
-		for p in os.listdir(pdir):
-			jsonfile = os.path.join(pdir, p)
-			if not os.path.isfile(jsonfile):
-				continue
-			with open(jsonfile) as f:
-				pad = json.load(f)
-				if 'midiname' in pad:
-					mn = pad['midiname']
-					self.knownPads[mn] = pad
-					self.knownPadsNames.append(mn)
-				else:
-					Debug.dbg('midiname not found in ' + pad)
-			f.close()
+		self.padnames = []
+		self.aboutToQuit.connect(self._stopPads)
+		StartupTiming.mark('QApplication')
+		# The known pads are only all read for the help
+		if '-h' in args or '--help' in args:
+			self._readKnownPads()
 		parser = argparse.ArgumentParser(
 			prog = 'freepad' if FREEPAD_IS_COMPILED else 'python -m pad',
 			description = 'Freepad version ' + self.applicationVersion() +'. Virtual midi controller and editor for real devices.',
 			epilog = '')
-		parser.add_argument('model', nargs = '?', default = 'LPD8', help = ', '.join(['"{}"'.format(n) for n in self.knownPadsNames]))
+		parser.add_argument('model', nargs = '*', default = ['LPD8'], help = 'one or several models, opened in one window each: ' + \
+			', '.join(['"{}"'.format(n) for n in self.knownPadsNames]))
 		parser.add_argument('-d', '--debug', help = tr('debug mode'), action='store_true', default = False)
+		parser.add_argument('--startup-timing', help = tr('print the time to the first window, phase by phase, and quit'), action='store_true', default = False)
 		args = parser.parse_args()
 		Debug.set(args.debug)
-		self.padname = args.model
+		self.padnames = args.model
+		self.startupTiming = args.startup_timing
+		StartupTiming.mark('arguments')
 
 		# Load default kit and default controls
 		self._loadKit(self.defaultKit, Fsettings().get('lastkit', self._get1stDefault('kits')))
 		self._loadKit(self.defaultControls, Fsettings().get('lastcontrols', self._get1stDefault('controls')))
+		StartupTiming.mark('kits')
+
+		in_names = HotplugMonitor.instance().inputNames
+		StartupTiming.mark('MIDI ports')
+
+		# all the windows share the MIDI hub, the ports enumeration and the profiles cache
+		for padname in self.padnames:
+			self._openPad(padname, in_names)
 
-		_openUI = False
-		for in_name in Mid.get_input_names():
-			mn = Mid.shortMidiName(in_name)
-			if mn == self.padname:
-				self.connectedPadsNames[mn] = in_name
-				self.openUI(mn, in_name)
-				_openUI = True
-				break
 		if len(self.openedPads) == 0:
-			virtual_pad = self.padname.upper() if self.padname is not None else 'LPD8'
-			if virtual_pad in self.knownPadsNames:
-				self.openUI(virtual_pad, '')
-				_openUI = True
-			else:
-				Debug.dbg('"' + self.padname + '" is not a known device.')
-				self._quit()
-
-		if not _openUI:
 			Debug.dbg('No pads found.')
 			self._quit()
 
+	# Open the connected device called padname, or a virtual one
+	def _openPad(self, padname, in_names):
+		for in_name in in_names:
+			mn = Mid.shortMidiName(in_name)
+			if mn == padname and self._findPad(mn) is not None:
+				if mn not in self.openedPads:
+					self.connectedPadsNames[mn] = in_name
+					self.openUI(mn, in_name)
+				return
+		virtual_pad = padname.upper()
+		if self._findPad(virtual_pad) is None:
+			Debug.dbg('"' + padname + '" is not a known device.')
+		elif virtual_pad not in self.openedPads:
+			self.openUI(virtual_pad, '')
+
+	# Return the DeviceProfile of the pad called midiname, or None.
+	# Tries pads/<midiname>.json first, so that other pads are not read at startup.
+	def _findPad(self, midiname):
+		if midiname in self.knownPads:
+			return self.knownPads[midiname]
+		jsonfile = FREEPAD_PATH.joinpath('pads').joinpath(midiname.lower().replace(' ', '') + '.json')
+		if jsonfile.is_file():
+			pad = self._readPad(jsonfile)
+			if pad is not None and pad.midiname == midiname:
+				return pad
+		self._readKnownPads()
+		return self.knownPads.get(midiname)
+
+	def _readKnownPads(self):
+		pdir = FREEPAD_PATH.joinpath('pads')
+		for p in sorted(os.listdir(pdir)):
+			jsonfile = pdir.joinpath(p)
+			if jsonfile.is_file():
+				self._readPad(jsonfile)
+
+	def _readPad(self, jsonfile):
+		try:
+			pad = loadProfile(jsonfile, self._profilesCacheDir())
+		except Exception as e:
+			Debug.dbg('Unable to read ' + str(jsonfile) + ': ' + str(e))
+			return None
+		mn = pad.midiname
+		if mn not in self.knownPads:
+			self.knownPads[mn] = pad
+			self.knownPadsNames.append(mn)
+		return pad
+
+	def _profilesCacheDir(self):
+		cache = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+		if cache == '':
+			return None
+		return os.path.join(cache, 'profiles')
+
 	def _get1stDefault(self, d):
 		path = FREEPAD_PATH.joinpath('midi').joinpath(d)
 		if not path.is_dir():
@@ -114,36 +156,70 @@ class FreepadApp(QApplication):
 					var[int(num)] = name
 
 	def openUI(self, mn, in_name):
-		self.sharedM = QSharedMemory('Freepad/' + mn)
-		self.sharedM.attach()
-		self.sharedM.unlock()
-		self.sharedM.detach()
-		if not self.sharedM.create(1):
+		sharedM = QSharedMemory('Freepad/' + mn)
+		sharedM.attach()
+		sharedM.unlock()
+		sharedM.detach()
+		if not sharedM.create(1):
 			msg = mn + ' already started'
 			mb = QMessageBox(QMessageBox.Warning, 'Freepad', msg)
 			mb.exec()
-			self._quit()
 		else:
-			params = {'device': self.knownPads[mn],
+			self.sharedMemories[mn] = sharedM
+			StartupTiming.mark('device profile')
+			params = {'profile': self._findPad(mn),
 				'in_name': in_name,
 				'defaultKit': self.defaultKit,
 				'defaultControls': self.defaultControls
 			}
-			setattr(self, mn, FreepadWindow(params))
-			self.openedPads[mn] = getattr(self, mn)
+			self.openedPads[mn] = FreepadWindow(params)
+			StartupTiming.mark('window')
 			self.openedPads[mn].setObjectName("Pads" + mn)
-			self.openedPads[mn].destroyed.connect(self.cleanExit)
+			self.openedPads[mn].destroyed.connect(lambda obj = None, mn = mn: self.cleanExit(mn))
+			if len(self.openedPads) == 1:
+				self._firstFrame = _FirstFrameWatcher(self.firstFrame)
+				self.openedPads[mn].installEventFilter(self._firstFrame)
 			self.openedPads[mn].show()
-
-	def cleanExit(self):
-		self.sharedM.attach()
-		self.sharedM.unlock()
-		self.sharedM.detach()
+			StartupTiming.mark('show')
+
+	# The first window has been painted
+	def firstFrame(self):
+		StartupTiming.mark('first frame')
+		if self.startupTiming:
+			print(StartupTiming.report())
+			QTimer.singleShot(0, self.closeAllWindows)
+
+	# The windows still open get no close event when the application quits
+	def _stopPads(self):
+		for window in list(self.openedPads.values()):
+			window.stopMidi()
+
+	def cleanExit(self, mn):
+		self.openedPads.pop(mn, None)
+		sharedM = self.sharedMemories.pop(mn, None)
+		if sharedM is not None:
+			sharedM.attach()
+			sharedM.unlock()
+			sharedM.detach()
 
 	def _quit(self):
 		self.quit()
 		self.exit()
 		sys.exit()
 
+# Call back once, after the first paint of the watched widget
+class _FirstFrameWatcher(QObject):
+	def __init__(self, callback):
+		super().__init__()
+		self.callback = callback
+
+	def eventFilter(self, obj, event):
+		if event.type() == QEvent.Type.Paint and self.callback is not None:
+			obj.removeEventFilter(self)
+			callback = self.callback
+			self.callback = None
+			QTimer.singleShot(0, callback)
+		return False
+
 
 
@@ -0,0 +1,171 @@
+import os, sqlite3
+from pathlib import Path
+
+from qtpy.QtCore import QStandardPaths
+
+from pad.preset import readPreset
+from pad.base import Debug, PadException
+
+#
+# Preset library: the presets of the bundled and user directories, indexed in a SQLite
+# catalog (in the cache directory, it can be deleted at any time).
+# For each preset file: the device model (the file suffix), the names of its controls,
+# their notes and control changes, and the file mtime and size. A scan only reads the
+# files whose mtime or size changed; searches never read preset files.
+# Paths and roots are stored with symbolic links resolved (os.path.realpath), so that a
+# preset reached through a link is listed once.
+#
+
+LIBRARY_VERSION = 1 # change it when the tables change, the catalog is built again
+
+_NOTE_NAMES = [
+	['c', 'c#', 'd', 'd#', 'e', 'f', 'f#', 'g', 'g#', 'a', 'a#', 'b'],
+	['do', 'do#', 'ré', 'ré#', 'mi', 'fa', 'fa#', 'sol', 'sol#', 'la', 'la#', 'si']
+]
+
+# Note number of "36", "C2", "c#1", "Ré3"... (octave -1 to 9, as shown by the pads), or None
+def parseNote(text):
+	text = text.strip().lower()
+	if text.isdigit():
+		return int(text) if int(text) < 128 else None
+	name = text.rstrip('-0123456789')
+	octave = text[len(name):]
+	if octave == '' or not octave.lstrip('-').isdigit():
+		return None
+	for names in _NOTE_NAMES:
+		if name in names:
+			note = 12 * (int(octave) + 1) + names.index(name)
+			return note if 0 <= note < 128 else None
+	return None
+
+class PresetLibrary(object):
+	_instance = None
+
+	# The library of the application, None if there is no cache directory
+	@classmethod
+	def instance(cls):
+		if cls._instance is None:
+			cache = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+			if cache == '':
+				return None
+			os.makedirs(cache, exist_ok = True)
+			cls._instance = PresetLibrary(os.path.join(cache, 'presets.sqlite'))
+		return cls._instance
+
+	def __init__(self, dbfile):
+		self.dbfile = dbfile
+		self.db = sqlite3.connect(dbfile, timeout = 5) # the catalog may be shared by several processes
+		if self.db.execute('PRAGMA user_version').fetchone()[0] != LIBRARY_VERSION:
+			with self.db:
+				self.db.execute('DROP TABLE IF EXISTS presets')
+				self.db.execute('DROP TABLE IF EXISTS controls')
+				self.db.execute('CREATE TABLE presets (path TEXT PRIMARY KEY, root TEXT, model TEXT, name TEXT, '
+					'folded TEXT, mtime INTEGER, size INTEGER)')
+				self.db.execute('CREATE TABLE controls (path TEXT, ctlid TEXT, name TEXT, folded TEXT, note INTEGER, cc INTEGER)')
+				self.db.execute('CREATE INDEX presets_model ON presets (model, root)')
+				self.db.execute('CREATE INDEX controls_path ON controls (path)')
+				self.db.execute('PRAGMA user_version = ' + str(LIBRARY_VERSION))
+
+	def close(self):
+		self.db.close()
+
+	# Index the preset files of profile under the directories roots, and the files added
+	# alone. Return the number of files read.
+	def scan(self, profile, roots):
+		model = profile.midiname.lower()
+		suffix = '.' + model
+		roots = [os.path.realpath(root) for root in roots]
+		read = 0
+		with self.db:
+			for root in roots:
+				known = {path: (mtime, size) for path, mtime, size in
+					self.db.execute('SELECT path, mtime, size FROM presets WHERE model = ? AND root = ?', (model, root))}
+				for dirpath, dirnames, filenames in os.walk(root):
+					dirnames.sort()
+					for filename in filenames:
+						if not filename.lower().endswith(suffix):
+							continue
+						path = os.path.realpath(os.path.join(dirpath, filename))
+						try:
+							st = os.stat(path)
+						except OSError:
+							continue
+						if known.pop(path, None) != (st.st_mtime_ns, st.st_size):
+							self._index(profile, path, root, st)
+							read += 1
+				for path in known: # removed
+					self._remove(path)
+			# files added alone, and directories no longer in roots
+			for path, root, mtime, size in self.db.execute('SELECT path, root, mtime, size FROM presets WHERE model = ?',
+					(model,)).fetchall():
+				if root != '' and root in roots:
+					continue
+				try:
+					st = os.stat(path)
+				except OSError:
+					st = None
+				if st is None or root != '':
+					self._remove(path)
+				elif (st.st_mtime_ns, st.st_size) != (mtime, size):
+					self._index(profile, path, root, st)
+					read += 1
+		return read
+
+	# Index one file, saved or loaded out of the library directories
+	def addFile(self, profile, path):
+		path = os.path.realpath(path)
+		with self.db:
+			row = self.db.execute('SELECT root FROM presets WHERE path = ?', (path,)).fetchone()
+			self._index(profile, path, '' if row is None else row[0], os.stat(path))
+
+	def _remove(self, path):
+		self.db.execute('DELETE FROM presets WHERE path = ?', (path,))
+		self.db.execute('DELETE FROM controls WHERE path = ?', (path,))
+
+	def _index(self, profile, path, root, st):
+		self._remove(path)
+		name = Path(path).stem
+		self.db.execute('INSERT INTO presets VALUES (?, ?, ?, ?, ?, ?, ?)',
+			(path, root, profile.midiname.lower(), name, name.casefold(), st.st_mtime_ns, st.st_size))
+		try:
+			preset = readPreset(path)
+		except (OSError, ValueError, PadException) as e:
+			Debug.dbg('Unable to index "' + path + '": ' + str(e))
+			return # still listed by its file name
+		names = {ctl[0]: ctl[1] for ctl in preset.controls if len(ctl) > 1 and isinstance(ctl[1], str)}
+		rows = []
+		for spec in profile.controls:
+			rows.append((path, spec.ctlid, names.get(spec.ctlid, ''), names.get(spec.ctlid, '').casefold(),
+				self._value(profile, preset.program, spec.ctlid + '_note'), self._value(profile, preset.program, spec.ctlid + '_cc')))
+		self.db.executemany('INSERT INTO controls VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+	# Value of a program variable in a preset program (pid excluded), or None
+	@staticmethod
+	def _value(profile, program, var):
+		offset = profile.offsets.get(var)
+		if offset is None or not 0 < offset <= len(program):
+			return None
+		value = program[offset - 1]
+		return value if isinstance(value, int) else None
+
+	# Presets of model matching text: a part of a file or control name, a note ("36", "C2", "Do 2"),
+	# or a control change ("cc74"). Return [(path, preset name, [matching control names])].
+	def search(self, model, text = '', limit = 500):
+		model = model.lower()
+		text = text.strip()
+		if text == '':
+			return [(path, name, []) for path, name in self.db.execute(
+				'SELECT path, name FROM presets WHERE model = ? ORDER BY folded, path LIMIT ?', (model, limit))]
+		folded = '%' + text.casefold().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+		note = parseNote(text.replace(' ', ''))
+		cc = int(text[2:]) if text[0:2].lower() == 'cc' and text[2:].strip().isdigit() else None
+		results = []
+		for path, name, matched, controls in self.db.execute(
+				'SELECT p.path, p.name, p.folded LIKE :text ESCAPE \'\\\' AS matched, group_concat(c.name, \'\x1f\') '
+				'FROM presets p LEFT JOIN controls c ON c.path = p.path '
+				'AND (c.folded LIKE :text ESCAPE \'\\\' OR c.note = :note OR c.cc = :cc) '
+				'WHERE p.model = :model GROUP BY p.path HAVING matched OR count(c.ctlid) > 0 '
+				'ORDER BY p.folded, p.path LIMIT :limit',
+				{'text': folded, 'note': note, 'cc': cc, 'model': model, 'limit': limit}):
+			results.append((path, name, [n for n in controls.split('\x1f') if n != ''] if controls else []))
+		return results
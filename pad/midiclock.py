@@ -0,0 +1,134 @@
+import threading, time
+
+#
+# MIDI clock (24 ticks per quarter note) and transport messages, handled in the I/O layer:
+# they never reach the Qt thread one by one.
+# ClockTracker follows the clock received from the device in the MIDI input thread, with a
+# smoothed estimate of the tempo; ClockGenerator sends clock to the MIDI output from its own
+# thread. Both measure the tick jitter in a LatencyHistogram of MidiStats.
+#
+
+CLOCK = 0xF8
+START = 0xFA
+CONTINUE = 0xFB
+STOP = 0xFC
+SONGPOS = 0xF2
+
+# mido types of the messages handled here, active sensing is only counted
+CLOCK_TYPES = frozenset(('clock', 'start', 'continue', 'stop', 'songpos', 'active_sensing'))
+
+TICKS_PER_BEAT = 24
+SPIN = 0.002 # seconds spent spinning before an event, instead of sleeping
+
+# Wait until the perf_counter() time deadline: sleep until shortly before, then spin.
+# Return False if stop (a threading.Event) was set.
+def waitUntil(deadline, stop, spin = SPIN):
+	wait = deadline - time.perf_counter() - spin
+	if wait > 0 and stop.wait(wait):
+		return False
+	while time.perf_counter() < deadline:
+		pass
+	return not stop.is_set()
+
+def tickPeriod(bpm):
+	return 60.0 / max(20.0, min(300.0, bpm)) / TICKS_PER_BEAT
+
+class ClockTracker(object):
+	__slots__ = ('jitter', 'interval', 'last', 'ticks', 'running', 'position')
+
+	SMOOTHING = 0.05 # weight of a new tick interval in the estimate
+	GAP = 0.25 # seconds without tick (below 10 bpm): the clock stopped, the estimate starts again
+
+	def __init__(self, jitter):
+		self.jitter = jitter # LatencyHistogram of the deviation of the ticks from the estimate
+		self.interval = 0.0 # smoothed seconds per tick, 0 if unknown
+		self.last = 0.0 # perf_counter() time of the last tick
+		self.ticks = 0 # ticks received
+		self.running = False # between start or continue and stop
+		self.position = 0 # ticks since the start, or from the song position
+
+	# Message bytes b received at perf_counter() time arrival, in the MIDI input thread
+	def received(self, b, arrival):
+		status = b[0]
+		if status == CLOCK:
+			dt = arrival - self.last
+			if dt > self.GAP:
+				self.interval = 0.0
+			elif self.interval == 0.0:
+				self.interval = dt
+			else:
+				self.jitter.add(abs(dt - self.interval))
+				self.interval += self.SMOOTHING * (dt - self.interval)
+			self.last = arrival
+			self.ticks += 1
+			if self.running:
+				self.position += 1
+		elif status == START:
+			self.running = True
+			self.position = 0
+		elif status == CONTINUE:
+			self.running = True
+		elif status == STOP:
+			self.running = False
+		elif status == SONGPOS and len(b) == 3:
+			self.position = (b[1] | b[2] << 7) * TICKS_PER_BEAT // 4 # song position in sixteenth notes
+
+	# Estimated tempo of the received clock, 0 without clock
+	def bpm(self):
+		if self.interval == 0.0 or time.perf_counter() - self.last > self.GAP:
+			return 0.0
+		return 60.0 / (self.interval * TICKS_PER_BEAT)
+
+class ClockGenerator(object):
+	def __init__(self, jitter):
+		self.jitter = jitter # LatencyHistogram of the lateness of the ticks sent
+		self.tempo = 120.0 # beats per minute, read by the thread at each tick
+		self.ticks = 0 # ticks sent
+		self._send = None
+		self._thread = None
+		self._stop = threading.Event()
+
+	def running(self):
+		return self._thread is not None and self._thread.is_alive()
+
+	# Send start then the clock with send(data), a function taking the message bytes
+	def start(self, send):
+		if self.running():
+			return
+		self._send = send
+		self._stop.clear()
+		self._thread = threading.Thread(target = self._run, name = 'Freepad MIDI clock', daemon = True)
+		self._thread.start()
+
+	def stop(self):
+		if self._thread is not None:
+			self._stop.set()
+			self._thread.join()
+			self._thread = None
+			self._send([STOP])
+
+	# Tick times are computed from an anchor, as in the sequencer: errors do not accumulate
+	def _run(self):
+		send = self._send
+		period = tickPeriod(self.tempo)
+		anchor = time.perf_counter() + 0.01
+		n0 = 0
+		n = 0
+		send([START])
+		while True:
+			if period != tickPeriod(self.tempo): # new anchor at the last tick
+				if n > n0:
+					anchor += (n - 1 - n0) * period
+					n0 = n - 1
+				period = tickPeriod(self.tempo)
+			tickTime = anchor + (n - n0) * period
+			if not waitUntil(tickTime, self._stop):
+				break
+			send([CLOCK])
+			late = time.perf_counter() - tickTime
+			self.jitter.add(late)
+			if late > period: # not scheduled for a whole tick: start again from now
+				anchor = tickTime + late
+				n0 = n
+			self.ticks += 1
+			n += 1
@@ -0,0 +1,99 @@
+#
+# Compact MIDI event carried from PadIO to the UI.
+# Status and data bytes are plain ints: no string is built unless the event is displayed.
+#
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+POLYTOUCH = 0xA0
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+AFTERTOUCH = 0xD0
+PITCHWHEEL = 0xE0
+SYSEX = 0xF0
+
+_TYPE_NAMES = {
+	NOTE_OFF: 'note_off',
+	NOTE_ON: 'note_on',
+	POLYTOUCH: 'polytouch',
+	CONTROL_CHANGE: 'control_change',
+	PROGRAM_CHANGE: 'program_change',
+	AFTERTOUCH: 'aftertouch',
+	PITCHWHEEL: 'pitchwheel',
+	SYSEX: 'sysex',
+	0xF1: 'quarter_frame',
+	0xF2: 'songpos',
+	0xF3: 'song_select',
+	0xF6: 'tune_request',
+	0xF8: 'clock',
+	0xFA: 'start',
+	0xFB: 'continue',
+	0xFC: 'stop',
+	0xFE: 'active_sensing',
+	0xFF: 'reset'
+}
+
+# mido name of a message kind (status without channel)
+def typeName(kind):
+	return _TYPE_NAMES.get(kind, 'unknown')
+
+class MidiEvent(object):
+	__slots__ = ('status', 'data1', 'data2', 'data', 'time')
+
+	def __init__(self, status, data1 = 0, data2 = 0, data = (), time = 0.0):
+		self.status = status
+		self.data1 = data1
+		self.data2 = data2
+		self.data = data # sysex payload, without F0 and F7
+		self.time = time # perf_counter() time of arrival
+
+	@staticmethod
+	def fromMessage(msg, time = 0.0):
+		if msg.type == 'sysex':
+			return MidiEvent(SYSEX, data = tuple(msg.data), time = time)
+		b = msg.bytes()
+		return MidiEvent(b[0], b[1] if len(b) > 1 else 0, b[2] if len(b) > 2 else 0, time = time)
+
+	# status without channel for channel messages, status for system messages
+	@property
+	def kind(self):
+		return self.status & 0xF0 if self.status < 0xF0 else self.status
+
+	@property
+	def channel(self):
+		return self.status & 0x0F if self.status < 0xF0 else 0
+
+	@property
+	def type(self):
+		return typeName(self.kind)
+
+	def bytes(self):
+		if self.status == SYSEX:
+			return [SYSEX] + list(self.data) + [0xF7]
+		if self.kind in (PROGRAM_CHANGE, AFTERTOUCH, 0xF1, 0xF3):
+			return [self.status, self.data1]
+		if self.status >= 0xF4:
+			return [self.status]
+		return [self.status, self.data1, self.data2]
+
+	# Same format as mido, without time. Only built for display.
+	def __str__(self):
+		kind = self.kind
+		if kind == NOTE_ON or kind == NOTE_OFF:
+			return self.type + ' channel=' + str(self.channel) + ' note=' + str(self.data1) + ' velocity=' + str(self.data2)
+		elif kind == CONTROL_CHANGE:
+			return 'control_change channel=' + str(self.channel) + ' control=' + str(self.data1) + ' value=' + str(self.data2)
+		elif kind == PROGRAM_CHANGE:
+			return 'program_change channel=' + str(self.channel) + ' program=' + str(self.data1)
+		elif kind == POLYTOUCH:
+			return 'polytouch channel=' + str(self.channel) + ' note=' + str(self.data1) + ' value=' + str(self.data2)
+		elif kind == AFTERTOUCH:
+			return 'aftertouch channel=' + str(self.channel) + ' value=' + str(self.data1)
+		elif kind == PITCHWHEEL:
+			return 'pitchwheel channel=' + str(self.channel) + ' pitch=' + str(self.data1 + 128 * self.data2 - 8192)
+		elif kind == SYSEX:
+			return 'sysex data=(' + ','.join([str(b) for b in self.data]) + ')'
+		return self.type
+
+	def __repr__(self):
+		return 'MidiEvent(' + str(self) + ')'
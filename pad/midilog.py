@@ -0,0 +1,122 @@
+import threading, time
+from array import array
+
+from pad.midievent import MidiEvent, SYSEX
+
+#
+# Log of the MIDI messages received and sent by all the windows, in a ring buffer of fixed
+# capacity: the oldest records are overwritten, memory does not grow whatever the uptime.
+# Records are stored in flat arrays (time, direction, port, source, status and data bytes),
+# MidiEvent objects and strings are only built for the records displayed.
+# Records are numbered by a sequence number (seq), growing forever: the record seq is
+# still in the log while first() <= seq < total. clear() numbers start again from 0, readers
+# keeping sequence numbers compare the clears counter to know it.
+# Records are appended from the Qt thread and from the sequencer thread, under a lock;
+# thru messages forwarded in the MIDI thread are not logged.
+#
+
+IN = 0
+OUT = 1
+
+MAX_SYSEX = 1024 # sysex bytes kept by record
+
+class MidiLog(object):
+	def __init__(self, capacity = 20000):
+		self.capacity = capacity
+		self.total = 0 # records appended since the start, or the last clear()
+		self.clears = 0 # clear() calls
+		self._time = array('d', [0.0]) * capacity
+		self._direction = bytearray(capacity)
+		self._port = array('H', [0]) * capacity
+		self._source = bytearray(capacity)
+		self._status = bytearray(capacity)
+		self._data1 = bytearray(capacity)
+		self._data2 = bytearray(capacity)
+		self._sysex = [None] * capacity
+		self.ports = [] # port names, by port number
+		self._portNumbers = {}
+		self.sources = 0 # number of log sources (PadIO objects)
+		self._lock = threading.Lock()
+		# perf_counter() times to wall clock
+		self._wall0 = time.time()
+		self._perf0 = time.perf_counter()
+
+	def newSource(self):
+		self.sources += 1
+		return self.sources - 1
+
+	def portNumber(self, name):
+		n = self._portNumbers.get(name)
+		if n is None:
+			n = len(self.ports)
+			self.ports.append(name)
+			self._portNumbers[name] = n
+		return n
+
+	def first(self):
+		return max(0, self.total - self.capacity)
+
+	def clear(self):
+		with self._lock:
+			self.total = 0
+			self._sysex = [None] * self.capacity
+			self.clears += 1
+
+	def append(self, direction, portName, status, data1 = 0, data2 = 0, data = None, t = None, source = 0):
+		with self._lock:
+			i = self.total % self.capacity
+			self._time[i] = time.perf_counter() if t is None else t
+			self._direction[i] = direction
+			self._port[i] = self.portNumber(portName)
+			self._source[i] = source
+			self._status[i] = status
+			self._data1[i] = data1
+			self._data2[i] = data2
+			self._sysex[i] = None if data is None else bytes(data[:MAX_SYSEX])
+			self.total += 1
+
+	def appendEvent(self, direction, portName, event, source = 0):
+		self.append(direction, portName, event.status, event.data1, event.data2,
+			event.data if event.status == SYSEX else None, event.time or None, source)
+
+	# Message bytes, as returned by mido Message.bytes()
+	def appendBytes(self, direction, portName, b, source = 0):
+		if b[0] == SYSEX:
+			self.append(direction, portName, SYSEX, data = b[1:-1], source = source)
+		else:
+			self.append(direction, portName, b[0], b[1] if len(b) > 1 else 0, b[2] if len(b) > 2 else 0, source = source)
+
+	def _index(self, seq):
+		if not self.first() <= seq < self.total:
+			raise IndexError('MIDI log record ' + str(seq) + ' overwritten')
+		return seq % self.capacity
+
+	# Fields used by filters, without building anything: (direction, port number, status)
+	def key(self, seq):
+		i = self._index(seq)
+		return self._direction[i], self._port[i], self._status[i]
+
+	def source(self, seq):
+		return self._source[self._index(seq)]
+
+	def direction(self, seq):
+		return self._direction[self._index(seq)]
+
+	def portName(self, seq):
+		return self.ports[self._port[self._index(seq)]]
+
+	# wall clock time of the record
+	def wallTime(self, seq):
+		return self._wall0 + self._time[self._index(seq)] - self._perf0
+
+	def event(self, seq):
+		i = self._index(seq)
+		sysex = self._sysex[i]
+		return MidiEvent(self._status[i], self._data1[i], self._data2[i], tuple(sysex) if sysex is not None else (), self._time[i])
+
+	# Sequence number of the last record of source, looking back depth records at most, or None
+	def latest(self, source, depth = 64):
+		for seq in range(self.total - 1, max(self.first(), self.total - depth) - 1, -1):
+			if self._source[seq % self.capacity] == source:
+				return seq
+		return None
@@ -1,9 +1,18 @@
+import hashlib, time
+
 import mido
 import mido.backends.rtmidi
 
-from qtpy.QtCore import QObject, QTimer, Signal
+from qtpy.QtCore import QCoreApplication, QObject, Qt, QTimer, Signal
 
+from pad.alsaseq import AlsaAnnounceListener
 from pad.freepad_settings import Fsettings
+from pad.midilog import MidiLog, IN, OUT
+from pad.recorder import MidiRecorder
+from pad.midiclock import CLOCK_TYPES, ClockGenerator
+from pad.ratelimit import CcRateLimiter, parseIntervals
+from pad.midievent import MidiEvent, NOTE_ON, NOTE_OFF, CONTROL_CHANGE, PROGRAM_CHANGE, SYSEX
+from pad.stats import MidiStats
 from pad.ui.common import Debug, tr
 
 class Mid(object):
@@ -46,107 +55,409 @@ class Mid(object):
 			Debug.dbg('Unable to open ' + midiname + ': ' + str(e))
 			return None
 
+#
+# One monitor of the MIDI ports for all the PadIO objects.
+# Ports are enumerated once per change: on ALSA announce events where available,
+# otherwise by a single poller for the whole application.
+#
+class HotplugMonitor(QObject):
+	portsChanged = Signal()
+	_announced = Signal() # emitted from the ALSA thread
+	_instance = None
+
+	@classmethod
+	def instance(cls):
+		if cls._instance is None:
+			cls._instance = HotplugMonitor(QCoreApplication.instance())
+		return cls._instance
+
+	def __init__(self, parent = None):
+		super().__init__(parent)
+		self.inputNames = Mid.get_input_names()
+		self.outputNames = Mid.get_output_names()
+		# a device creates several ports at once: enumerate once they are all announced
+		self._rescanTimer = QTimer(self)
+		self._rescanTimer.setSingleShot(True)
+		self._rescanTimer.setInterval(50)
+		self._rescanTimer.timeout.connect(self.rescan)
+		self._announced.connect(self._rescanTimer.start, Qt.ConnectionType.QueuedConnection)
+		self.listener = AlsaAnnounceListener(self._announced.emit)
+		if self.listener.open():
+			self.mode = 'announce'
+			self.listener.start()
+		else:
+			self.mode = 'polling'
+			self._pollTimer = QTimer(self)
+			self._pollTimer.setInterval(250)
+			self._pollTimer.timeout.connect(self.rescan)
+			self._pollTimer.start()
+		Debug.dbg('MIDI hotplug detection: ' + self.mode)
+
+	def rescan(self):
+		inputNames = Mid.get_input_names()
+		outputNames = Mid.get_output_names()
+		if inputNames != self.inputNames or outputNames != self.outputNames:
+			self.inputNames = inputNames
+			self.outputNames = outputNames
+			self.portsChanged.emit()
+
+#
+# One MIDI hub for all the windows of the application: opens each port once, shared
+# by reference counting, and multiplexes the input ports. Messages of the ports in
+# callback mode are fanned out from the rtmidi threads, the ports in polling mode
+# are drained by a single timer whatever the number of devices.
+# The messages received and sent by all the PadIO objects are logged in a single MidiLog.
+#
+class MidiHub(QObject):
+	_instance = None
+
+	@classmethod
+	def instance(cls):
+		if cls._instance is None:
+			cls._instance = MidiHub(QCoreApplication.instance())
+		return cls._instance
+
+	def __init__(self, parent = None):
+		super().__init__(parent)
+		self.monitor = HotplugMonitor.instance()
+		self.log = MidiLog(int(Fsettings.get('midiLogSize', 20000)))
+		self._ports = {} # (direction, port name) -> [port, references]
+		self._listeners = {} # input port -> tuple of callbacks taking a message
+		self._polled = {} # input port -> tuple of callbacks, in polling mode
+		self._pollTimer = QTimer(self)
+		self._pollTimer.setInterval(8)
+		self._pollTimer.timeout.connect(self._poll)
+
+	def _open(self, direction, name, opener):
+		if name is None:
+			return None
+		key = (direction, name)
+		if key in self._ports:
+			self._ports[key][1] += 1
+			return self._ports[key][0]
+		port = opener(name)
+		if port is not None:
+			self._ports[key] = [port, 1]
+		return port
+
+	def openInput(self, name):
+		return self._open('in', name, Mid.open_input)
+
+	def openOutput(self, name):
+		return self._open('out', name, Mid.open_output)
+
+	# Release a port opened by openInput() or openOutput(), closed with its last reference.
+	# Ports not opened by the hub are closed at once.
+	def closePort(self, port):
+		if port is None:
+			return
+		for key, ref in self._ports.items():
+			if ref[0] is port:
+				ref[1] -= 1
+				if ref[1] > 0:
+					return
+				del self._ports[key]
+				break
+		self._listeners.pop(port, None)
+		self._polled.pop(port, None)
+		try:
+			port.close()
+		except Exception as e:
+			Debug.dbg('Unable to close ' + str(getattr(port, 'name', port)) + ': ' + str(e))
+
+	# Call callback(msg) for each message of port: in the rtmidi thread if polling is False
+	# and the port has callbacks, else from the hub timer. Raise if the callback can not be set.
+	def listen(self, port, callback, polling = False):
+		self.unlisten(port, callback)
+		if polling:
+			self._polled[port] = self._polled.get(port, ()) + (callback,)
+			self._pollTimer.start()
+			return
+		callbacks = self._listeners.get(port, ()) + (callback,)
+		if len(callbacks) == 1:
+			port.callback = self._fanOut(port) # may raise
+		self._listeners[port] = callbacks
+
+	def unlisten(self, port, callback):
+		if port is None:
+			return
+		callbacks = tuple(c for c in self._listeners.get(port, ()) if c != callback)
+		if len(callbacks) > 0:
+			self._listeners[port] = callbacks
+		elif self._listeners.pop(port, None) is not None:
+			try:
+				port.callback = None
+			except:
+				pass
+		callbacks = tuple(c for c in self._polled.get(port, ()) if c != callback)
+		if len(callbacks) > 0:
+			self._polled[port] = callbacks
+		else:
+			self._polled.pop(port, None)
+			if len(self._polled) == 0:
+				self._pollTimer.stop()
+
+	# rtmidi callback of port: the callbacks are read again for each message, the tuple
+	# is replaced (never modified) by the Qt thread
+	def _fanOut(self, port):
+		listeners = self._listeners
+		def fanOut(msg):
+			for callback in listeners.get(port, ()):
+				callback(msg)
+		return fanOut
+
+	def _poll(self):
+		for port, callbacks in list(self._polled.items()):
+			for msg in port.iter_pending():
+				if msg is not None:
+					for callback in callbacks:
+						callback(msg)
+
+# Input modes: 'callback' reads messages in the rtmidi thread as soon as they arrive,
+# 'polling' drains the input port from the GUI thread every 8 ms (fallback).
+MIDI_INPUT_MODES = ['callback', 'polling']
+
 class PadIO(QObject):
-	receivedMidi = Signal(str)
+	receivedMidi = Signal(object) # MidiEvent
+	sentMidi = Signal(object) # MidiEvent sent later by the rate limit
+	recordingFinished = Signal(object) # MidiRecorder, emitted from its thread
 	devicePlugged = Signal()
 	deviceUnplugged  = Signal()
+	_midiArrived = Signal(object, float) # emitted from the rtmidi thread, always queued
 
-	def __init__(self, pad, parent = None):
+	def __init__(self, profile, parent = None):
 		super().__init__(parent)
-		self.pad = pad
-		self.program = []
-		if 'program' in pad:
-			program = pad["program"]
-			for i in range(0, len(program)):
-				ctlname = program[i]
-				if ctlname[0] == 'p' and ctlname != 'pid':
-					pad_vars = pad['pad']
-					for v in range(0, len(pad_vars)):
-						self.program.append(ctlname + '_' + pad_vars[v])
-				elif ctlname[0] == 'k':
-					knob_vars = pad['knob']
-					for v in range(0, len(knob_vars)):
-						self.program.append(ctlname + '_' + knob_vars[v])
-				else:
-					self.program.append(ctlname)
+		self.profile = profile
+		self.pad = profile.raw
+		self.program = profile.program # flat variable names
 		self.isConnected = False
 		self.in_port = None
 		self.out_port = None
 		self.mtout_port = None
-		self.in_names = [Mid.get_input_names()] # BEFORE starting mcTimer
+		self.hub = MidiHub.instance()
+		self.monitor = self.hub.monitor
+		self.in_names = []
+		self.inputMode = Fsettings.get('midiInputMode', 'callback')
+		if self.inputMode not in MIDI_INPUT_MODES:
+			self.inputMode = 'callback'
+		self.lastArrival = 0.0 # perf_counter() time of the last received message
+		self.stats = MidiStats()
+		self.log = self.hub.log
+		self.logSource = self.log.newSource()
+		self.thruChain = None
+		self._thru = None # (ThruChain, send function) read by the MIDI input thread
+		self.recorder = None # MidiRecorder while recording
+		self._thruTrack = None
+		self._devicePrograms = {} # (port name, pid) -> digest of the program last sent to or read from the device
+		self.clockOut = ClockGenerator(self.stats.histograms['clock_out'])
+		self.ccLimiter = CcRateLimiter(self._sendLimitedControlChange, lambda: self.stats.suppressedMessage(CONTROL_CHANGE), self)
+		self.setCcRateLimit(Fsettings.get('ccRateLimit', 0), Fsettings.get('ccSmoothing', 0), Fsettings.get('ccRateLimits', ''))
 
-		# midi event
-		self.meTimer = QTimer(self)
-		self.meTimer.setInterval(8)
-		self.meTimer.timeout.connect(self.listenMessages)
+		# midi event, callback mode
+		self._midiArrived.connect(self._dispatchMidi, Qt.ConnectionType.QueuedConnection)
 
 		# midi connection
-		self.mcTimer = QTimer(self)
-		self.mcTimer.setInterval(250)
-		self.mcTimer.timeout.connect(self.listenMidiConnections)
+		self.monitor.portsChanged.connect(self.listenMidiConnections)
 		self.listenMidiConnections()
-		self.mcTimer.start()
 
 		if not self.isConnected:
 			self.openDevicePorts() # Required for virtual pads ONLY (cannot open ports twice)
 
-	def listenMessages(self):
-		if not self.in_port is None:
-			for msg in self.in_port.iter_pending():
-				if msg is not None:
-					self.receivedMidi.emit(str(msg))
+	# Called by the hub timer for each message, in polling mode
+	def _polledMessage(self, msg):
+		arrival = time.perf_counter()
+		if msg.type in CLOCK_TYPES:
+			self.stats.clockMessage(msg.bytes(), arrival)
+			return
+		if self._thru is not None:
+			self._forward(msg, arrival)
+		self._dispatchMidi(msg, arrival)
+
+	# Called by rtmidi in its own thread, as soon as a message arrives.
+	# Nothing but timestamping, clock and thru here: the message is handed to the Qt thread.
+	# Clock messages stop here, 24 per beat would flood the Qt thread.
+	def _midiCallback(self, msg):
+		arrival = time.perf_counter()
+		if msg.type in CLOCK_TYPES:
+			self.stats.clockMessage(msg.bytes(), arrival)
+			return
+		if self._thru is not None:
+			self._forward(msg, arrival)
+		self._midiArrived.emit(msg, arrival)
+
+	def _forward(self, msg, arrival):
+		thru = self._thru
+		if thru is None:
+			return
+		chain, send = thru
+		data = chain.transform(msg)
+		if data is not None:
+			send(data)
+			end = time.perf_counter()
+			self.stats.forwardedMessage(data[0] & 0xF0, arrival, end)
+			recorder = self.recorder
+			if recorder is not None:
+				recorder.push(end, self._thruTrack, data)
+
+	# Forward the device messages to the MIDI output through chain (a ThruChain), or stop if None
+	def setThru(self, chain):
+		self.thruChain = chain
+		self._updateThru()
+
+	def _updateThru(self):
+		if self.thruChain is None or self.mtout_port is None:
+			self._thru = None
+		else:
+			self._thruTrack = ('out', self.mtout_port.name)
+			self._thru = (self.thruChain, self._rawSender(self.mtout_port))
+
+	# Send function of a port taking the message bytes: skips building a mido Message,
+	# with the same lock as mido's rtmidi output send()
+	@staticmethod
+	def _rawSender(port):
+		rt = getattr(port, '_rt', None)
+		lock = getattr(port, '_send_lock', None)
+		if rt is None or lock is None:
+			return lambda data: port.send(mido.Message.from_bytes(data))
+		def send(data):
+			with lock:
+				rt.send_message(data)
+		return send
+
+	# Send function of the clock thread: raw bytes, counted but not logged
+	def _clockSender(self, port):
+		send = self._rawSender(port)
+		stats = self.stats
+		def sendClock(data):
+			start = time.perf_counter()
+			send(data)
+			stats.sentMessage(data[0], start, time.perf_counter())
+		return sendClock
+
+	# Send MIDI clock at tempo bpm to the MIDI output, return False without output
+	def startClock(self, tempo):
+		self.clockOut.tempo = tempo
+		if self.mtout_port is None:
+			return False
+		self.clockOut.start(self._clockSender(self.mtout_port))
+		return True
 
+	def stopClock(self):
+		self.clockOut.stop()
+
+	def _dispatchMidi(self, msg, arrival):
+		self.lastArrival = arrival
+		event = MidiEvent.fromMessage(msg, arrival)
+		self.stats.dispatched(event.kind, arrival)
+		self.log.appendEvent(IN, getattr(self.in_port, 'name', ''), event, self.logSource)
+		if self.recorder is not None:
+			self.recorder.push(arrival, ('in', getattr(self.in_port, 'name', '')), msg)
+		self.receivedMidi.emit(event)
+
+	def _send(self, port, msg, kind):
+		start = time.perf_counter()
+		port.send(msg)
+		self.stats.sentMessage(kind, start, time.perf_counter())
+		b = msg.bytes()
+		self.log.appendBytes(OUT, port.name, b, self.logSource)
+		if self.recorder is not None:
+			self.recorder.push(start, ('out', port.name), b)
+
+	# Record the messages received from the device and sent to filename, a MIDI file
+	def startRecording(self, filename):
+		self.stopRecording()
+		self.recorder = MidiRecorder(filename, self.recordingFinished.emit)
+
+	# The file is written by the recorder thread, wait for it if wait is True
+	def stopRecording(self, wait = False):
+		recorder = self.recorder
+		self.recorder = None
+		if recorder is not None:
+			recorder.stop(wait)
+
+	# Sequence number in the log of the last message received or sent, or None
+	def lastLogged(self):
+		return self.log.latest(self.logSource)
+
+	# Start receiving messages from in_port, with the rtmidi callback if possible
+	def startListening(self):
+		if self.in_port is None:
+			return
+		if self.inputMode == 'callback':
+			try:
+				self.hub.listen(self.in_port, self._midiCallback)
+				return
+			except Exception as e:
+				Debug.dbg('MIDI input callback unavailable, polling instead: ' + str(e))
+		self.hub.listen(self.in_port, self._polledMessage, True)
+
+	def setInputMode(self, mode):
+		if mode not in MIDI_INPUT_MODES or mode == self.inputMode:
+			return
+		self.stopListening()
+		self.inputMode = mode
+		if self.isConnected:
+			self.startListening()
+
+	def stopListening(self):
+		self.hub.unlisten(self.in_port, self._midiCallback)
+		self.hub.unlisten(self.in_port, self._polledMessage)
+
+	# slot called by the hotplug monitor when the MIDI ports changed
 	def listenMidiConnections(self):
-		m_in = Mid.get_input_names()
-		if not m_in == self.in_names:
-			for device in m_in:
-				if Mid.shortMidiName(device) == self.pad['midiname'].upper():
-					self.openDevicePorts()
-					self.in_names = Mid.get_input_names()
-					self.meTimer.start()
-					self.isConnected = True
-					self.devicePlugged.emit()
-					return
-			for device in self.in_names:
-				if Mid.shortMidiName(device) == self.pad['midiname'].upper():
-					self.closeDevicePorts()
-					self.meTimer.stop()
-					self.isConnected = False
-					self.deviceUnplugged.emit()
-		self.in_names = Mid.get_input_names()
+		m_in = self.monitor.inputNames
+		if m_in == self.in_names:
+			return
+		self.in_names = m_in
+		midiname = self.pad['midiname'].upper()
+		present = False
+		for device in m_in:
+			if Mid.shortMidiName(device) == midiname:
+				present = True
+				break
+		if present and not self.isConnected:
+			self.openDevicePorts()
+			self.startListening()
+			self.isConnected = True
+			self.devicePlugged.emit()
+		elif not present and self.isConnected:
+			self.closeDevicePorts()
+			self.deviceUnplugged.emit()
 
 	def openDevicePorts(self):
 		in_midiname = self._find_pad_port("in")
 		out_midiname = self._find_pad_port("out")
-		if in_midiname in Mid.get_input_names():
-			self.in_port = Mid.open_input(in_midiname)
-		if out_midiname in Mid.get_output_names():
-			self.out_port = Mid.open_output(out_midiname)
+		if in_midiname in self.monitor.inputNames:
+			self.in_port = self.hub.openInput(in_midiname)
+		if out_midiname in self.monitor.outputNames:
+			self.out_port = self.hub.openOutput(out_midiname)
 		MIDI_OUTPUT_PORT = Fsettings.get('midiOutputPort', tr('No MIDI output'))
 		try:
-			for name in Mid.get_output_names():
+			for name in self.monitor.outputNames:
 				if MIDI_OUTPUT_PORT in name:
 					self.setMidiOutPort(name)
 		except Exception as e:
 			Debug.dbg('Unable to connect Freepad to "' + MIDI_OUTPUT_PORT + '. ' + str(e))
 
 	def setMidiOutPort(self, port_name):
-		try:
-			self.mtout_port.close()
-		except:
-			pass
-		self.mtout_port = Mid.open_output(port_name)
+		self.ccLimiter.flush()
+		clock = self.clockOut.running()
+		self.stopClock()
+		self.hub.closePort(self.mtout_port)
+		self.mtout_port = self.hub.openOutput(port_name) if port_name in self.monitor.outputNames else None
+		self._updateThru()
+		if clock:
+			self.startClock(self.clockOut.tempo)
 
 	def closeDevicePorts(self):
-		self.meTimer.stop()
-		try:
-			self.in_port.close()
-			self.out_port.close()
-			self.in_port = None
-			self.out_port = None
-		except Exception as e:
-			#Debug.dbg('Error in closeDevicePorts: ' + str(e))
-			pass
+		self.stopListening()
+		if self.out_port is not None:
+			# the RAM program (pid 0) does not survive a disconnection
+			self._devicePrograms.pop((self.out_port.name, 0), None)
+		self.hub.closePort(self.in_port)
+		self.hub.closePort(self.out_port)
+		self.in_port = None
+		self.out_port = None
 		self.isConnected = False
 
 	def _find_pad_port(self, op):
@@ -155,9 +466,9 @@ class PadIO(QObject):
 			return None
 		try:
 			if op == "in":
-				dev_names: list[str] = [dev for dev in Mid.get_input_names()]
+				dev_names: list[str] = self.monitor.inputNames
 			elif op == "out":
-				dev_names: list[str] = [dev for dev in Mid.get_output_names()]
+				dev_names: list[str] = self.monitor.outputNames
 			else:
 				return None
 			for name in dev_names:
@@ -167,31 +478,52 @@ class PadIO(QObject):
 		except Exception as e:
 			Debug.dbg("Error in _find_pad: " + str(e))
 
+	# Release the ports and stop following the hotplug monitor, can be called again
 	def close(self):
+		try:
+			self.monitor.portsChanged.disconnect(self.listenMidiConnections)
+		except (TypeError, RuntimeError):
+			pass # already closed
+		self.ccLimiter.flush()
+		self.stopClock()
+		self.stopRecording(True)
 		self.closeDevicePorts()
+		self.hub.closePort(self.mtout_port)
+		self.mtout_port = None
+		self._updateThru()
 
 	# Request for the program n° nb
 	def getProgram(self, nb):
+		codec = self.profile.codec
+		if self.out_port is None or codec is None or not codec.canRequest():
+			return
 		try:
-			data = self.pad['get_program'].replace('pid', str(nb)).split(",")
-			data = [int(h, 16) for h in data]
+			self._send(self.out_port, mido.Message('sysex', data = codec.encodeRequest(int(nb))), SYSEX)
 		except Exception as e:
-			Debug.dbg('Bad "get_program" value in the JSON file: ' + str(e))
-		if not self.out_port is None:
-			try:
-				self.out_port.send(mido.Message('sysex', data = data))
-			except Exception as e:
-				Debug.dbg('Unable to request program ' + str(nb) + ': ' + str(e))
+			Debug.dbg('Unable to request program ' + str(nb) + ': ' + str(e))
+
+	@staticmethod
+	def _programDigest(program):
+		return hashlib.blake2b(bytes(program[1:]), digest_size = 16).digest()
 
-	def sendProgram(self, pid, program):
+	# The device has program (read from it, or sent by another tool)
+	def rememberProgram(self, pid, program):
+		if self.out_port is not None:
+			self._devicePrograms[(self.out_port.name, int(pid))] = self._programDigest(program)
+
+	# Send program unless the device already has it, or if force is True.
+	# Return the sent MidiEvent, or None. Raise a SysexError if program can not be encoded.
+	def sendProgram(self, pid, program, force = False):
 		if not self.out_port is None:
-			data = self.pad["send_program"].replace('pid', str(pid)).split(",")
-			program = data + program[1:]
-			for i in range(0, len(data)):
-				program[i] = int(data[i], 16)
-			m = mido.Message("sysex", data = program)
-			self.out_port.send(m)
-			return str(m)
+			data = self.profile.codec.encode(pid, program)
+			key = (self.out_port.name, int(pid))
+			digest = self._programDigest(program)
+			if not force and self._devicePrograms.get(key) == digest:
+				self.stats.skippedMessage(SYSEX)
+				return None
+			self._send(self.out_port, mido.Message('sysex', data = data), SYSEX)
+			self._devicePrograms[key] = digest
+			return MidiEvent(SYSEX, data = tuple(data))
 
 	def sendNoteOn(self, channel, note, velocity):
 		if channel in range(0,16) and note in range(0,128):
@@ -201,22 +533,45 @@ class PadIO(QObject):
 		if channel in range(0,16) and note in range(0,128):
 			return self.sendNoteMessage(channel, note, velocity, "off")
 
+	# The sending functions return the sent MidiEvent, or None if nothing was sent
 	def sendNoteMessage(self, channel, note, velocity, msg):
 		if self.mtout_port is not None:
 			m = mido.Message("note_" + msg, channel = channel, note = note, velocity = velocity)
-			self.mtout_port.send(m)
-			return str(m)[0:-7]
+			kind = NOTE_ON if msg == "on" else NOTE_OFF
+			self._send(self.mtout_port, m, kind)
+			return MidiEvent(kind | channel, note, velocity)
 
+	# Rate limited, if configured: nothing is returned, the sent events are emitted by sentMidi
 	def sendControlChange(self, channel, cc, val):
 		if self.mtout_port is not None:
+			if self.ccLimiter.enabled():
+				self.ccLimiter.submit(channel, cc, val)
+				return None
 			m = mido.Message("control_change", channel = channel, control = cc, value = val)
-			self.mtout_port.send(m)
-			return str(m)[0:-7]
+			self._send(self.mtout_port, m, CONTROL_CHANGE)
+			return MidiEvent(CONTROL_CHANGE | channel, cc, val)
+
+	def _sendLimitedControlChange(self, channel, cc, val):
+		if self.mtout_port is not None:
+			self._send(self.mtout_port, mido.Message("control_change", channel = channel, control = cc, value = val), CONTROL_CHANGE)
+			self.sentMidi.emit(MidiEvent(CONTROL_CHANGE | channel, cc, val))
+
+	# The control has been released (end of a knob drag): its latest value is sent now
+	def releaseControlChange(self, channel, cc):
+		self.ccLimiter.release(channel, cc)
+
+	# Minimum interval between two values of a control change, in ms (0: no limit), smoothing time
+	# in ms, and intervals of some controls "cc:interval cc:interval..."
+	def setCcRateLimit(self, interval, smoothing, intervals = ''):
+		try:
+			self.ccLimiter.configure(int(interval), int(smoothing), parseIntervals(str(intervals)))
+		except ValueError as e:
+			Debug.dbg('Bad control change rate limit: ' + str(e))
 
 	def sendProgramChange(self, channel, pc):
 		if self.mtout_port is not None:
 			m = mido.Message("program_change", channel = channel, program = pc)
-			self.mtout_port.send(m)
-			return str(m)[0:-7]
+			self._send(self.mtout_port, m, PROGRAM_CHANGE)
+			return MidiEvent(PROGRAM_CHANGE | channel, pc)
 
 
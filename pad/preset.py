@@ -0,0 +1,254 @@
+import json, struct
+
+from pad.path import FREEPAD_PATH
+from pad.base import PadException
+
+#
+# Preset files, as saved by "Save": a JSON list [program, controls, options].
+# program: the program values, pid excluded.
+# controls: [ctlid, name, key, default velocity] for pads, [ctlid, name, knob value] for knobs.
+# options: optional preset settings, like "thru" (see pad.thru) or "velocity" (see pad.velocity). Not written when empty,
+# so that presets without options are still read by older versions.
+# Presets can also be written in a compact binary format, read whatever their suffix,
+# and imported from or exported to SysEx dumps (.syx) through the codec of the device.
+#
+# Binary format, big endian: MAGIC, version (byte), model (str8), program (u16 count, bytes),
+# controls (u16 count, each: ctlid (str8), name (str16), u8 count of values, each
+# b's' + str16 or b'i' + i32), options (u32 length, JSON).
+#
+
+# Directory of the presets of model shipped with Freepad
+def bundledDir(model):
+	return FREEPAD_PATH.joinpath('pads').joinpath('presets').joinpath(model.lower())
+
+# Bundled presets of model, in a deterministic order
+def bundledPresets(model):
+	path = bundledDir(model)
+	if not path.is_dir():
+		return []
+	suffix = '.' + model.lower()
+	return sorted(p for p in path.iterdir() if p.suffix.lower() == suffix and p.is_file())
+
+FORMATS = ['json', 'binary', 'syx']
+
+MAGIC = b'FPRB'
+BINARY_VERSION = 1
+
+class Preset(object):
+	__slots__ = ('program', 'controls', 'options', 'model')
+
+	def __init__(self, program, controls, options = None, model = ''):
+		self.program = program
+		self.controls = controls
+		self.options = options if options is not None else {}
+		self.model = model # device midiname, only stored by the binary format
+
+# Format of the preset file content data
+def presetFormat(data):
+	if data[:len(MAGIC)] == MAGIC:
+		return 'binary'
+	if data[:1] == b'\xF0':
+		return 'syx'
+	return 'json'
+
+# Read a preset in any format, the first program of a SysEx dump needs the device profile
+def readPreset(filename, profile = None):
+	with open(filename, 'rb') as fp:
+		data = fp.read()
+		fp.close()
+	fmt = presetFormat(data)
+	if fmt == 'binary':
+		return decodeBinary(data, filename)
+	if fmt == 'syx':
+		programs = decodeSyx(data, profile, filename)
+		return programs[0][1]
+	try:
+		lst = json.loads(data.decode('utf-8'))
+	except (UnicodeDecodeError, ValueError):
+		lst = None
+	if not isinstance(lst, list) or len(lst) < 2 or not isinstance(lst[0], list) or not isinstance(lst[1], list):
+		raise PadException('"' + str(filename) + '" is not a Freepad preset')
+	options = lst[2] if len(lst) > 2 else {}
+	if not isinstance(options, dict):
+		raise PadException('Bad options in "' + str(filename) + '"')
+	return Preset(lst[0], lst[1], options)
+
+# Write preset in fmt, one of FORMATS. SysEx dumps need the device profile and a program number.
+def writePreset(filename, preset, fmt = 'json', profile = None, pid = 1):
+	if fmt == 'binary':
+		data = encodeBinary(preset, profile.midiname if profile is not None else preset.model)
+	elif fmt == 'syx':
+		data = encodeSyx([(pid, preset)], profile)
+	else:
+		lst = [preset.program, preset.controls]
+		if len(preset.options) > 0:
+			lst.append(preset.options)
+		data = json.dumps(lst).encode('utf-8')
+	with open(filename, 'wb') as fp:
+		fp.write(data)
+		fp.close()
+
+def _str(text, fmt):
+	b = str(text).encode('utf-8')
+	return struct.pack(fmt, len(b)) + b
+
+def encodeBinary(preset, model = ''):
+	try:
+		program = bytes(preset.program)
+	except (ValueError, TypeError):
+		raise PadException('program values must be bytes in a binary preset') from None
+	try:
+		out = [MAGIC, bytes([BINARY_VERSION]), _str(model, '>B'), struct.pack('>H', len(program)), program,
+			struct.pack('>H', len(preset.controls))]
+		for ctl in preset.controls:
+			out.append(_str(ctl[0], '>B'))
+			out.append(_str(ctl[1] if len(ctl) > 1 else '', '>H'))
+			values = ctl[2:]
+			out.append(struct.pack('>B', len(values)))
+			for value in values:
+				if isinstance(value, int) and not isinstance(value, bool):
+					out.append(b'i' + struct.pack('>i', value))
+				else:
+					out.append(b's' + _str(value, '>H'))
+		options = json.dumps(preset.options).encode('utf-8') if len(preset.options) > 0 else b''
+		out.append(struct.pack('>I', len(options)))
+	except (struct.error, OverflowError) as e:
+		raise PadException('preset not stored by the binary format: ' + str(e)) from None
+	out.append(options)
+	return b''.join(out)
+
+class _Reader(object):
+	__slots__ = ('data', 'pos')
+
+	def __init__(self, data, pos):
+		self.data = data
+		self.pos = pos
+
+	def take(self, n):
+		if self.pos + n > len(self.data):
+			raise PadException('truncated binary preset')
+		b = self.data[self.pos:self.pos + n]
+		self.pos += n
+		return b
+
+	def unpack(self, fmt):
+		return struct.unpack(fmt, self.take(struct.calcsize(fmt)))[0]
+
+	def str(self, fmt):
+		return self.take(self.unpack(fmt)).decode('utf-8')
+
+def decodeBinary(data, filename = ''):
+	r = _Reader(data, len(MAGIC))
+	try:
+		version = r.unpack('>B')
+		if version > BINARY_VERSION:
+			raise PadException('binary preset version ' + str(version) + ' is not supported')
+		model = r.str('>B')
+		program = list(r.take(r.unpack('>H')))
+		controls = []
+		for i in range(r.unpack('>H')):
+			ctl = [r.str('>B'), r.str('>H')]
+			for j in range(r.unpack('>B')):
+				tag = r.take(1)
+				if tag == b'i':
+					ctl.append(r.unpack('>i'))
+				elif tag == b's':
+					ctl.append(r.str('>H'))
+				else:
+					raise PadException('unknown value type ' + repr(tag))
+			controls.append(ctl)
+		options = r.take(r.unpack('>I'))
+		options = json.loads(options.decode('utf-8')) if len(options) > 0 else {}
+	except (UnicodeDecodeError, ValueError, PadException) as e:
+		raise PadException('Bad binary preset "' + str(filename) + '": ' + str(e)) from None
+	if not isinstance(options, dict):
+		raise PadException('Bad options in "' + str(filename) + '"')
+	return Preset(program, controls, options, model)
+
+# SysEx messages of data, without F0 and F7
+def splitSysex(data):
+	messages = []
+	start = None
+	for i, b in enumerate(data):
+		if b == 0xF0:
+			start = i + 1
+		elif b == 0xF7 and start is not None:
+			messages.append(data[start:i])
+			start = None
+	return messages
+
+# [(pid, Preset)] of the programs of a SysEx dump, as sent to or received from the device
+def decodeSyx(data, profile, filename = ''):
+	if profile is None or profile.codec is None:
+		raise PadException('"' + str(filename) + '": a SysEx dump needs a device with programs')
+	programs = []
+	for message in splitSysex(data):
+		try:
+			values = profile.codec.decodeDump(message)
+		except PadException:
+			continue # not a program of this device
+		programs.append((values[0], Preset(values[1:], [])))
+	if len(programs) == 0:
+		raise PadException('"' + str(filename) + '" has no ' + profile.midiname + ' program')
+	return programs
+
+# SysEx dump of [(pid, Preset)], one program change message per preset
+def encodeSyx(programs, profile):
+	if profile is None or profile.codec is None or not profile.codec.canSend():
+		raise PadException('SysEx dumps need a device with "send_program"')
+	out = bytearray()
+	for pid, preset in programs:
+		out.append(0xF0)
+		out.extend(profile.codec.encode(pid, [pid] + list(preset.program)))
+		out.append(0xF7)
+	return bytes(out)
+
+# Problems of preset for profile, as a list of messages, empty if the preset is valid
+def checkPreset(preset, profile):
+	problems = []
+	if preset.model != '' and preset.model.lower() != profile.midiname.lower():
+		problems.append('preset of ' + preset.model + ', not ' + profile.midiname)
+	if not profile.hasProgram():
+		return problems + [profile.midiname + ' has no program']
+	names = profile.program[1:] # pid excluded
+	if len(preset.program) != len(names):
+		problems.append('program of ' + str(len(preset.program)) + ' values, ' + str(len(names)) + ' expected')
+	for name, value in zip(names, preset.program):
+		if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value < 128:
+			problems.append('value ' + repr(value) + ' of ' + name + ' is not a 7 bits byte')
+	types = {spec.ctlid: spec.type for spec in profile.controls}
+	for ctl in preset.controls:
+		if not isinstance(ctl, list) or len(ctl) < 1 or ctl[0] not in types:
+			problems.append('unknown control ' + repr(ctl[0] if isinstance(ctl, list) and len(ctl) > 0 else ctl))
+			continue
+		if len(ctl) > 1 and not isinstance(ctl[1], str):
+			problems.append('name of ' + ctl[0] + ' is not a string')
+		if types[ctl[0]] == 'p':
+			if len(ctl) > 2 and not isinstance(ctl[2], str):
+				problems.append('key of ' + ctl[0] + ' is not a string')
+			if len(ctl) > 3 and (not isinstance(ctl[3], int) or not 0 < ctl[3] < 128):
+				problems.append('default velocity of ' + ctl[0] + ' is not 1 to 127')
+		elif len(ctl) > 2 and (not isinstance(ctl[2], int) or not 0 <= ctl[2] < 128):
+			problems.append('value of ' + ctl[0] + ' is not 0 to 127')
+		problems.extend(_binaryProblems(ctl))
+	return problems
+
+_I32 = 1 << 31
+
+# Problems of control ctl (its ctlid known) that the binary format cannot store
+def _binaryProblems(ctl):
+	problems = []
+	if len(ctl[0].encode('utf-8')) > 0xFF:
+		problems.append('control id ' + repr(ctl[0]) + ' is longer than 255 bytes')
+	if len(ctl) > 1 and isinstance(ctl[1], str) and len(ctl[1].encode('utf-8')) > 0xFFFF:
+		problems.append('name of ' + ctl[0] + ' is longer than 65535 bytes')
+	if len(ctl) - 2 > 0xFF:
+		problems.append(ctl[0] + ' has more than 255 values')
+	for i, value in enumerate(ctl[2:]):
+		if isinstance(value, bool) or not isinstance(value, (int, str)):
+			problems.append('value ' + str(i + 1) + ' of ' + ctl[0] + ' is not an integer or a string')
+		elif isinstance(value, int) and not -_I32 <= value < _I32:
+			problems.append('value ' + str(i + 1) + ' of ' + ctl[0] + ' is not a 32 bits integer')
+		elif isinstance(value, str) and len(value.encode('utf-8')) > 0xFFFF:
+			problems.append('value ' + str(i + 1) + ' of ' + ctl[0] + ' is longer than 65535 bytes')
+	return problems
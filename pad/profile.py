@@ -0,0 +1,170 @@
+import json, os, pickle
+from pathlib import Path
+
+from pad import codec
+from pad.base import Debug, PadException
+
+#
+# Device profiles, compiled from the pads/*.json files.
+# A JSON file is validated once, then its compiled DeviceProfile is cached on disk
+# (keyed by the file mtime and size), so that later launches only unpickle it.
+#
+
+PROFILE_VERSION = 2 # change it when the compiled classes change, to invalidate the caches
+
+PAD_VARS = ['note', 'pc', 'cc', 'bv', 'mc',
+	'off_red1', 'off_red2', 'off_green1', 'off_green2', 'off_blue1', 'off_blue2',
+	'on_red1', 'on_red2', 'on_green1', 'on_green2', 'on_blue1', 'on_blue2']
+KNOB_VARS = ['cc', 'lo', 'hi', 'mc']
+PROGRAMS_CONTROLS = ['btnGetAll', 'btnToRam', 'appButtons']
+BOTTOM_CONTROLS = ['mc', 'alert', 'appButtons']
+
+# How a program value is read and written in the UI
+VAR_PID = 0 # program number, not a control
+VAR_SPIN = 1 # QSpinBox value
+VAR_COMBO = 2 # QComboBox index
+VAR_COLOR = 3 # Pad color byte
+_VAR_KINDS = {'note': VAR_SPIN, 'pc': VAR_SPIN, 'cc': VAR_SPIN, 'lo': VAR_SPIN, 'hi': VAR_SPIN,
+	'bv': VAR_COMBO, 'mc': VAR_COMBO}
+
+class ProfileException(PadException):
+	pass
+
+# One control of the main layout
+class ControlSpec(object):
+	__slots__ = ('ctlid', 'type', 'num', 'row', 'col')
+
+	def __init__(self, ctlid, row, col):
+		self.ctlid = ctlid # 'p1', 'k3'...
+		self.type = ctlid[0] # 'p' or 'k'
+		self.num = ctlid[1:] # '1', '3'...
+		self.row = row
+		self.col = col
+
+# One value of a program
+class VarSpec(object):
+	__slots__ = ('name', 'offset', 'ctlid', 'attr', 'kind')
+
+	def __init__(self, name, offset, ctlid, attr, kind):
+		self.name = name # 'p1_note', 'mc'...
+		self.offset = offset # index in the program
+		self.ctlid = ctlid # 'p1', or '' for pid and the global midi channel
+		self.attr = attr # 'note', 'mc'...
+		self.kind = kind # VAR_PID, VAR_SPIN, VAR_COMBO or VAR_COLOR
+
+class DeviceProfile(object):
+	__slots__ = ('midiname', 'raw', 'controls', 'padVars', 'knobVars', 'nbPrograms',
+		'vars', 'program', 'offsets', 'codec')
+
+	def __init__(self, raw):
+		self.raw = raw # the JSON content
+		self.midiname = raw['midiname']
+		self.padVars = list(raw.get('pad', []))
+		self.knobVars = list(raw.get('knob', []))
+		self.nbPrograms = int(raw.get('nb_programs', 0))
+		self.controls = []
+		for row, line in enumerate(raw['layout']['main']):
+			for col, ctlid in enumerate(line):
+				if ctlid != '':
+					self.controls.append(ControlSpec(ctlid, row, col))
+		self.vars = []
+		for ctlname in raw.get('program', []):
+			if ctlname == 'pid':
+				self._addVar(ctlname, '', ctlname, VAR_PID)
+			elif ctlname == 'mc':
+				self._addVar(ctlname, '', ctlname, VAR_COMBO)
+			else:
+				for v in (self.padVars if ctlname[0] == 'p' else self.knobVars):
+					self._addVar(ctlname + '_' + v, ctlname, v, _VAR_KINDS.get(v, VAR_COLOR))
+		self.program = [var.name for var in self.vars]
+		self.offsets = {var.name: var.offset for var in self.vars}
+		self.codec = codec.ProgramCodec(raw, self.program) if self.hasProgram() else None
+
+	def _addVar(self, name, ctlid, attr, kind):
+		self.vars.append(VarSpec(name, len(self.vars), ctlid, attr, kind))
+
+	def hasProgram(self):
+		return len(self.vars) > 0
+
+	def pads(self):
+		return [c for c in self.controls if c.type == 'p']
+
+	def knobs(self):
+		return [c for c in self.controls if c.type == 'k']
+
+# Raise a ProfileException if the JSON content of a device file is not usable
+def validateProfile(raw, source = ''):
+	def fail(msg):
+		raise ProfileException('Bad device file ' + source + ': ' + msg)
+
+	if not isinstance(raw, dict):
+		fail('not a JSON object')
+	if not isinstance(raw.get('midiname'), str) or raw['midiname'] == '':
+		fail('"midiname" not found')
+	layout = raw.get('layout')
+	if not isinstance(layout, dict) or not isinstance(layout.get('main'), list):
+		fail('"layout.main" not found')
+	ctlids = set()
+	for line in layout['main']:
+		if not isinstance(line, list):
+			fail('"layout.main" must be a list of lists')
+		for ctlid in line:
+			if ctlid == '':
+				continue
+			if not isinstance(ctlid, str) or ctlid[0:1] not in ('p', 'k') or not ctlid[1:].isdigit():
+				fail('unknown control "' + str(ctlid) + '" in "layout.main"')
+			if ctlid in ctlids:
+				fail('"' + ctlid + '" is set twice in "layout.main"')
+			ctlids.add(ctlid)
+	for ctl in layout.get('programs', []):
+		if ctl not in PROGRAMS_CONTROLS and not (ctl[0:3] == 'pid' and ctl[3:].isdigit()):
+			fail('unknown control "' + str(ctl) + '" in "layout.programs"')
+	for ctl in layout.get('bottom', []):
+		if ctl not in BOTTOM_CONTROLS:
+			fail('unknown control "' + str(ctl) + '" in "layout.bottom"')
+	for key, known in (('pad', PAD_VARS), ('knob', KNOB_VARS)):
+		for v in raw.get(key, []):
+			if v not in known:
+				fail('unknown ' + key + ' value "' + str(v) + '"')
+	for ctlname in raw.get('program', []):
+		if ctlname not in ('pid', 'mc') and ctlname not in ctlids:
+			fail('"' + str(ctlname) + '" of "program" not found in "layout.main"')
+	if 'nb_programs' in raw and not isinstance(raw['nb_programs'], int):
+		fail('"nb_programs" must be a number')
+	for key in ('get_program', 'send_program', 'program_reply'):
+		if key in raw:
+			try:
+				codec.parseHeader(raw[key], key)
+			except codec.SysexError as e:
+				fail(str(e))
+
+def compileProfile(jsonfile):
+	with open(jsonfile) as f:
+		raw = json.load(f)
+		f.close()
+	validateProfile(raw, str(jsonfile))
+	return DeviceProfile(raw)
+
+# Load the compiled profile of jsonfile from cacheDir, or compile it and cache it.
+def loadProfile(jsonfile, cacheDir = None):
+	jsonfile = Path(jsonfile)
+	if cacheDir is None:
+		return compileProfile(jsonfile)
+	st = os.stat(jsonfile)
+	key = (PROFILE_VERSION, str(jsonfile.resolve()), st.st_mtime_ns, st.st_size)
+	cachefile = Path(cacheDir).joinpath(jsonfile.stem + '.profile')
+	try:
+		with open(cachefile, 'rb') as f:
+			cachedKey, profile = pickle.load(f)
+			if cachedKey == key:
+				return profile
+	except Exception:
+		pass # no cache, or an outdated one
+	profile = compileProfile(jsonfile)
+	try:
+		os.makedirs(cacheDir, exist_ok = True)
+		with open(cachefile, 'wb') as f:
+			pickle.dump((key, profile), f, pickle.HIGHEST_PROTOCOL)
+	except Exception as e:
+		Debug.dbg('Unable to cache the profile of ' + str(jsonfile) + ': ' + str(e))
+	return profile
@@ -0,0 +1,107 @@
+import time
+
+from qtpy.QtCore import QObject, QTimer, Signal
+
+from pad.codec import SysexError
+from pad.base import Debug
+
+#
+# Read device programs with pipelined "get_program" requests.
+# Up to window requests are in flight, each reply is matched to its request by its pid,
+# requests without reply are sent again after timeout seconds, retries times at most.
+# Late replies (to a request sent again, or after the batch) are still claimed for timeout
+# seconds after the last deadline of their pid: they must not change the current program.
+#
+class ProgramReader(QObject):
+	programRead = Signal(int, object) # pid, program values (pid first)
+	finished = Signal(object, object) # {pid: program values}, [pids without reply]
+
+	def __init__(self, io, codec, timeout = 0.5, retries = 2, window = 8, parent = None):
+		super().__init__(parent)
+		self.io = io
+		self.codec = codec
+		self.timeout = timeout
+		self.retries = retries
+		self.window = window
+		self._queue = [] # pids not requested yet
+		self._inflight = {} # pid -> (deadline, retries left)
+		self._results = {}
+		self._failed = []
+		self._claimed = {} # pid -> perf_counter() time until which its late replies are claimed
+		self.requests = 0 # requests sent, retries included
+		self._timer = QTimer(self)
+		self._timer.setSingleShot(True)
+		self._timer.timeout.connect(self._expire)
+
+	def busy(self):
+		return len(self._queue) > 0 or len(self._inflight) > 0
+
+	def read(self, pids):
+		for pid in pids:
+			pid = int(pid)
+			if pid not in self._inflight and pid not in self._queue:
+				self._queue.append(pid)
+		self._pump()
+
+	def cancel(self):
+		self._timer.stop()
+		self._queue = []
+		self._inflight = {}
+		self._results = {}
+		self._failed = []
+
+	# Called with every SysEx message received. Return True if it answers a request.
+	def handleSysex(self, data):
+		if not self._inflight and self._claimed:
+			now = time.perf_counter()
+			self._claimed = {pid: until for pid, until in self._claimed.items() if until >= now}
+		if not (self._inflight or self._claimed) or not self.codec.matches(data):
+			return False
+		try:
+			program = self.codec.decode(data)
+		except SysexError:
+			return False
+		pid = program[0]
+		if self._inflight.pop(pid, None) is None:
+			if self._claimed.get(pid, 0) < time.perf_counter():
+				return False
+			if pid not in self._failed:
+				Debug.dbg('Late answer for program ' + str(pid) + ' ignored')
+				return True
+			self._failed.remove(pid) # answered after its last retry, the batch is not finished
+		self._results[pid] = program
+		self.programRead.emit(pid, program)
+		self._pump()
+		return True
+
+	def _request(self, pid, retries):
+		deadline = time.perf_counter() + self.timeout
+		self._inflight[pid] = (deadline, retries)
+		self._claimed[pid] = deadline + self.timeout
+		self.requests += 1
+		self.io.getProgram(pid)
+
+	def _pump(self):
+		while len(self._queue) > 0 and len(self._inflight) < self.window:
+			self._request(self._queue.pop(0), self.retries)
+		if len(self._inflight) > 0:
+			wait = min(deadline for deadline, retries in self._inflight.values()) - time.perf_counter()
+			self._timer.start(max(1, int(1000 * wait)))
+		else:
+			self._timer.stop()
+			if len(self._queue) == 0 and (self._results or self._failed):
+				results, failed = self._results, self._failed
+				self._results, self._failed = {}, []
+				self.finished.emit(results, failed)
+
+	def _expire(self):
+		now = time.perf_counter()
+		for pid, (deadline, retries) in list(self._inflight.items()):
+			if deadline <= now:
+				if retries > 0:
+					Debug.dbg('No answer for program ' + str(pid) + ', request sent again')
+					self._request(pid, retries - 1)
+				else:
+					del self._inflight[pid]
+					self._failed.append(pid)
+		self._pump()
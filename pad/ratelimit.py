@@ -0,0 +1,116 @@
+import time
+
+from qtpy.QtCore import QObject, QTimer
+
+#
+# Control change output rate limit: at most one message per interval for each (channel, cc),
+# only the latest value is kept in between and sent when the interval is over.
+# With smoothing, the values sent move towards the latest one by steps at each interval
+# instead of jumping to it, reaching it in about the smoothing time.
+# Intervals and smoothing are in milliseconds, 0 disables them.
+#
+
+class CcRateLimiter(QObject):
+	def __init__(self, send, suppressed, parent = None):
+		super().__init__(parent)
+		self._send = send # send(channel, cc, value)
+		self._suppressed = suppressed # suppressed(): called for each value replaced before being sent
+		self.interval = 0
+		self.smoothing = 0
+		self.intervals = {} # cc -> interval, overriding the default one
+		self._lastSent = {} # (channel, cc) -> (perf_counter() time, value) of the last send
+		self._pending = {} # (channel, cc) -> value to send
+		self._timer = QTimer(self)
+		self._timer.timeout.connect(self._tick)
+
+	def configure(self, interval = 0, smoothing = 0, intervals = None):
+		self.flush()
+		self.interval = max(0, int(interval))
+		self.smoothing = max(0, int(smoothing))
+		self.intervals = dict(intervals) if intervals is not None else {}
+		self._lastSent.clear()
+
+	def enabled(self):
+		return self.interval > 0 or any(i > 0 for i in self.intervals.values())
+
+	def _intervalOf(self, cc):
+		return self.intervals.get(cc, self.interval)
+
+	# Send value now if the interval of (channel, cc) is over, else keep it for later.
+	# Return True if sent now.
+	def submit(self, channel, cc, value):
+		key = (channel, cc)
+		interval = self._intervalOf(cc)
+		if interval <= 0:
+			self._send(channel, cc, value)
+			return True
+		last = self._lastSent.get(key)
+		now = time.perf_counter()
+		if key not in self._pending and (last is None or now - last[0] >= interval / 1000) and \
+				(self.smoothing <= 0 or last is None or last[1] == value):
+			self._lastSent[key] = (now, value)
+			self._send(channel, cc, value)
+			return True
+		if key in self._pending and self._pending[key] != value:
+			self._suppressed()
+		self._pending[key] = value
+		if not self._timer.isActive():
+			self._timer.start(self._shortest())
+		elif interval < self._timer.interval(): # not due later than its interval
+			self._timer.start(max(1, min(self._timer.remainingTime(), interval)))
+		return False
+
+	# Timer interval: the shortest interval of the pending values
+	def _shortest(self):
+		return max(1, min(self._intervalOf(c) for _, c in self._pending))
+
+	# End of a drag: send the latest value of (channel, cc) now, unless smoothing is still going on
+	def release(self, channel, cc):
+		key = (channel, cc)
+		if key in self._pending and self.smoothing <= 0:
+			value = self._pending.pop(key)
+			self._lastSent[key] = (time.perf_counter(), value)
+			self._send(channel, cc, value)
+
+	# Send all the latest values now
+	def flush(self):
+		pending = self._pending
+		self._pending = {}
+		self._timer.stop()
+		for (channel, cc), value in pending.items():
+			self._lastSent[(channel, cc)] = (time.perf_counter(), value)
+			self._send(channel, cc, value)
+
+	def _tick(self):
+		now = time.perf_counter()
+		for key, target in list(self._pending.items()):
+			interval = self._intervalOf(key[1])
+			last = self._lastSent.get(key)
+			if last is not None and now - last[0] < interval / 1000 * 0.9:
+				continue # not due yet, another cc has a shorter interval
+			value = target
+			if self.smoothing > 0 and last is not None and last[1] != target:
+				step = (target - last[1]) * min(1.0, interval / self.smoothing)
+				value = last[1] + (int(step) if abs(step) >= 1 else (1 if step > 0 else -1))
+			if value == target:
+				del self._pending[key]
+			self._lastSent[key] = (now, value)
+			self._send(key[0], key[1], value)
+		if len(self._pending) == 0:
+			self._timer.stop()
+		elif self._timer.interval() != self._shortest():
+			self._timer.setInterval(self._shortest())
+
+# Intervals by cc, "74:50 1:10" <-> {74: 50, 1: 10}. Raise a ValueError if text is not valid.
+def parseIntervals(text):
+	intervals = {}
+	for item in text.replace(',', ' ').split():
+		cc, interval = item.split(':')
+		cc = int(cc)
+		if not 0 <= cc <= 127 or int(interval) < 0:
+			raise ValueError(item)
+		intervals[cc] = int(interval)
+	return intervals
+
+def formatIntervals(intervals):
+	return ' '.join(str(cc) + ':' + str(i) for cc, i in sorted(intervals.items()))
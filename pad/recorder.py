@@ -0,0 +1,127 @@
+import struct, tempfile, threading, time
+from collections import deque
+
+#
+# Recording of the MIDI messages of a PadIO to a Standard MIDI File (format 1): the
+# messages received from the device and the messages sent by Freepad, one track per
+# direction and port. The MIDI path only appends (time, track, message) to a deque,
+# from any thread; a writer thread encodes them and appends them to a temporary file
+# per track, in batches. The .mid file is assembled from the track files at the end.
+# Timestamps are perf_counter() times, 120 bpm and PPQ ticks per quarter note.
+#
+
+PPQ = 9600 # 52 µs per tick
+TEMPO = 500000 # µs per quarter note
+_TICKS_PER_SECOND = PPQ * 1000000 / TEMPO
+
+def varLen(n):
+	out = bytearray([n & 0x7F])
+	n >>= 7
+	while n > 0:
+		out.insert(0, 0x80 | (n & 0x7F))
+		n >>= 7
+	return bytes(out)
+
+def _meta(kind, data):
+	return bytes([0xFF, kind]) + varLen(len(data)) + data
+
+class _Track(object):
+	__slots__ = ('name', 'file', 'tick', 'size')
+
+	def __init__(self, name):
+		self.name = name
+		self.file = tempfile.TemporaryFile()
+		self.tick = 0 # time of the last event written
+		self.size = 0
+		self.write(0, _meta(0x03, name.encode('utf-8', 'replace'))) # track name
+
+	def write(self, tick, data):
+		delta = varLen(max(0, tick - self.tick))
+		self.tick = max(self.tick, tick)
+		self.file.write(delta)
+		self.file.write(data)
+		self.size += len(delta) + len(data)
+
+class MidiRecorder(object):
+	CAPACITY = 65536 # messages waiting for the writer, the next ones are dropped
+	BATCH_INTERVAL = 0.2 # seconds between two writes
+
+	def __init__(self, filename, onFinished = None):
+		self.filename = filename
+		self.onFinished = onFinished # onFinished(recorder), called in the writer thread
+		self.error = None
+		self.recorded = 0
+		self.dropped = 0
+		self._queue = deque()
+		self._tracks = {} # (direction, port name) -> _Track, in order of creation
+		self._stop = threading.Event()
+		self.t0 = time.perf_counter()
+		self._thread = threading.Thread(target = self._run, name = 'Freepad MIDI recorder', daemon = True)
+		self._thread.start()
+
+	# Record msg (a mido Message, or message bytes) at perf_counter() time t on track,
+	# (direction, port name).
+	# Thread safe without lock: deque append and popleft are atomic.
+	def push(self, t, track, msg):
+		if len(self._queue) >= self.CAPACITY:
+			self.dropped += 1
+		else:
+			self._queue.append((t, track, msg))
+
+	def stop(self, wait = True):
+		self._stop.set()
+		if wait:
+			self._thread.join()
+
+	def running(self):
+		return self._thread.is_alive()
+
+	def _run(self):
+		try:
+			while not self._stop.wait(self.BATCH_INTERVAL):
+				self._drain()
+			self._drain()
+			self._assemble()
+		except Exception as e:
+			self.error = e
+		finally:
+			for track in self._tracks.values():
+				track.file.close()
+		if self.onFinished is not None:
+			self.onFinished(self)
+
+	def _drain(self):
+		queue = self._queue
+		tracks = self._tracks
+		t0 = self.t0
+		while len(queue) > 0:
+			t, key, msg = queue.popleft()
+			data = msg if isinstance(msg, (list, tuple, bytes, bytearray)) else msg.bytes()
+			status = data[0]
+			if status == 0xF0:
+				data = bytes([0xF0]) + varLen(len(data) - 1) + bytes(data[1:])
+			elif status > 0xF0:
+				continue # system common and real time messages are not stored in MIDI files
+			else:
+				data = bytes(data)
+			track = tracks.get(key)
+			if track is None:
+				track = tracks[key] = _Track(' '.join(key))
+			track.write(max(0, round((t - t0) * _TICKS_PER_SECOND)), data)
+			self.recorded += 1
+
+	def _assemble(self):
+		end = b'\x00' + _meta(0x2F, b'') # end of track
+		conductor = b'\x00' + _meta(0x51, TEMPO.to_bytes(3, 'big')) + end
+		with open(self.filename, 'wb') as f:
+			f.write(b'MThd' + struct.pack('>IHHH', 6, 1, 1 + len(self._tracks), PPQ))
+			f.write(b'MTrk' + struct.pack('>I', len(conductor)) + conductor)
+			for track in self._tracks.values():
+				f.write(b'MTrk' + struct.pack('>I', track.size + len(end)))
+				track.file.seek(0)
+				while True:
+					chunk = track.file.read(65536)
+					if not chunk:
+						break
+					f.write(chunk)
+				f.write(end)
@@ -0,0 +1,147 @@
+import threading, time
+
+from qtpy.QtCore import QObject, Signal
+
+from pad.midiclock import waitUntil
+
+#
+# Step sequencer: a pattern of velocities, one row per pad, played by a timing thread.
+# Step times are computed from a fixed anchor (not by adding delays), so that errors do not
+# accumulate; the thread sleeps until shortly before each event, then spins to the exact time.
+# Notes are sent from the timing thread, the UI is only told which step was played.
+# Stored in the "sequencer" options of the presets:
+#	"sequencer": {"tempo": 120, "swing": 0.2, "steps": 16, "gate": 0.5, "rows": {"p1": [100, 0, 0, 0, 80, ...]}}
+#
+
+MAX_STEPS = 64
+STEPS_PER_BEAT = 4 # sixteenth notes
+
+# Velocity of each (row, step), 0 for no note, in one flat array
+class Pattern(object):
+	__slots__ = ('rows', 'steps', 'velocities')
+
+	def __init__(self, rows, steps = 16):
+		self.rows = rows
+		self.steps = steps
+		self.velocities = bytearray(rows * MAX_STEPS) # room for MAX_STEPS: the step count changes without copy
+
+	def get(self, row, step):
+		return self.velocities[row * MAX_STEPS + step]
+
+	def set(self, row, step, velocity):
+		self.velocities[row * MAX_STEPS + step] = max(0, min(127, int(velocity)))
+
+	def row(self, row):
+		return self.velocities[row * MAX_STEPS:row * MAX_STEPS + self.steps]
+
+	def setRow(self, row, velocities):
+		for step, velocity in enumerate(velocities[:MAX_STEPS]):
+			self.set(row, step, velocity)
+
+	def clear(self):
+		self.velocities[:] = bytes(len(self.velocities))
+
+class Sequencer(QObject):
+	stepPlayed = Signal(int) # emitted from the timing thread, use queued connections
+	stopped = Signal()
+
+	def __init__(self, io, rows, steps = 16, parent = None):
+		super().__init__(parent)
+		self.io = io
+		self.pattern = Pattern(rows, steps)
+		self.tempo = 120.0 # beats per minute
+		self.swing = 0.0 # delay of the odd steps, in steps (0 to 0.75)
+		self.gate = 0.5 # note length, in steps
+		self.notes = ((0, 0, None),) * rows # (channel, note, velocity table) of each row, replaced by the UI thread
+		self.late = 0.0 # maximum lateness of a step, in seconds
+		self._thread = None
+		self._stop = threading.Event()
+
+	def setNotes(self, notes):
+		self.notes = tuple(notes)
+
+	def playing(self):
+		return self._thread is not None and self._thread.is_alive()
+
+	def start(self):
+		if self.playing():
+			return
+		self._stop.clear()
+		self.late = 0.0
+		self._thread = threading.Thread(target = self._run, name = 'Freepad sequencer', daemon = True)
+		self._thread.start()
+
+	def stop(self):
+		if self._thread is not None:
+			self._stop.set()
+			self._thread.join()
+			self._thread = None
+
+	def _period(self):
+		return 60.0 / max(20.0, min(300.0, self.tempo)) / STEPS_PER_BEAT
+
+	def _run(self):
+		io = self.io
+		period = self._period()
+		anchor = time.perf_counter() + 0.01 # time of step n0
+		n0 = 0
+		n = 0 # next step
+		offs = [] # (time, channel, note) of the notes to switch off, in time order
+		try:
+			while True:
+				if period != self._period(): # tempo changed: new anchor at the last step
+					if n > n0:
+						anchor += (n - 1 - n0) * period
+						n0 = n - 1
+					period = self._period()
+				stepTime = anchor + (n - n0) * period
+				if n % 2 == 1:
+					stepTime += self.swing * period
+				deadline = min(stepTime, offs[0][0]) if len(offs) > 0 else stepTime
+				if not waitUntil(deadline, self._stop):
+					break
+				now = time.perf_counter()
+				while len(offs) > 0 and offs[0][0] <= now:
+					_, channel, note = offs.pop(0)
+					io.sendNoteOff(channel, note, 0)
+				if now < stepTime:
+					continue
+				late = now - stepTime
+				if late > period: # the thread was not scheduled for a whole step: start again from now
+					anchor = now
+					n0 = n
+					stepTime = now
+				elif late > self.late:
+					self.late = late
+				pattern = self.pattern
+				step = n % pattern.steps
+				off = stepTime + self.gate * period
+				played = []
+				for row, (channel, note, table) in enumerate(self.notes):
+					velocity = pattern.get(row, step)
+					if velocity > 0:
+						# still on when gate plus swing is over a step: switch it off first, its pending
+						# note off would cut the note played now
+						if any(c == channel and nt == note for _, c, nt in offs):
+							offs = [o for o in offs if o[1] != channel or o[2] != note]
+							io.sendNoteOff(channel, note, 0)
+						io.sendNoteOn(channel, note, velocity if table is None else table[velocity])
+						played.append((off, channel, note))
+				offs.extend(played)
+				offs.sort()
+				self.stepPlayed.emit(step)
+				n += 1
+		finally:
+			for _, channel, note in offs:
+				io.sendNoteOff(channel, note, 0)
+			self.stopped.emit()
+
+	def toDict(self):
+		return {'tempo': self.tempo, 'swing': self.swing, 'steps': self.pattern.steps, 'gate': self.gate}
+
+	# Settings of the "sequencer" options, the rows are set by the window that knows the pads
+	def fromDict(self, d):
+		self.tempo = float(d.get('tempo', self.tempo))
+		self.swing = max(0.0, min(0.75, float(d.get('swing', self.swing))))
+		self.gate = max(0.05, min(1.0, float(d.get('gate', self.gate))))
+		self.pattern.steps = max(1, min(MAX_STEPS, int(d.get('steps', self.pattern.steps))))
@@ -0,0 +1,24 @@
+import time
+
+#
+# Time to first window, phase by phase. Printed by "python -m pad --startup-timing".
+# The clock starts when the pad package is imported.
+#
+class StartupTiming(object):
+	_t0 = time.perf_counter()
+	_last = _t0
+	_phases = [] # (phase, seconds)
+
+	@classmethod
+	def mark(cls, phase):
+		now = time.perf_counter()
+		cls._phases.append((phase, now - cls._last))
+		cls._last = now
+
+	@classmethod
+	def report(cls):
+		lines = ['Freepad startup timing (ms):']
+		for phase, seconds in cls._phases:
+			lines.append('  {:<24}{:>8.1f}'.format(phase, 1000 * seconds))
+		lines.append('  {:<24}{:>8.1f}'.format('total', 1000 * (cls._last - cls._t0)))
+		return '\n'.join(lines)
@@ -0,0 +1,162 @@
+import csv, io, math, time
+
+from pad.midievent import typeName
+from pad.midiclock import ClockTracker
+
+#
+# MIDI counters and latency histograms, kept by PadIO while Freepad runs.
+# Each message is timed at its arrival (rtmidi thread, or polling), at its dispatch
+# in the Qt thread, when the UI shows it (only if it updates a pad or a knob), and
+# around the output port send() call.
+# MIDI clock messages are counted in the MIDI input thread, and never dispatched.
+#
+
+_BUCKETS_PER_OCTAVE = 8 # about 9 % resolution
+_OCTAVES = 24 # from 1 µs to 16 s
+_NB_BUCKETS = _BUCKETS_PER_OCTAVE * _OCTAVES + 1
+
+STAGES = ['input', 'ui', 'total', 'output', 'thru', 'clock_in', 'clock_out']
+STAGE_NAMES = {
+	'input': 'arrival to dispatch', # rtmidi thread or polling timer to the Qt thread
+	'ui': 'dispatch to UI', # Qt thread to the display frame, messages updating a control only
+	'total': 'arrival to UI',
+	'output': 'output port send', # duration of send()
+	'thru': 'arrival to thru output', # in the MIDI input thread
+	'clock_in': 'received clock jitter', # tick interval to the smoothed interval
+	'clock_out': 'sent clock lateness' # tick time to send, in the clock thread
+}
+
+# Latency histogram with logarithmic buckets: constant memory whatever the number of samples
+class LatencyHistogram(object):
+	__slots__ = ('counts', 'count', 'total', 'max')
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.counts = [0] * _NB_BUCKETS
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, seconds):
+		us = seconds * 1000000.0
+		if us < 1.0:
+			i = 0
+		else:
+			i = min(_NB_BUCKETS - 1, 1 + int(math.log2(us) * _BUCKETS_PER_OCTAVE))
+		self.counts[i] += 1
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+
+	# Upper bound of the bucket holding the percentile p (0..1), in seconds
+	def percentile(self, p):
+		if self.count == 0:
+			return 0.0
+		rank = max(1, math.ceil(p * self.count))
+		seen = 0
+		for i, n in enumerate(self.counts):
+			seen += n
+			if seen >= rank:
+				return min(self.max, 2.0 ** (i / _BUCKETS_PER_OCTAVE) / 1000000.0)
+		return self.max
+
+	def mean(self):
+		return self.total / self.count if self.count > 0 else 0.0
+
+class MidiStats(object):
+	MAX_WAITING = 1024 # messages waiting for the UI, the next ones are not timed
+
+	def __init__(self):
+		self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+		self.clock = ClockTracker(self.histograms['clock_in'])
+		self.reset()
+
+	def reset(self):
+		self.received = {} # message kind -> count
+		self.sent = {}
+		self.forwarded = {} # by the thru mode
+		self.suppressed = {} # replaced by a later value before being sent, by the rate limit
+		self.skipped = {} # not sent, the device already had them (programs)
+		self.clock.ticks = 0
+		for h in self.histograms.values():
+			h.reset()
+		self._waiting = [] # (arrival, dispatch) of the messages not shown yet
+		self._dispatch = None # (arrival, dispatch) of the last message dispatched
+		self.since = time.time()
+
+	# A message received at arrival is dispatched in the Qt thread
+	def dispatched(self, kind, arrival):
+		now = time.perf_counter()
+		self.received[kind] = self.received.get(kind, 0) + 1
+		self.histograms['input'].add(now - arrival)
+		self._dispatch = (arrival, now)
+
+	# The last message dispatched updates a pad or a knob, it is timed until the UI shows it
+	def controlUpdated(self):
+		if self._dispatch is not None and len(self._waiting) < self.MAX_WAITING:
+			self._waiting.append(self._dispatch)
+		self._dispatch = None
+
+	# The UI has been updated, messages dispatched until now are shown
+	def uiShown(self):
+		if len(self._waiting) == 0:
+			return
+		now = time.perf_counter()
+		ui = self.histograms['ui']
+		total = self.histograms['total']
+		for arrival, dispatch in self._waiting:
+			ui.add(now - dispatch)
+			total.add(now - arrival)
+		self._waiting = []
+
+	# Called in the MIDI input thread: a concurrent reset may lose a count, nothing worse
+	def forwardedMessage(self, kind, arrival, end):
+		self.forwarded[kind] = self.forwarded.get(kind, 0) + 1
+		self.histograms['thru'].add(end - arrival)
+
+	# Clock and transport message bytes b, received at arrival, in the MIDI input thread
+	def clockMessage(self, b, arrival):
+		self.received[b[0]] = self.received.get(b[0], 0) + 1
+		self.clock.received(b, arrival)
+
+	def sentMessage(self, kind, start, end):
+		self.sent[kind] = self.sent.get(kind, 0) + 1
+		self.histograms['output'].add(end - start)
+
+	def suppressedMessage(self, kind):
+		self.suppressed[kind] = self.suppressed.get(kind, 0) + 1
+
+	def skippedMessage(self, kind):
+		self.skipped[kind] = self.skipped.get(kind, 0) + 1
+
+	# [section, name, count, mean, p50, p99, max], times in ms
+	def rows(self):
+		rows = []
+		for kind in sorted(self.received):
+			rows.append(['received', typeName(kind), self.received[kind], '', '', '', ''])
+		for kind in sorted(self.sent):
+			rows.append(['sent', typeName(kind), self.sent[kind], '', '', '', ''])
+		for kind in sorted(self.forwarded):
+			rows.append(['thru', typeName(kind), self.forwarded[kind], '', '', '', ''])
+		for kind in sorted(self.suppressed):
+			rows.append(['suppressed', typeName(kind), self.suppressed[kind], '', '', '', ''])
+		for kind in sorted(self.skipped):
+			rows.append(['skipped', typeName(kind), self.skipped[kind], '', '', '', ''])
+		if self.clock.ticks > 0:
+			rows.append(['clock', 'received {:.1f} bpm'.format(self.clock.bpm()) + (' (running)' if self.clock.running else ''),
+				self.clock.ticks, '', '', '', ''])
+		for stage in STAGES:
+			h = self.histograms[stage]
+			rows.append(['latency', STAGE_NAMES[stage], h.count] + \
+				[round(1000 * s, 3) for s in (h.mean(), h.percentile(0.5), h.percentile(0.99), h.max)])
+		return rows
+
+	def toCsv(self):
+		out = io.StringIO()
+		writer = csv.writer(out)
+		writer.writerow(['section', 'name', 'count', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms'])
+		writer.writerows(self.rows())
+		return out.getvalue()
@@ -0,0 +1,139 @@
+from pad.midievent import NOTE_OFF, NOTE_ON, POLYTOUCH, CONTROL_CHANGE
+from pad.base import PadException
+
+#
+# MIDI thru: device messages forwarded to the MIDI output from the MIDI input thread,
+# through a transform chain compiled to lookup tables. Configured by the "thru" options
+# of a preset:
+#	"thru": {
+#		"enabled": true,
+#		"channel": 0,                 # all channels to channel 0 (0..15), or {"9": 0} per channel
+#		"transpose": 12,              # semitones added to the notes
+#		"notes": {"36": 38},          # note remap, after transpose
+#		"velocity": {"scale": 1.2, "offset": 0, "min": 1, "max": 127},
+#		"cc": {"1": 74},              # control number remap
+#		"cc_range": {"7": [0, 100], "*": [0, 127]}  # control values 0..127 mapped to lo..hi
+#	}
+# Channels, notes, controls or velocities mapped to null are not forwarded.
+# The velocity curves of the pads (see pad.velocity) are applied before the "velocity" options.
+#
+
+DROP = 0xFF # table entry of a message not forwarded
+
+class ThruError(PadException):
+	pass
+
+def _identity(size):
+	return list(range(size))
+
+def _number(value, what, lo = 0, hi = 127, drop = False):
+	if value is None and drop:
+		return DROP
+	if not isinstance(value, (int, float)) or not lo <= value <= hi:
+		raise ThruError('thru: ' + what + ' must be a number from ' + str(lo) + ' to ' + str(hi) + ', not ' + repr(value))
+	return int(value)
+
+def _remap(table, mapping, what, size = 128):
+	if not isinstance(mapping, dict):
+		raise ThruError('thru: "' + what + '" must be an object')
+	for key, value in mapping.items():
+		src = _number(int(key) if str(key).isdigit() else key, what, 0, size - 1)
+		table[src] = _number(value, what, 0, size - 1, True)
+
+def _range(lo, hi):
+	return bytes(round(lo + (hi - lo) * v / 127) for v in range(128))
+
+class ThruChain(object):
+	__slots__ = ('channels', 'notes', 'velocities', 'controls', 'values')
+
+	def __init__(self, channels, notes, velocities, controls, values):
+		self.channels = channels # 16 bytes: output channel of each channel
+		self.notes = notes # 128 bytes: output note of each note
+		self.velocities = velocities # 128 tables of 128 bytes: output velocity of each note on velocity, by input note
+		self.controls = controls # 128 bytes: output control number of each control
+		self.values = values # 128 tables of 128 bytes, or None: output value of each control value
+
+	# Compile the "thru" options of a preset, with the velocity curve tables of each input note
+	# (128 tables of 128 bytes, or None). Return None if thru is disabled.
+	@staticmethod
+	def compile(config, curves = None):
+		if not config or not config.get('enabled', False):
+			return None
+		channels = _identity(16)
+		ch = config.get('channel')
+		if isinstance(ch, dict):
+			_remap(channels, ch, 'channel', 16)
+		elif ch is not None:
+			channels = [_number(ch, 'channel', 0, 15)] * 16
+
+		notes = _identity(128)
+		transpose = config.get('transpose', 0)
+		if not isinstance(transpose, int):
+			raise ThruError('thru: "transpose" must be an integer')
+		notes = [n + transpose if 0 <= n + transpose < 128 else DROP for n in notes]
+		if 'notes' in config:
+			remapped = _identity(128)
+			_remap(remapped, config['notes'], 'notes')
+			notes = [DROP if n == DROP else remapped[n] for n in notes]
+
+		velocity = config.get('velocity', {})
+		if not isinstance(velocity, dict):
+			raise ThruError('thru: "velocity" must be an object')
+		scale = velocity.get('scale', 1.0)
+		offset = velocity.get('offset', 0)
+		vmin = _number(velocity.get('min', 1), 'velocity min', 1, 127)
+		vmax = _number(velocity.get('max', 127), 'velocity max', 1, 127)
+		if not isinstance(scale, (int, float)) or not isinstance(offset, (int, float)) or vmin > vmax:
+			raise ThruError('thru: bad "velocity" options')
+		velocities = bytes([0] + [min(vmax, max(vmin, round(v * scale + offset))) for v in range(1, 128)])
+		composed = {} # curve table -> composed table, pads often share their curve
+		if curves is None:
+			curves = [None] * 128
+		velocities = [velocities if c is None else composed.setdefault(c, bytes(velocities[v] for v in c)) for c in curves]
+
+		controls = _identity(128)
+		if 'cc' in config:
+			_remap(controls, config['cc'], 'cc')
+
+		values = [None] * 128
+		ranges = config.get('cc_range', {})
+		if not isinstance(ranges, dict):
+			raise ThruError('thru: "cc_range" must be an object')
+		for key, lohi in ranges.items():
+			if not isinstance(lohi, list) or len(lohi) != 2:
+				raise ThruError('thru: "cc_range" values must be [lo, hi]')
+			table = _range(_number(lohi[0], 'cc_range'), _number(lohi[1], 'cc_range'))
+			if key == '*':
+				values = [table if v is None else v for v in values]
+			else:
+				values[_number(int(key) if str(key).isdigit() else key, 'cc_range')] = table # wins over "*"
+		return ThruChain(bytes(channels), bytes(notes), velocities, bytes(controls), values)
+
+	# Bytes of the message to forward for a mido message, or None. Called in the MIDI input thread.
+	def transform(self, msg):
+		t = msg.type
+		if t == 'note_on' or t == 'note_off' or t == 'polytouch':
+			ch = self.channels[msg.channel]
+			note = self.notes[msg.note]
+			if ch == DROP or note == DROP:
+				return None
+			if t == 'note_on':
+				return [NOTE_ON | ch, note, self.velocities[msg.note][msg.velocity]]
+			if t == 'note_off':
+				return [NOTE_OFF | ch, note, msg.velocity]
+			return [POLYTOUCH | ch, note, msg.value]
+		if t == 'control_change':
+			ch = self.channels[msg.channel]
+			control = self.controls[msg.control]
+			if ch == DROP or control == DROP:
+				return None
+			table = self.values[msg.control]
+			return [CONTROL_CHANGE | ch, control, msg.value if table is None else table[msg.value]]
+		if t == 'program_change' or t == 'aftertouch' or t == 'pitchwheel':
+			ch = self.channels[msg.channel]
+			if ch == DROP:
+				return None
+			b = msg.bytes()
+			b[0] = (b[0] & 0xF0) | ch
+			return b
+		return None # system messages are not forwarded
@@ -0,0 +1,99 @@
+import time
+
+from qtpy.QtCore import QObject, QTimer, Signal
+from qtpy.QtGui import QGuiApplication
+
+#
+# UI updates requested by incoming MIDI messages, applied at most once per display frame.
+# Only the latest value of each knob, the final state of each pad and the last status are applied.
+# The first update after an idle frame is applied at once, so single hits are not delayed.
+# Pad and knob updates are counted apart from the status bar updates.
+#
+class UiCoalescer(QObject):
+	flushed = Signal() # after the updates of a frame have been applied
+
+	def __init__(self, showStatus, parent = None):
+		super().__init__(parent)
+		self._showStatus = showStatus # callback(), showing the last logged message
+		self._knobs = {} # knob -> value
+		self._pads = {} # pad -> velocity, or None to switch the light off
+		self._status = False # status to show
+		self._lastFlush = 0.0
+		self.requested = 0 # pad and knob updates requested
+		self.applied = 0 # pad and knob updates applied
+		self.statusRequested = 0
+		self.statusShown = 0
+		self.frames = 0 # flushes
+		refreshRate = 60.0
+		screen = QGuiApplication.primaryScreen()
+		if screen is not None and screen.refreshRate() > 0:
+			refreshRate = screen.refreshRate()
+		self.frameTime = 1.0 / refreshRate
+		self._timer = QTimer(self)
+		self._timer.setSingleShot(True)
+		self._timer.setInterval(max(1, int(1000 * self.frameTime)))
+		self._timer.timeout.connect(self.flush)
+
+	# Pad and knob updates requested but never applied because a newer one replaced them
+	@property
+	def coalesced(self):
+		return self.requested - self.applied - self.pending()
+
+	# Pad and knob updates waiting for the next frame
+	def pending(self):
+		return len(self._knobs) + len(self._pads)
+
+	def setKnob(self, knob, value):
+		self._knobs[knob] = value
+		self._request()
+
+	def lightOn(self, pad, velocity):
+		self._pads[pad] = velocity
+		self._request()
+
+	def lightOff(self, pad):
+		self._pads[pad] = None
+		self._request()
+
+	def setStatus(self):
+		self._status = True
+		self.statusRequested += 1
+		self._schedule()
+
+	def _request(self):
+		self.requested += 1
+		self._schedule()
+
+	def _schedule(self):
+		if self._timer.isActive():
+			return
+		wait = self._lastFlush + self.frameTime - time.perf_counter()
+		if wait <= 0:
+			self.flush()
+		else:
+			self._timer.start(max(1, int(1000 * wait)))
+
+	def flush(self):
+		self._timer.stop()
+		self._lastFlush = time.perf_counter()
+		self.frames += 1
+		if len(self._knobs) > 0:
+			knobs = self._knobs
+			self._knobs = {}
+			for knob, value in knobs.items():
+				knob.setValue(value)
+			self.applied += len(knobs)
+		if len(self._pads) > 0:
+			pads = self._pads
+			self._pads = {}
+			for pad, velocity in pads.items():
+				if velocity is None:
+					pad.lightOff()
+				else:
+					pad.lightOn(velocity)
+			self.applied += len(pads)
+		if self._status:
+			self._status = False
+			self._showStatus()
+			self.statusShown += 1
+		self.flushed.emit()
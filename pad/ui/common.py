@@ -1,7 +1,11 @@
-from qtpy.QtCore import QCoreApplication, QMetaObject, Signal
+from qtpy.QtCore import QCoreApplication, Signal
 from qtpy.QtWidgets import QHBoxLayout, QLabel, QSpinBox, QWidget
 
 from pad.path import imgUrl
+from pad.base import Debug, PadException
+
+__all__ = ['Creator', 'Debug', 'PadException', 'Spinput', 'tr', 'FREEPAD_TITLE_COLOR', 'FREEPAD_NOTE_COLOR',
+	'FREEPAD_BORD_COLOR', 'FREEPAD_LGRADIENT', 'FREEPAD_RGRADIENT', 'FREEPAD_RGRADIENT_OVER', 'FREEPAD_TOOLTIPS']
 
 FREEPAD_TITLE_COLOR = '#dfdddd'
 FREEPAD_NOTE_COLOR = '#cfffff'
@@ -11,11 +15,6 @@ FREEPAD_RGRADIENT = 'qradialgradient(spread:pad, cx:0.5, cy:0.5, radius:0.7, fx:
 FREEPAD_RGRADIENT_OVER = 'qradialgradient(spread:pad, cx:0.5, cy:0.5, radius:0.7, fx:0.5, fy:0.5, stop:0 #280808, stop:1 #171719)'
 FREEPAD_TOOLTIPS = False # tooltips needs improvements !
 
-class PadException(Exception):
-	def __init__(self, err):
-		super().__init__(err)
-		Debug.dbg(err)
-
 class Creator():
 	# Create object of class cls called name
 	def createObj(self, name, cls):
@@ -24,24 +23,9 @@ class Creator():
 		w.setObjectName(name)
 		return w
 
-class Spinput(QWidget, Creator):
-	valueChanged = Signal(int)
-
-	def setupUi(self, name, label):
-		self.name = name
-		self.label = label
-
-		self.createObj(u'hl', QHBoxLayout(self))
-		self.hl.setContentsMargins(0, 0, 0, 0)
-
-		self.createObj(u'lbl', QLabel(self))
-		self.lbl.setText(self.label)
-		if FREEPAD_TOOLTIPS:
-			self.lbl.setToolTip(self.name)
-		self.hl.addWidget(self.lbl)
-		self.spin = self.createObj(name, QSpinBox(self.parent()))
-		arrow_size = 'width: 7px; height: 7px';
-		self.spin.setStyleSheet('''
+# Same style for all the spin boxes, built once
+_arrow_size = 'width: 7px; height: 7px'
+_SPINPUT_STYLE = '''
 QSpinBox {
 	padding-left:5px; padding-right:5px;
 	background: transparent;
@@ -59,7 +43,7 @@ QSpinBox:focus {
 }
 QSpinBox::up-button:focus {
 	subcontrol-origin: border; subcontrol-position: top right;
-	border-image: url("''' + imgUrl('spinup.png') + '''"); ''' + arrow_size + ''';
+	border-image: url("''' + imgUrl('spinup.png') + '''"); ''' + _arrow_size + ''';
 	margin-top: 4px; margin-right: 4px;
 }
 QSpinBox::up-button:focus:hover {
@@ -70,7 +54,7 @@ QSpinBox::up-button:focus:pressed {
 }
 QSpinBox::down-button:focus {
 	subcontrol-origin: border; subcontrol-position: bottom right;
-	border-image: url("''' + imgUrl('spindown.png') +'"); ''' + arrow_size + ''';
+	border-image: url("''' + imgUrl('spindown.png') +'"); ''' + _arrow_size + ''';
 	margin-bottom: 4px; margin-right: 4px;
 }
 QSpinBox::down-button:focus:hover {
@@ -79,12 +63,30 @@ QSpinBox::down-button:focus:hover {
 QSpinBox::down-button:focus:pressed {
 	border-image: url("''' + imgUrl('spindown_pressed.png') + '''");
 }
-QSpinBox::up-arrow:focus:disabled, QSpinBox::up-arrow:focus:off {'''	+ arrow_size + ''';
+QSpinBox::up-arrow:focus:disabled, QSpinBox::up-arrow:focus:off {'''	+ _arrow_size + ''';
 	image: url("''' + imgUrl('spinup_disabled.png') + '''");
 }
-QSpinBox::down-arrow:focus:disabled, QSpinBox::down-arrow:focus:off {'''	+ arrow_size + ''';
+QSpinBox::down-arrow:focus:disabled, QSpinBox::down-arrow:focus:off {'''	+ _arrow_size + ''';
 	image: url("''' + imgUrl('spindown_disabled.png') +'''");
-}''')
+}'''
+
+class Spinput(QWidget, Creator):
+	valueChanged = Signal(int)
+
+	def setupUi(self, name, label):
+		self.name = name
+		self.label = label
+
+		self.createObj(u'hl', QHBoxLayout(self))
+		self.hl.setContentsMargins(0, 0, 0, 0)
+
+		self.createObj(u'lbl', QLabel(self))
+		self.lbl.setText(self.label)
+		if FREEPAD_TOOLTIPS:
+			self.lbl.setToolTip(self.name)
+		self.hl.addWidget(self.lbl)
+		self.spin = self.createObj(name, QSpinBox(self.parent()))
+		self.spin.setStyleSheet(_SPINPUT_STYLE)
 
 		self.spin.setMinimum(0)
 		self.spin.setMaximum(127)
@@ -92,24 +94,9 @@ QSpinBox::down-arrow:focus:disabled, QSpinBox::down-arrow:focus:off {'''	+ arrow
 		self.hl.addWidget(self.spin)
 
 		self.spin.valueChanged.connect(lambda v: self.valueChanged.emit(v))
-		QMetaObject.connectSlotsByName(self)
 
 	def value(self):
 		return self.spin.value()
 
 def tr(txt, disambiguation = None):
 	return QCoreApplication.translate('Freepad', txt, disambiguation)
-
-class Debug:
-	_debug = False
-	
-	@classmethod
-	def set(cls, tf):
-		cls._debug = tf
-	
-	@classmethod
-	def dbg(cls, msg):
-		if cls._debug:
-			print(msg)
-
-
@@ -1,12 +1,13 @@
-from qtpy.QtCore import QLineF, QMetaObject, QRectF, QPointF, Qt, Signal
-from qtpy.QtWidgets import QComboBox, QDial, QStyleOptionSlider, QVBoxLayout, QWidget
-from qtpy.QtGui import QBrush, QColor, QRadialGradient, QPainter, QPen
+from qtpy.QtCore import QLineF, QRectF, QPointF, Qt, Signal
+from qtpy.QtWidgets import QComboBox, QDial, QVBoxLayout, QWidget
+from qtpy.QtGui import QBrush, QColor, QRadialGradient, QPainter, QPen, QPixmap
 
 from pad.ui.common import Creator, Spinput, tr, FREEPAD_BORD_COLOR
 
 class Knob(QWidget, Creator):
 	sendControlChange = Signal(int, int, int)
-	
+	releaseControlChange = Signal(int, int) # end of a drag
+
 	def __init__(self, title, parent = None):
 		super().__init__(parent)
 		self.kTitle = title
@@ -85,7 +86,7 @@ Knob #cbName QListView {
 		
 		self.cbName.currentIndexChanged.connect(self.ccChanged)
 		self.pot.valueChanged.connect(lambda v: self.sendControlChange.emit(self.mc, self.spCC.value(), v))
-		QMetaObject.connectSlotsByName(self)
+		self.pot.sliderReleased.connect(lambda: self.releaseControlChange.emit(self.mc, self.spCC.value()))
 		
 		return subcontrols
 
@@ -93,8 +94,11 @@ Knob #cbName QListView {
 		self.cbName.lineEdit().setText(tr(u"K " + self.kTitle, None))
 
 	def setValue(self, val):
-		val = (int(val) - self.spLO.value()) * 127 / (self.spHI.value() - self.spLO.value() + 0.000000000001)
-		self.pot.setValue(int(val))
+		lo = self.spLO.value()
+		hi = self.spHI.value()
+		if hi != lo:
+			val = (int(val) - lo) * 127 / (hi - lo)
+		self.pot.setValue(max(0, min(127, int(val))))
 
 	def setMC(self, mc):
 		self.mc = mc
@@ -110,6 +114,7 @@ class Potard(QDial):
 	buttonBgColor1 = QColor("#080808")
 	buttonBgColor2 = QColor("#202022")
 	needleColor = QColor("#bfbfbf")
+	_dials = {} # (rect, device pixel ratio) -> _Dial, shared by all knobs of the same size
 
 	def __init__(self, parent = None):
 		super().__init__(parent)
@@ -121,61 +126,75 @@ class Potard(QDial):
 		self.setFocusPolicy(Qt.FocusPolicy.NoFocus)
 
 	def paintEvent(self, event):
-		# create a QStyleOption for the dial, and initialize it with the basic properties
-		# that will be used for the configuration of the painter
-		opt = QStyleOptionSlider()
-		self.initStyleOption(opt)
-		# construct a QRectF that uses the minimum between width and height, 
+		rect = self.rect()
+		dpr = self.devicePixelRatioF()
+		key = (rect.x(), rect.y(), rect.width(), rect.height(), dpr)
+		dial = Potard._dials.get(key)
+		if dial is None:
+			dial = _Dial(rect, dpr, self.maximum() - self.minimum() + 1)
+			Potard._dials[key] = dial
+		v = min(max(self.value() - self.minimum(), 0), len(dial.needles) - 1)
+
+		qp = QPainter(self)
+		qp.setRenderHints(qp.Antialiasing)
+		qp.drawPixmap(QPointF(rect.x(), rect.y()), dial.face)
+		qp.setBrush(dial.brushes[v])
+		qp.setPen(dial.pens[v])
+		qp.drawEllipse(dial.br)
+		qp.setPen(dial.needlePen)
+		qp.drawLine(dial.needles[v])
+
+# Everything a Potard of a given size paints: the static face (the ticks) in a pixmap,
+# and the needle line, body brush and border pen for each possible value.
+class _Dial(object):
+	def __init__(self, rect, dpr, nbValues):
+		# construct a QRectF that uses the minimum between width and height,
 		# and adds some margins for better visual separation
 		# this is partially taken from the fusion style helper source
-		width = opt.rect.width()
-		height = opt.rect.height()
+		width = rect.width()
+		height = rect.height()
 		r = min(width, height) / 2
 		r -= r / 50
 		d_ = r / 6
-		dx = opt.rect.x() + d_ + (width - 2 * r) / 2 + 1
-		dy = opt.rect.y() + d_ + (height - 2 * r) / 2 + 1
-		br = QRectF(dx + .5, dy + .5, 
-				int(r * 2 - 2 * d_ - 2), 
+		dx = d_ + (width - 2 * r) / 2 + 1
+		dy = d_ + (height - 2 * r) / 2 + 1
+		self.br = QRectF(rect.x() + dx + .5, rect.y() + dy + .5,
+				int(r * 2 - 2 * d_ - 2),
 				int(r * 2 - 2 * d_ - 2))
 
-		qp = QPainter(self)
+		# ticks, in widget coordinates minus the rect origin
+		self.face = QPixmap(int(width * dpr), int(height * dpr))
+		self.face.setDevicePixelRatio(dpr)
+		self.face.fill(Qt.GlobalColor.transparent)
+		center = QRectF(dx + .5, dy + .5, self.br.width(), self.br.height()).center()
+		qp = QPainter(self.face)
 		qp.setRenderHints(qp.Antialiasing)
-
+		qp.setPen(QPen(Potard.needleColor, 2))
 		for angle in range(240, -90, -30):
 			l1 = QLineF.fromPolar(r * 0.9, angle)
-			l1.translate(br.center())
+			l1.translate(center)
 			l2 = QLineF.fromPolar(r * 1, angle)
-			l2.translate(br.center())
-			l = QLineF(l1.p2(), l2.p2())
-			qp.setPen(QPen(self.needleColor, 2))
-			qp.drawLine(l)
-
-		# find the "real" value ratio between minimum and maximum
-		realValue = (self.value() - self.minimum()) / (self.maximum() - self.minimum())
-		# compute the angle at which the dial handle should be placed, assuming
-		# a range between 240° and 300° (moving clockwise)
-		angle = 240 - 300 * realValue
-
-		line = QLineF.fromPolar(r * .6, angle)
-		line.translate(br.center())
-
-		fp = line.p2()
-		bgradient = QRadialGradient(QPointF(r, r), r * .6, fp)
-		bgradient.setColorAt(0, self.buttonBgColor1)
-		bgradient.setColorAt(1, self.buttonBgColor2)
-		pgradient = QRadialGradient(QPointF(r, r), r, fp)
-		pgradient.setColorAt(0, self.buttonBgColor2)
-		pgradient.setColorAt(1, self.buttonBgColor1)
-		qp.setBrush(QBrush(bgradient))
-		qp.setPen(QPen(pgradient, 8))
-		qp.drawEllipse(br)
-
-		line = QLineF.fromPolar(r * .6, angle)
-		line.translate(br.center())
-		qp.setPen(QPen(self.needleColor, 5))
-		qp.drawLine(line)
-
-
-
-	
\ No newline at end of file
+			l2.translate(center)
+			qp.drawLine(QLineF(l1.p2(), l2.p2()))
+		qp.end()
+
+		self.needlePen = QPen(Potard.needleColor, 5)
+		self.needles = []
+		self.brushes = []
+		self.pens = []
+		for v in range(0, nbValues):
+			# the angle at which the dial handle should be placed, assuming
+			# a range between 240° and 300° (moving clockwise)
+			angle = 240 - 300 * v / (nbValues - 1)
+			line = QLineF.fromPolar(r * .6, angle)
+			line.translate(self.br.center())
+			self.needles.append(line)
+			fp = line.p2()
+			bgradient = QRadialGradient(QPointF(r, r), r * .6, fp)
+			bgradient.setColorAt(0, Potard.buttonBgColor1)
+			bgradient.setColorAt(1, Potard.buttonBgColor2)
+			pgradient = QRadialGradient(QPointF(r, r), r, fp)
+			pgradient.setColorAt(0, Potard.buttonBgColor2)
+			pgradient.setColorAt(1, Potard.buttonBgColor1)
+			self.brushes.append(QBrush(bgradient))
+			self.pens.append(QPen(QBrush(pgradient), 8))
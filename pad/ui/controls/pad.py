@@ -1,11 +1,12 @@
-from qtpy.QtCore import QMetaObject, QSize, Qt, QTimer, Signal
+from qtpy.QtCore import QRectF, QSize, Qt, QTimer, Signal
 from qtpy.QtWidgets import QColorDialog, QComboBox, QFrame, QGraphicsDropShadowEffect, QHBoxLayout, \
-		QLineEdit, QPushButton, QSlider, QSizePolicy, QSpacerItem, QVBoxLayout, QWidget
-from qtpy.QtGui import QColor
+		QInputDialog, QLineEdit, QMenu, QPushButton, QSlider, QSizePolicy, QSpacerItem, QVBoxLayout, QWidget
+from qtpy.QtGui import QColor, QPainter, QPen
 
 from pad.freepad_settings import Fsettings
-from pad.ui.common import Creator, Debug, Spinput, tr, \
+from pad.ui.common import Creator, Debug, PadException, Spinput, tr, \
 	FREEPAD_BORD_COLOR,FREEPAD_LGRADIENT, FREEPAD_RGRADIENT
+from pad import velocity as curves
 
 class Pad(QWidget, Creator):
 	sendNoteOn = Signal(int, int, int)
@@ -13,6 +14,7 @@ class Pad(QWidget, Creator):
 	sendControlChange = Signal(int, int, int)
 	sendProgramChange = Signal(int, int)
 	keyChanged = Signal(str, str)
+	curveChanged = Signal(str)
 
 	def __init__(self, pad_id, parent = None):
 		super().__init__(parent)
@@ -41,18 +43,18 @@ class Pad(QWidget, Creator):
 			[u"Do", u"Do#", u"Ré", u"Ré#", u"Mi", u"Fa", u"Fa#", u"Sol", u"Sol#", u"La", u"La#", u"Si",]
 		]
 		self.isOn = False
+		self.isLit = False
+		self.onColor = QColor()
+		self.offColor = QColor()
+		self.curve = None # own velocity curve, or None for the global one
+		self.globalTable = curves.IDENTITY
+		self.velocityTable = curves.IDENTITY # velocity -> velocity sent and shown
 
 	def setupUi(self, params):
 		subcontrols = {}
 		for p in params:
 			setattr(self, p, params[p])
 
-		on_red = 128 * self.on_red1 + self.on_red2
-		on_green = 128 * self.on_green1 + self.on_green2
-		on_blue = 128 * self.on_blue1 + self.on_blue2
-		off_red = 128 * self.off_red1 + self.off_red2
-		off_green = 128 * self.off_green1 + self.off_green2
-		off_blue = 128 * self.off_blue1 + self.off_blue2
 		vn = 'p' + self.pad_id
 		subcontrols[vn + '_off_red1'] = self
 		subcontrols[vn + '_off_red2'] = self
@@ -69,7 +71,7 @@ class Pad(QWidget, Creator):
 
 		self.setStyleSheet('''
 #padLW {
-	border: 1px solid rgb(''' + str(off_red) + ''',''' + str(off_green) + ''',''' + str(off_blue) + ''');
+	border: 1px solid transparent;
 	border-radius: 5px;
 }
 #cbName {
@@ -88,9 +90,15 @@ class Pad(QWidget, Creator):
 		self.padMainLayout.setContentsMargins(0, 0, 0, 0)
 		self.padMainLayout.setSpacing(0)
 		# Pad frame
-		self.createObj(u"padLW", QFrame())
+		self.createObj(u"padLW", PadFrame())
 		self.padLW.setFrameStyle(QFrame.StyledPanel)
 		self.padMainLayout.addWidget(self.padLW)
+		# Glow when lit, created once and only enabled/disabled
+		self.shadow = QGraphicsDropShadowEffect(self)
+		self.shadow.setOffset(1, 1)
+		self.shadow.setBlurRadius(12)
+		self.shadow.setEnabled(False)
+		self.setGraphicsEffect(self.shadow)
 
 		self.createObj(u"verticalLayout", QVBoxLayout())
 		self.padLW.setLayout(self.verticalLayout)
@@ -111,14 +119,12 @@ class Pad(QWidget, Creator):
 			ctlname = 'p' + self.pad_id + '_off'
 			btnOff = self.createObj(ctlname, QPushButton())
 			btnOff.setMaximumSize(12, 12)
-			btnOff.setStyleSheet('background-color: rgb(' + str(off_red) +',' + str(off_green) + ',' + str(off_blue) + ');')
 			btnOff.clicked.connect(lambda e: self.chooseColor('off'))
 			subcontrols[ctlname] = btnOff
 			ctlname = 'p' + self.pad_id + '_on'
 			btnOn = self.createObj(ctlname, QPushButton())
 			self.btnNoteHL.addWidget(btnOff, Qt.AlignmentFlag.AlignLeft)
 			btnOn.setMaximumSize(12, 12)
-			btnOn.setStyleSheet('background-color: rgb(' + str(on_red) +',' + str(on_green) + ',' + str(on_blue) + ');')
 			btnOn.clicked.connect(lambda e: self.chooseColor('on'))
 			subcontrols[ctlname] = btnOn
 		self.createObj(u"btnNote", QPushButton())
@@ -183,6 +189,8 @@ class Pad(QWidget, Creator):
 		# Level
 		self.createObj('vlLevel', QVBoxLayout())
 		self.createObj('level', Level(self))
+		self.level.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+		self.level.customContextMenuRequested.connect(self.curveMenu)
 		self.vlLevel.addWidget(self.level, 0, Qt.AlignmentFlag.AlignHCenter)
 		self.vlLevel.addItem(QSpacerItem(0, 4, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Minimum))
 		# Key
@@ -195,6 +203,7 @@ class Pad(QWidget, Creator):
 		self.verticalLayout.addLayout(self.hlp)
 
 		self.retranslateUi()
+		self.updateColors()
 		self.setFixedSize(self.padMainLayout.sizeHint())
 
 		self.cbName.currentIndexChanged.connect(self.instrumentChanged)
@@ -205,7 +214,6 @@ class Pad(QWidget, Creator):
 		self.btnNote.pressed.connect(self.noteOn)
 		self.btnNote.released.connect(self.noteOff)
 
-		QMetaObject.connectSlotsByName(self)
 		self.noteChanged(0)
 		return subcontrols
 		# setupUi
@@ -234,64 +242,123 @@ class Pad(QWidget, Creator):
 		if self.parent() is not None:
 			self.parent().unselPrograms()
 
+	# Set one of the color bytes (off_red1, on_blue2...) received in a program
+	def setColorValue(self, name, value):
+		setattr(self, name, value)
+		self.updateColors()
+
+	# Compute the on and off colors once, when the color bytes change
+	def updateColors(self):
+		self.onColor = QColor(
+			min(255, 128 * self.on_red1 + self.on_red2),
+			min(255, 128 * self.on_green1 + self.on_green2),
+			min(255, 128 * self.on_blue1 + self.on_blue2))
+		self.offColor = QColor(
+			min(255, 128 * self.off_red1 + self.off_red2),
+			min(255, 128 * self.off_green1 + self.off_green2),
+			min(255, 128 * self.off_blue1 + self.off_blue2))
+		self.padLW.setColors(self.offColor, self.onColor)
+		self.shadow.setColor(self.onColor)
+		if self.rgb:
+			getattr(self, 'p' + self.pad_id + '_off').setStyleSheet('background-color: ' + self.offColor.name() + ';')
+			getattr(self, 'p' + self.pad_id + '_on').setStyleSheet('background-color: ' + self.onColor.name() + ';')
+
 	def lightOn(self, velocity):
-		try:
-			red = 128 * self.on_red1 + self.on_red2
-			green = 128 * self.on_green1 + self.on_green2
-			blue = 128 * self.on_blue1 + self.on_blue2
-			self.padLW.setStyleSheet(
-'#padLW {border-color: rgb(' + str(red) + ',' + str(green) + ',' + str(blue) + ');}'
-)
-			shadow = QGraphicsDropShadowEffect()
-			shadow.setColor(QColor(red, green, blue))
-			shadow.setOffset(1, 1)
-			shadow.setBlurRadius(12)
-			self.setGraphicsEffect(shadow)
-			self.level.setVelocity(int(velocity))
-		except Exception as e:
-			Debug.dbg('Error in Pad.lightOn: ' + str(e))
+		if not self.isLit:
+			self.isLit = True
+			self.padLW.setLit(True)
+			self.shadow.setEnabled(True)
+		self.level.setVelocity(int(velocity))
 
 	def lightOff(self):
-		try:
-			self.padLW.setStyleSheet(
-'#padLW {border-color: rgb(' + \
-str(128 * self.off_red1 + self.off_red2) + ',' + \
-str(128 * self.off_green1 + self.off_green2) + ',' + \
-str(128 * self.off_blue1 + self.off_blue2) + ');}'
-)
-			self.setGraphicsEffect(None)
-			self.level.setVelocity(0)
-		except:
-			pass
+		if self.isLit:
+			self.isLit = False
+			self.padLW.setLit(False)
+			self.shadow.setEnabled(False)
+		self.level.setVelocity(0)
 
 	def noteOn(self):
-		self.isOn = True
-		self.sendNoteOn.emit(self.mc, self.note, self.level.defaultVelocity)
-		self.lightOn(self.level.defaultVelocity)
+		self.lightOn(self.playNote())
 
 	def noteOff(self):
-		self.isOn = False
-		self.sendNoteOff.emit(self.mc, self.note, self.level.defaultVelocity)
+		self.stopNote()
 		self.lightOff()
 
 	def controlChange(self):
+		self.lightOn(self.playControl())
+
+	def programChange(self):
+		self.lightOn(self.playProgram())
+
+	# MIDI only, the caller shows the returned velocity: the keyboard sends all its pads first
+	def playNote(self):
+		self.isOn = True
+		velocity = self.velocityTable[self.level.defaultVelocity]
+		self.sendNoteOn.emit(self.mc, self.note, velocity)
+		return velocity
+
+	def stopNote(self):
+		self.isOn = False
+		self.sendNoteOff.emit(self.mc, self.note, self.level.defaultVelocity)
+
+	def playControl(self):
 		self.isOn = True
 		self.sendControlChange.emit(self.mc, self.spCC.value(), self.level.defaultVelocity)
-		self.lightOn(self.level.defaultVelocity)
+		return self.level.defaultVelocity
 
-	def programChange(self):
+	def playProgram(self):
 		self.isOn = True
 		self.sendProgramChange.emit(self.mc, self.spPC.value())
-		self.lightOn(self.level.defaultVelocity)
+		return self.level.defaultVelocity
+
+	# Velocity curve of the pad (a VelocityCurve, or None) and table of the global one
+	def setVelocityCurve(self, curve, globalTable = None):
+		self.curve = curve
+		if globalTable is not None:
+			self.globalTable = globalTable
+		self.velocityTable = curve.table if curve is not None else self.globalTable
+		self.level.setToolTip('' if curve is None else tr(u"Velocity curve: ", None) + curve.curve)
+
+	def curveMenu(self, pos):
+		menu = QMenu(self)
+		current = self.curve.curve if self.curve is not None else None
+		for name, label in [(None, tr(u"Global curve", None)), ('linear', tr(u"Linear", None)), ('log', tr(u"Logarithmic...", None)),
+				('exp', tr(u"Exponential...", None)), ('fixed', tr(u"Fixed...", None)), ('custom', tr(u"Custom...", None))]:
+			action = menu.addAction(label)
+			action.setCheckable(True)
+			action.setChecked(name == current)
+			action.setData(name)
+		action = menu.exec(self.level.mapToGlobal(pos))
+		if action is not None:
+			self.chooseCurve(action.data())
+
+	def chooseCurve(self, name):
+		current = self.curve if self.curve is not None else curves.VelocityCurve()
+		ok = True
+		try:
+			if name is None:
+				curve = None
+			elif name in ('log', 'exp'):
+				amount, ok = QInputDialog.getDouble(self, tr(u"Velocity curve", None), tr(u"Curve strength", None), current.amount, 0.1, 100.0, 1)
+				curve = curves.VelocityCurve(name, amount = amount)
+			elif name == 'fixed':
+				value, ok = QInputDialog.getInt(self, tr(u"Velocity curve", None), tr(u"Velocity", None), current.value, 1, 127)
+				curve = curves.VelocityCurve(name, value = value)
+			elif name == 'custom':
+				text, ok = QInputDialog.getText(self, tr(u"Velocity curve", None), tr(u"Points (input:output)", None), text = curves.formatPoints(current.points))
+				curve = curves.VelocityCurve(name, points = curves.parsePoints(text)) if ok else None
+			else:
+				curve = curves.VelocityCurve(name)
+		except PadException as e:
+			Debug.dbg(str(e))
+			return
+		if ok:
+			self.setVelocityCurve(curve)
+			self.curveChanged.emit(self.pad_id)
 
 	def chooseColor(self, col):
-		red = 128 * getattr(self, col + '_red1') + getattr(self, col + '_red1')
-		green = 128 * getattr(self, col + '_green1') + getattr(self, col + '_green2')
-		blue = 128 * getattr(self, col + '_blue1') + getattr(self, col + '_blue2')
-		color = QColorDialog.getColor(QColor(red, green, blue), self)
+		color = QColorDialog.getColor(self.onColor if col == 'on' else self.offColor, self)
 		if color.isValid():
-			btn = getattr(self, "p" + self.pad_id + "_" + col)
-			btn.setStyleSheet('background-color: ' + color.name() + ';')
 			red = color.red()
 			green = color.green()
 			blue = color.blue()
@@ -301,9 +368,37 @@ str(128 * self.off_blue1 + self.off_blue2) + ');}'
 			setattr(self, col + '_green2', green % 128)
 			setattr(self, col + '_blue1', int(blue / 128))
 			setattr(self, col + '_blue2', blue % 128)
-			if col == 'off':
-				self.lightOff()
+			self.updateColors()
+
 
+# Pad frame painting its own border, so lighting a pad does not parse any stylesheet
+class PadFrame(QFrame):
+	def __init__(self, parent = None):
+		super().__init__(parent)
+		self.lit = False
+		self._offPen = QPen(QColor(0, 0, 0), 1)
+		self._onPen = QPen(QColor(0, 0, 0), 1)
+		self._borderRect = QRectF()
+
+	def setColors(self, offColor, onColor):
+		self._offPen = QPen(offColor, 1)
+		self._onPen = QPen(onColor, 1)
+		self.update()
+
+	def setLit(self, lit):
+		self.lit = lit
+		self.update()
+
+	def resizeEvent(self, event):
+		self._borderRect = QRectF(self.rect()).adjusted(.5, .5, -.5, -.5)
+		return QFrame.resizeEvent(self, event)
+
+	def paintEvent(self, event):
+		QFrame.paintEvent(self, event)
+		qp = QPainter(self)
+		qp.setRenderHint(QPainter.RenderHint.Antialiasing)
+		qp.setPen(self._onPen if self.lit else self._offPen)
+		qp.drawRoundedRect(self._borderRect, 5, 5)
 
 class Level(QSlider):
 	def __init__(self, parent = None):
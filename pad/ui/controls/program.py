@@ -1,4 +1,4 @@
-from qtpy.QtCore import QMetaObject, Qt
+from qtpy.QtCore import Qt
 from qtpy.QtWidgets import QHBoxLayout, QLabel, QPushButton, QSizePolicy, QSpacerItem, QVBoxLayout, QWidget
 
 from pad.ui.common import Creator, tr
@@ -53,7 +53,6 @@ class Program(QWidget , Creator):
 		self.btnGet.clicked.connect(self.getProgram)
 		self.bTitle.clicked.connect(self.getProgram)
 
-		QMetaObject.connectSlotsByName(self)
 
 	def retranslateUi(self):
 		self.pTitle = tr(u'Program' + ' ' + self.n, None)
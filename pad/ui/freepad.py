@@ -1,12 +1,13 @@
-import os, json
+import os
+from pathlib import Path
 
-from qtpy.QtCore import QDir, QMetaObject, Qt, QTimer
+from qtpy.QtCore import QDir, Qt, QTimer
 from qtpy.QtWidgets import QApplication, QCheckBox, QComboBox, QFileDialog, QGridLayout, \
-	QHBoxLayout, QLabel, QMessageBox, QPushButton, QSizePolicy, QSpacerItem, QSpinBox, \
+	QHBoxLayout, QLabel, QMessageBox, QPushButton, QSizePolicy, QSpacerItem, \
 	QStyle, QVBoxLayout, QWidget
 from qtpy.QtGui import QIcon
 
-from pad.path import FREEPAD_PATH, FREEPAD_ICON_PATH, imgUrl
+from pad.path import FREEPAD_ICON_PATH, imgUrl
 from pad.freepad_settings import Fsettings
 from pad.ui.common import Creator, Debug, \
 	PadException, tr, \
@@ -18,8 +19,16 @@ from pad.ui.common import Creator, Debug, \
 	FREEPAD_RGRADIENT_OVER
 	
 from pad.ui.controls import Knob, Pad, Program
-from pad.ui.options import FreepadOptionsWindow
+from pad.ui.midimap import MidiMap
+from pad.ui.coalescer import UiCoalescer
 from pad.padio import PadIO
+from pad.programreader import ProgramReader
+from pad.preset import FORMATS, Preset, bundledPresets, readPreset, writePreset
+from pad.thru import ThruChain
+from pad import velocity as curves
+from pad import profile as devprofile
+from pad.midilog import IN
+from pad.midievent import NOTE_ON, NOTE_OFF, CONTROL_CHANGE, PROGRAM_CHANGE, SYSEX
 
 class FreepadWindow(QWidget, Creator):
 	def __init__(self, params):
@@ -34,10 +43,11 @@ class FreepadWindow(QWidget, Creator):
 		self.shiftPressed = False
 		self.ctrlPressed = False
 
-		for p in ['device', 'defaultKit', 'defaultControls']:
+		for p in ['profile', 'defaultKit', 'defaultControls']:
 			if p in params:
 				setattr(self, p, params[p])
-		self.io = PadIO(self.device)
+		self.device = self.profile.raw
+		self.io = PadIO(self.profile, self)
 		self.io.devicePlugged.connect(self.plugged)
 		self.io.deviceUnplugged.connect(self.unplugged)
 		try: 
@@ -45,14 +55,153 @@ class FreepadWindow(QWidget, Creator):
 		except:
 			pass
 		self.io.receivedMidi.connect(self.receivedMidi)
-		self.midiname = self.device['midiname']
-		if 'nb_programs' in self.device:
-			self.nbPrograms = int(self.device['nb_programs'])
+		self.io.sentMidi.connect(self._sentMidi)
+		self.io.recordingFinished.connect(self._recordingFinished)
+		self.midiname = self.profile.midiname
+		self.nbPrograms = self.profile.nbPrograms
+
+		self.in_symbol = '<span style="color:#882200">-\u25B6</span>'
+		self.out_symbol = '<span style="color:#882200">\u25C0-</span>'
+
+		self.settingProgram = False
+		self.midiMap = MidiMap() # (channel, note|cc|pc) -> pads and knobs
+		self.uiFrame = UiCoalescer(self.showStatus, self) # UI updates from MIDI, once per frame
+		self.uiFrame.flushed.connect(self.io.stats.uiShown)
+		self.presetOptions = {} # options of the last preset loaded, saved with the next one
+		self.thruTimer = QTimer(self) # thru velocity curves follow the pad notes
+		self.thruTimer.setSingleShot(True)
+		self.thruTimer.setInterval(100)
+		self.thruTimer.timeout.connect(self.applyThru)
+		self._applyPid = None # program read to show in the UI
+		self.reader = None
+		self.monitor = None # MIDI monitor window, created when first shown
+		self.sequencer = None # step sequencer window, created when first shown
+		self.library = None # preset library window, created when first shown
+		codec = self.profile.codec
+		if codec is not None and codec.canRequest() and codec.canDecode():
+			self.reader = ProgramReader(self.io, codec, parent = self)
+			self.reader.programRead.connect(self._programRead)
+			self.reader.finished.connect(self._programsRead)
+		self.programs = []
+		self._controls = {} # controls from varnames
+		self._pads = []
+		self._knobs = []
+		self.padKeymap = {} # pad_id -> keyboard key
+		self.keyPads = {} # Qt key code -> pads, rebuilt when a key changes
+		self.heldKeys = {} # Qt key code -> pads played by the key, until it is released
+		self.heldPads = {} # pad -> number of held keys playing it
+		self.nbPrograms = 0
+		self.pmc = 16 # default pad midi channel
+		self.kmc = 16 # default knob midi channel
+		self.setupUi()
+		if self.io.isConnected:
+			self.getProgram('1')
 		else:
-			self.nbPrograms = 0
+			self.load1stPreset()
 
-		self._program = self.io.program
+	def setupUi(self):
+		self.showMidiMessages = True if str(Fsettings.get('showMidiMessages', 'True')) == 'True'  else False
+
+		if 'mc' in self.profile.padVars:
+			self.pmc = 0
+		if 'mc' in self.profile.knobVars:
+			self.kmc = 0
+
+		# Main layout: hLayout + statusbar
+		self.createObj(u'vLayout', QVBoxLayout(self))
+		self.vLayout.setContentsMargins(0, 0, 0, 0)
+		self.vLayout.setSpacing(0)
+
+		# Horizontal layout
+		self.createObj(u'hLayout', QHBoxLayout())
+		self.hLayout.setContentsMargins(10, 10, 10, 10)
+		self.hLayout.setSpacing(10)
 
+		# Programs panel
+		if 'programs' in self.device['layout']:
+			self.createObj(u'vLayoutg', QVBoxLayout())
+			self.vLayoutg.setContentsMargins(0, 0, 0, 0)
+			self.vLayoutg.setSpacing(10)
+			self.addPrograms(self.vLayoutg)
+			self.hLayout.addLayout(self.vLayoutg)
+
+		# Pads and knobs layout
+		self.createObj(u'vLayoutd', QVBoxLayout())
+		self.vLayoutd.setContentsMargins(0, 0, 0, 0)
+		self.createObj(u'gLayout', QGridLayout())
+		self.vLayoutd.addLayout(self.gLayout)
+		self.gLayout.setContentsMargins(0, 0, 0, 0)
+		self.gLayout.setSpacing(10)
+		for spec in self.profile.controls:
+			if spec.type == 'p':
+				ctlClass = Pad(spec.num)
+				params = {'kit': self.defaultKit, \
+					'bv': 'bv' in self.profile.padVars, \
+					'rgb': 'on_red1' in self.profile.padVars,
+					'mc': self.pmc
+				}
+				ctlClass.sendNoteOn.connect(self._sendNoteOn)
+				ctlClass.sendNoteOff.connect(self._sendNoteOff)
+				ctlClass.sendControlChange.connect(self._sendControlChange)
+				ctlClass.sendProgramChange.connect(self._sendProgramChange)
+				ctlClass.keyChanged.connect(self._padKeyChanged)
+				ctlClass.curveChanged.connect(self._padCurveChanged)
+			else:
+				ctlClass = Knob(spec.num)
+				ctlClass.sendControlChange.connect(self._sendControlChange)
+				ctlClass.releaseControlChange.connect(self._releaseControlChange)
+				params = {'midi_controls': self.defaultControls, \
+					'mc': self.kmc
+				}
+			control = self.createObj(spec.ctlid, ctlClass)
+			subcontrols = control.setupUi(params)
+			if spec.type == 'p':
+				control.spNote.valueChanged.connect(lambda v, c = control: self._indexPad(c))
+				control.spPC.valueChanged.connect(lambda v, c = control: self._indexPad(c))
+				self._pads.append(control)
+			else:
+				control.spCC.valueChanged.connect(lambda v, c = control: self._indexKnob(c))
+				self._knobs.append(control)
+			if hasattr(control, 'cbMC'):
+				control.cbMC.currentIndexChanged.connect(lambda v: self.indexControls())
+			self.gLayout.addWidget(control, spec.row, spec.col, 1, 1, alignment = Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignVCenter)
+			self._controls[spec.ctlid] = control
+			self._controls.update(subcontrols)
+
+		# Bottom layout
+		c = 0
+		self.createObj(u'hLayoutBottom', QHBoxLayout())
+		self.hLayoutBottom.setContentsMargins(0, 0, 0, 0)
+		self.hLayoutBottom.setSpacing(10)
+		if 'bottom' in self.device['layout']:
+			for ctl in self.device['layout']['bottom']:
+				match ctl:
+					case 'mc':
+						c += self.addGMC(self.hLayoutBottom)
+					case 'alert':
+						c += self.addAlert(self.hLayoutBottom, c)
+					case 'appButtons':
+						self.addAppButtons(self.hLayoutBottom)
+				#/match
+		self.vLayoutd.addLayout(self.hLayoutBottom)
+
+		self.hLayout.addLayout(self.vLayoutd)
+		self.vLayout.addLayout(self.hLayout)
+		# status bar
+		if self.showMidiMessages:
+			self.addStatusBar()
+
+		self._applyStyleSheet()
+		self.retranslateUi()
+		self.setFixedSize(self.sizeHint())
+
+		self.mc.currentIndexChanged.connect(self.valueChanged)
+		self.mc.currentIndexChanged.connect(lambda v: self.indexControls())
+		self.indexControls(False)
+		self._bindProgram()
+
+	# Applied once all the controls are created: styling them one by one while they are added is much slower
+	def _applyStyleSheet(self):
 		self.setStyleSheet('''
 FreepadWindow * {
 	color: ''' + FREEPAD_TITLE_COLOR + ''';
@@ -130,121 +279,6 @@ QToolTip {
 	padding: 3px;
 	}
 ''')
-		self.in_symbol = '<span style="color:#882200">-\u25B6</span>'
-		self.out_symbol = '<span style="color:#882200">\u25C0-</span>'
-
-		self.settingProgram = False
-		self.padNotes = []
-		self.padProgramChanges = []
-		self.padControlChanges = []
-		self.programs = []
-		self._controls = {} # controls from varnames
-		self.padKeymap = {}
-		self.nbPrograms = 0
-		self.pmc = 16 # default pad midi channel
-		self.kmc = 16 # default knob midi channel
-		self.setupUi()
-		if self.io.isConnected:
-			self.getProgram('1')
-		else:
-			self.load1stPreset()
-
-	def setupUi(self):
-		self.showMidiMessages = True if str(Fsettings.get('showMidiMessages', 'True')) == 'True'  else False
-
-		if 'pad' in self.device:
-			if 'mc' in self.device['pad']:
-				self.pmc = 0
-		if 'knob' in self.device and 'mc' in self.device['knob']:
-				self.kmc = 0
-
-		# Main layout: hLayout + statusbar
-		self.createObj(u'vLayout', QVBoxLayout(self))
-		self.vLayout.setContentsMargins(0, 0, 0, 0)
-		self.vLayout.setSpacing(0)
-
-		# Horizontal layout
-		self.createObj(u'hLayout', QHBoxLayout())
-		self.hLayout.setContentsMargins(10, 10, 10, 10)
-		self.hLayout.setSpacing(10)
-
-		# Programs panel
-		if 'programs' in self.device['layout']:
-			self.createObj(u'vLayoutg', QVBoxLayout())
-			self.vLayoutg.setContentsMargins(0, 0, 0, 0)
-			self.vLayoutg.setSpacing(10)
-			self.addPrograms(self.vLayoutg)
-			self.hLayout.addLayout(self.vLayoutg)
-
-		# Pads and knobs layout
-		self.createObj(u'vLayoutd', QVBoxLayout())
-		self.vLayoutd.setContentsMargins(0, 0, 0, 0)
-		self.createObj(u'gLayout', QGridLayout())
-		self.vLayoutd.addLayout(self.gLayout)
-		self.gLayout.setContentsMargins(0, 0, 0, 0)
-		self.gLayout.setSpacing(10)
-		l = 0
-		for line in self.device['layout']['main']:
-			c = 0
-			for ctl in line:
-				if ctl != '':
-					ctlType = ctl.rstrip('0123456789')
-					ctlNum = ctl[len(ctlType):]
-					if ctlType == 'p':
-						ctlClass = Pad(ctlNum)
-						params = {'kit': self.defaultKit, \
-							'bv': 'bv' in self.device['pad'], \
-							'rgb': 'on_red1' in self.device['pad'],
-							'mc': self.pmc
-						}
-						ctlClass.sendNoteOn.connect(self._sendNoteOn)
-						ctlClass.sendNoteOff.connect(self._sendNoteOff)
-						ctlClass.sendControlChange.connect(self._sendControlChange)
-						ctlClass.sendProgramChange.connect(self._sendProgramChange)
-						ctlClass.keyChanged.connect(self._padKeyChanged)
-					elif ctlType == 'k':
-						ctlClass = Knob(ctlNum)
-						ctlClass.sendControlChange.connect(self._sendControlChange)
-						params = {'midi_controls': self.defaultControls, \
-							'mc': self.kmc
-						}
-					control = self.createObj(ctl, ctlClass)
-					subcontrols = control.setupUi(params)
-					self.gLayout.addWidget(control, l, c, 1, 1, alignment = Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignVCenter)
-					self._controls[ctl] = control
-					self._controls.update(subcontrols)
-				c = c + 1
-			l = l + 1
-
-		# Bottom layout
-		c = 0
-		self.createObj(u'hLayoutBottom', QHBoxLayout())
-		self.hLayoutBottom.setContentsMargins(0, 0, 0, 0)
-		self.hLayoutBottom.setSpacing(10)
-		if 'bottom' in self.device['layout']:
-			for ctl in self.device['layout']['bottom']:
-				match ctl:
-					case 'mc':
-						c += self.addGMC(self.hLayoutBottom)
-					case 'alert':
-						c += self.addAlert(self.hLayoutBottom, c)
-					case 'appButtons':
-						self.addAppButtons(self.hLayoutBottom)
-				#/match
-		self.vLayoutd.addLayout(self.hLayoutBottom)
-
-		self.hLayout.addLayout(self.vLayoutd)
-		self.vLayout.addLayout(self.hLayout)
-		# status bar
-		if self.showMidiMessages:
-			self.addStatusBar()
-
-		self.retranslateUi()
-		self.setFixedSize(self.sizeHint())
-
-		self.mc.currentIndexChanged.connect(self.valueChanged)
-
-		QMetaObject.connectSlotsByName(self)
 
 	def addPrograms(self, layout):
 		for ctl in self.device['layout']['programs']:
@@ -262,6 +296,19 @@ QToolTip {
 					self._controls[ctl] = pgui
 					self.nbPrograms += 1
 
+				case 'btnGetAll':
+					self.createObj(u'hlGetAll', QHBoxLayout())
+					self.createObj(u'btnGetAll', QPushButton())
+					self.btnGetAll.setStyleSheet('QPushButton{padding: 5px 20px 5px 20px;}')
+					self.btnGetAll.setEnabled(self.io.isConnected and self.reader is not None)
+					hlspacerg = QSpacerItem(5, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
+					hlspacerd = QSpacerItem(5, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
+					self.hlGetAll.addItem(hlspacerg)
+					self.hlGetAll.addWidget(self.btnGetAll)
+					self.hlGetAll.addItem(hlspacerd)
+					layout.addLayout(self.hlGetAll)
+					self.btnGetAll.clicked.connect(self.getAllPrograms)
+
 				case 'btnToRam':
 					self.createObj(u'hlToRam', QHBoxLayout())
 					self.createObj(u'btnToRam', QPushButton())
@@ -273,7 +320,7 @@ QToolTip {
 					self.hlToRam.addWidget(self.btnToRam)
 					self.hlToRam.addItem(hlspacerd)
 					layout.addLayout(self.hlToRam)
-					self.btnToRam.clicked.connect(self.sendToRam)
+					self.btnToRam.clicked.connect(lambda: self.sendToRam())
 
 				case 'appButtons':
 					self.addAppButtons(layout)
@@ -319,29 +366,51 @@ QToolTip {
 		self.createObj(u'btnSave', QPushButton())
 		self.btnSave.setEnabled(False)
 		self.btnSave.setIcon(self.style().standardIcon(getattr(QStyle.StandardPixmap, 'SP_DialogSaveButton')))
+		self.createObj(u'btnLibrary', QPushButton())
+		self.btnLibrary.setEnabled(False)
+		self.btnLibrary.setIcon(self.style().standardIcon(getattr(QStyle.StandardPixmap, 'SP_FileDialogContentsView')))
 		self.createObj(u'btnOptions', QPushButton())
 		self.btnOptions.setIcon(self.style().standardIcon(getattr(QStyle.StandardPixmap, 'SP_MessageBoxInformation')))
+		self.createObj(u'btnMonitor', QPushButton())
+		self.btnMonitor.setIcon(self.style().standardIcon(getattr(QStyle.StandardPixmap, 'SP_FileDialogDetailedView')))
+		self.createObj(u'btnSequencer', QPushButton())
+		self.btnSequencer.setIcon(self.style().standardIcon(getattr(QStyle.StandardPixmap, 'SP_MediaPlay')))
+		self.createObj(u'btnRecord', QPushButton('\u25CF'))
+		self.btnRecord.setCheckable(True)
+		self.btnRecord.setStyleSheet('QPushButton:checked { color: #ff2800; }')
 		tblspacerg = QSpacerItem(5, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
 		tblspacerd = QSpacerItem(5, 0, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
 		self.tbLayout.addItem(tblspacerg)
 		self.tbLayout.addWidget(self.btnLoad)
 		self.tbLayout.addWidget(self.btnSave)
+		self.tbLayout.addWidget(self.btnLibrary)
 		self.tbLayout.addWidget(self.btnOptions)
+		self.tbLayout.addWidget(self.btnMonitor)
+		self.tbLayout.addWidget(self.btnSequencer)
+		self.tbLayout.addWidget(self.btnRecord)
 		self.tbLayout.addItem(tblspacerd)
-		if 'program' in self.device:
+		if self.profile.hasProgram():
 			self.btnLoad.clicked.connect(self.loadProgram)
 			self.btnSave.clicked.connect(self.saveProgram)
 			self.btnLoad.setEnabled(True)
+			self.btnLibrary.clicked.connect(self.showLibrary)
+			self.btnLibrary.setEnabled(True)
 			self.btnSave.setEnabled(True)
 		self.btnOptions.clicked.connect(self.showOptionsDialog)
+		self.btnMonitor.clicked.connect(self.showMonitor)
+		self.btnRecord.toggled.connect(self.record)
+		self.btnSequencer.clicked.connect(self.showSequencer)
+		if len(self._pads) == 0:
+			self.btnSequencer.setEnabled(False)
 		layout.addLayout(self.tbLayout)
 
-	def _fileDialog(self, fileMode, acceptMode):
+	# Return the selected file name and the index of the selected filter
+	def _fileDialog(self, fileMode, acceptMode, filters):
 		filename = ''
 		dialog = QFileDialog(self)
 		dialog.setFileMode(fileMode)
 		dialog.setAcceptMode(acceptMode)
-		dialog.setNameFilter(self.midiname + ' program(*.' + self.midiname.lower() + ')')
+		dialog.setNameFilters(filters)
 		wDir = Fsettings.get('lastDir', os.getenv('HOME'))
 		dialog.setDirectory(QDir(wDir))
 		if dialog.exec():
@@ -350,303 +419,421 @@ QToolTip {
 				filename = dialog.selectedFiles()[0]
 				lastdir = dialog.directory().absolutePath()
 				Fsettings.set('lastDir', lastdir)
-		return filename
+		selected = dialog.selectedNameFilter()
+		return filename, filters.index(selected) if selected in filters else 0
 
+	# First bundled preset, by file name
 	def load1stPreset(self):
-		presets_path = FREEPAD_PATH.joinpath('pads').joinpath('presets').joinpath(self.midiname.lower())
-		if presets_path.is_dir():
-			presets_files = os.listdir(presets_path)
-			if len(presets_files) > 0:
-				pp = presets_path.joinpath(presets_files[0])
-				self._loadProgram(pp)
+		presets = bundledPresets(self.midiname)
+		if len(presets) > 0:
+			self._loadProgram(presets[0])
 
 	def loadProgram(self, event):
-		filename = ''
+		ext = '*.' + self.midiname.lower()
+		filename, _ = self._fileDialog(QFileDialog.ExistingFile, QFileDialog.AcceptOpen,
+			[self.midiname + ' program (' + ext + ' *.syx)'])
+		if filename != '' and self.openPreset(filename) and not filename.lower().endswith('.syx'):
+			self._addToLibrary(filename)
+
+	# Load the preset filename, return False if it could not be read
+	def openPreset(self, filename):
 		try:
-			filename = self._fileDialog(QFileDialog.ExistingFile, QFileDialog.AcceptOpen)
-			if filename != '':
-				QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
-				self._loadProgram(filename)
-				QApplication.restoreOverrideCursor()
-
+			QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+			self._loadProgram(filename)
+			return True
 		except Exception as e:
+			self.warning(tr('Unable to read the preset'), ' "' + str(filename) + '": ' + str(e))
+			return False
+		finally:
 			QApplication.restoreOverrideCursor()
-			Debug.dbg('Unable to read ' + self.midiname + ' program from "' + filename + '": ' + str(e))
+
+	# Presets loaded or saved out of the library folders are found by the library too
+	def _addToLibrary(self, filename):
+		from pad.library import PresetLibrary # not needed before
+		try:
+			library = PresetLibrary.instance()
+			if library is not None:
+				library.addFile(self.profile, filename)
+		except Exception as e:
+			Debug.dbg('Unable to add "' + filename + '" to the preset library: ' + str(e))
+
+	def showLibrary(self, event = None):
+		if self.library is None:
+			from pad.library import PresetLibrary # not needed before
+			from pad.ui.library import PresetLibraryWindow
+			library = PresetLibrary.instance()
+			if library is None:
+				self.warning(tr('No cache folder for the preset library'))
+				return
+			self.library = PresetLibraryWindow(self, library, self)
+			self.library.setupUi(self.midiname)
+		self.library.show()
+		self.library.raise_()
 
 	def _loadProgram(self, filename):
-		with open(filename, 'r') as fp:
-			lst = json.load(fp)
-			fp.close()
-			pgm = [0] + lst[0]
-			for pk in lst[1]:
-				ctlname = pk[0]
-				pkName = pk[1]
-				ctl = self._controls[ctlname]
-				ctl.cbName.lineEdit().setText(pkName)
-				if isinstance(ctl, Pad) and len(pk) > 2:
-					key = pk[2]
-					ctl.leKey.setText(key)
-					self.padKeymap[ctl.pad_id] = key
-					if len(pk) > 3:
-						ctl.level.setDefaultVelocity(pk[3])
-				elif isinstance(ctl, Knob) and len(pk) > 2:
-					ctl.pot.setValue(pk[2])
-			self.setProgram(pgm)
-			self.unselPrograms()
-			# switch all lights off
-			for line in  self.device['layout']['main']:
-				for ctlid in line:
-					if ctlid[0:1] == 'p':
-						self._controls[ctlid].lightOff()
-			self.setFocus() # to activate keyboard keys
-			if self.io.isConnected:
-				self.sendToRam()
+		preset = readPreset(filename, self.profile)
+		pgm = [0] + preset.program
+		for pk in preset.controls:
+			ctlname = pk[0]
+			pkName = pk[1]
+			ctl = self._controls[ctlname]
+			ctl.cbName.lineEdit().setText(pkName)
+			if isinstance(ctl, Pad) and len(pk) > 2:
+				key = pk[2]
+				ctl.leKey.setText(key)
+				self._padKeyChanged(ctl.pad_id, key)
+				if len(pk) > 3:
+					ctl.level.setDefaultVelocity(pk[3])
+			elif isinstance(ctl, Knob) and len(pk) > 2:
+				ctl.pot.setValue(pk[2])
+		self.setProgram(pgm)
+		self.unselPrograms()
+		# switch all lights off
+		for pad in self._pads:
+			pad.lightOff()
+		self.setPresetOptions(preset.options)
+		self.setFocus() # to activate keyboard keys
+		if self.io.isConnected:
+			self.sendToRam()
+
+	def setPresetOptions(self, options):
+		self.presetOptions = options
+		if self.sequencer is not None: # built again from the new options when shown
+			self.sequencer.stop()
+			self.sequencer.deleteLater()
+			self.sequencer = None
+		self.applyVelocity()
+		self.applyThru()
+
+	# Velocity curves of the "velocity" options, see pad.velocity
+	def applyVelocity(self):
+		options = self.presetOptions.get('velocity', {})
+		try:
+			globalCurve = curves.VelocityCurve.fromDict(options.get('global', {}))
+		except PadException as e:
+			globalCurve = curves.VelocityCurve()
+			self.warning(str(e))
+		padCurves = options.get('pads', {})
+		for pad in self._pads:
+			curve = None
+			if pad.objectName() in padCurves:
+				try:
+					curve = curves.VelocityCurve.fromDict(padCurves[pad.objectName()])
+				except PadException as e:
+					self.warning(str(e), ': ' + pad.objectName())
+			pad.setVelocityCurve(curve, globalCurve.table)
+
+	def globalCurve(self):
+		try:
+			return curves.VelocityCurve.fromDict(self.presetOptions.get('velocity', {}).get('global', {}))
+		except PadException:
+			return curves.VelocityCurve()
+
+	def setGlobalCurve(self, curve):
+		self.presetOptions.setdefault('velocity', {})['global'] = curve.toDict()
+		for pad in self._pads:
+			pad.setVelocityCurve(pad.curve, curve.table)
+		self.thruTimer.start()
+
+	def _padCurveChanged(self, pad_id):
+		pad = self._controls['p' + pad_id]
+		padCurves = self.presetOptions.setdefault('velocity', {}).setdefault('pads', {})
+		if pad.curve is None:
+			padCurves.pop(pad.objectName(), None)
+		else:
+			padCurves[pad.objectName()] = pad.curve.toDict()
+		self.thruTimer.start()
 
+	# Velocity table of each device note, for the thru mode
+	def _noteCurves(self):
+		tables = [self.globalCurve().table] * 128
+		for pad in self._pads:
+			tables[pad.spNote.value()] = pad.velocityTable
+		return [None if t is curves.IDENTITY else t for t in tables]
+
+	def applyThru(self):
+		try:
+			self.io.setThru(ThruChain.compile(self.presetOptions.get('thru'), self._noteCurves()))
+		except PadException as e:
+			self.io.setThru(None)
+			self.warning(str(e))
+
+	def setThruEnabled(self, enabled):
+		self.presetOptions.setdefault('thru', {})['enabled'] = enabled
+		self.applyThru()
+
+	# Saved as JSON, binary or SysEx dump (FORMATS), by the selected filter
 	def saveProgram(self, event):
+		filename = ''
 		try:
-			filename = self._fileDialog(QFileDialog.AnyFile, QFileDialog.AcceptSave)
+			ext = '(*.' + self.midiname.lower() + ')'
+			filename, index = self._fileDialog(QFileDialog.AnyFile, QFileDialog.AcceptSave,
+				[self.midiname + ' program ' + ext, self.midiname + ' binary program ' + ext, 'SysEx (*.syx)'])
 			if filename != '':
-				with open(filename, 'w') as fp:
-					pgm = self.program()
-					json.dump([pgm[1:], self._ctlVars()], fp)
-					fp.close()
+				fmt = 'syx' if filename.lower().endswith('.syx') else FORMATS[index]
+				if fmt == 'syx' and not filename.lower().endswith('.syx'):
+					filename += '.syx'
+				pgm = self.program()
+				writePreset(filename, Preset(pgm[1:], self._ctlVars(), self.presetOptions), fmt, self.profile)
+				if fmt != 'syx':
+					self._addToLibrary(filename)
 		except Exception as e:
-			Debug.dbg('Unable to save ' + self.midiname + ' program in "' + filename + '": ' + str(e))
+			self.warning(tr('Unable to save the preset'), ' "' + filename + '": ' + str(e))
 
 	# return control names and keyboard keys
 	def _ctlVars(self):
 		pkn = []
-		for line in self.device['layout']['main']:
-			for control in line:
-				ctl = self._controls[control]
-				if isinstance(ctl, Pad):
-					pkn.append([control, ctl.cbName.lineEdit().text(), ctl.leKey.text(), ctl.level.defaultVelocity])
-				else:
-					pkn.append([control, ctl.cbName.lineEdit().text(), ctl.pot.value()])
+		for spec in self.profile.controls:
+			ctl = self._controls[spec.ctlid]
+			if spec.type == 'p':
+				pkn.append([spec.ctlid, ctl.cbName.lineEdit().text(), ctl.leKey.text(), ctl.level.defaultVelocity])
+			else:
+				pkn.append([spec.ctlid, ctl.cbName.lineEdit().text(), ctl.pot.value()])
 		return pkn
 
-	# slot called when receiving a midi message
-	def receivedMidi(self, msg):
-		m = msg.split(' ')
-		mtype = m[0]
-		if mtype == 'note_on':
-			self._midiNoteOn(m[1][8:], m[2][5:], m[3])
-		elif mtype == 'note_off':
-			self._midiNoteOff(m[1][8:], m[2][5:], m[3])
-		elif mtype == 'control_change':
-			self._midiControlChange(m[1][8:], m[2][8:], m[3][6:])
-		elif mtype == 'program_change':
-			self._midiProgramChange(m[1][8:], m[2][8:])
-		elif mtype == 'sysex':
-			self._midiSysex(m[1])
+	# slot called when receiving a midi message (a MidiEvent)
+	def receivedMidi(self, event):
+		status = event.status
+		kind = status & 0xF0
+		requested = self.uiFrame.requested
+		if kind == NOTE_ON:
+			if event.data2 > 0:
+				self._midiNoteOn(status & 0x0F, event.data1, event.data2)
+			else:
+				self._midiNoteOff(status & 0x0F, event.data1, 0)
+		elif kind == NOTE_OFF:
+			self._midiNoteOff(status & 0x0F, event.data1, event.data2)
+		elif kind == CONTROL_CHANGE:
+			self._midiControlChange(status & 0x0F, event.data1, event.data2)
+		elif kind == PROGRAM_CHANGE:
+			self._midiProgramChange(status & 0x0F, event.data1)
+		elif status == SYSEX:
+			self._midiSysex(event.data)
 		else:
-			self.warning('Received midi message of unknown type ' + mtype)
+			self.warning('Received midi message of unknown type ' + event.type)
+		if self.uiFrame.requested > requested: # a pad or a knob is updated
+			self.io.stats.controlUpdated()
 		if self.showMidiMessages:
-			self.statusbar.setText(self.in_symbol + ' ' + msg[0:-7]) # without "time=0"
+			self.uiFrame.setStatus()
+
+	# Show the last message received or sent in the status bar, at most once per frame
+	def showStatus(self):
+		seq = self.io.lastLogged()
+		if self.showMidiMessages and seq is not None:
+			log = self.io.log
+			symbol = self.in_symbol if log.direction(seq) == IN else self.out_symbol
+			self.statusbar.setText(symbol + ' ' + str(log.event(seq)))
 
 	def warning(self, msg, detail = ''):
 		self.lblAlert.setText(msg + '.')
 		Debug.dbg(msg + detail)
-		QTimer.singleShot(4000, lambda: self.lblAlert.setText(''))
-
-	def _padFromNote(self, note):
-		if not 'program' in self.io.pad:
-			return 0
-		if len(self.padNotes) == 0:
-			for i in range(0, len(self._program)):
-				ctlname = self._program[i]
-				if (ctlname[0:1] == 'p') and (ctlname[-5:] == '_note'):
-					val = self.getValue(ctlname)
-					self.padNotes.append(str(val))
-		if note in self.padNotes:
-			index = self.padNotes.index(note) + 1
-			if note in self.padNotes[index:]:
-				self.warning('Cannot retrieve pad when a note is set twice or more', ': ' + str(self.padNotes))
-			return index
+		QTimer.singleShot(4000, self.lblAlert.clear) # not called if the window is closed before
+
+	# Channel of a pad or a knob: its own channel, or the global one
+	def _channel(self, ctl):
+		return ctl.mc if ctl.mc < 16 else self.mc.currentIndex()
+
+	# Rebuild the whole MIDI map, when a channel changes or after a whole program was set.
+	# Unused program changes are often all the same, so only notes and knobs are worth a warning here.
+	def indexControls(self, warn = True):
+		if self.settingProgram:
+			return
+		self.midiMap.clear()
+		if self.io.thruChain is not None:
+			self.thruTimer.start()
+		for pad in self._pads:
+			self._indexPad(pad, False)
+		for knob in self._knobs:
+			self._indexKnob(knob, False)
+		if warn:
+			for (kind, channel, value), controls in self.midiMap.conflicts.items():
+				if kind != PROGRAM_CHANGE:
+					self._warnConflict(kind, value, controls)
+
+	def _indexPad(self, pad, warn = True):
+		if self.settingProgram:
+			return
+		channel = self._channel(pad)
+		if self.io.thruChain is not None:
+			self.thruTimer.start()
+		conflict = self.midiMap.set(NOTE_ON, pad, channel, pad.spNote.value())
+		if warn and len(conflict) > 0:
+			self._warnConflict(NOTE_ON, pad.spNote.value(), conflict)
+		conflict = self.midiMap.set(PROGRAM_CHANGE, pad, channel, pad.spPC.value())
+		if warn and len(conflict) > 0:
+			self._warnConflict(PROGRAM_CHANGE, pad.spPC.value(), conflict)
+
+	def _indexKnob(self, knob, warn = True):
+		if self.settingProgram:
+			return
+		conflict = self.midiMap.set(CONTROL_CHANGE, knob, self._channel(knob), knob.spCC.value())
+		if warn and len(conflict) > 0:
+			self._warnConflict(CONTROL_CHANGE, knob.spCC.value(), conflict)
+
+	def _warnConflict(self, kind, value, controls):
+		names = ', '.join([ctl.objectName() for ctl in controls])
+		if kind == NOTE_ON:
+			self.warning('Note ' + str(value) + ' is set twice or more', ': ' + names)
+		elif kind == PROGRAM_CHANGE:
+			self.warning('Program change ' + str(value) + ' is set twice or more', ': ' + names)
 		else:
-			return 0
-
-	def _padFromProgramChange(self, pc):
-		if len(self.padProgramChanges) == 0:
-			for i in range(0, len(self._program)):
-				try:
-					ctlname = self._program[i]
-				except:
-					raise PadException(ctlname + ' not found in program.')
-				if (ctlname[0:1] == 'p') and (ctlname[-3:] == '_pc'):
-					val = self.getValue(ctlname)
-					self.padProgramChanges.append(str(val))
-		if pc in self.padProgramChanges:
-			index = self.padProgramChanges.index(pc) + 1
-			if pc in self.padProgramChanges[index:]:
-				self.warning('Cannot retrieve pad when a program change is set twice or more', ': ' + str(self.padNotes))
-			return index
-		else:
-			return 0
-
-	def _kFromControlChange(self, cc):
-		if len(self.padControlChanges) == 0:
-			for i in range(0, len(self._program)):
-				try:
-					ctlname = self._program[i]
-				except:
-					raise PadException(ctlname + ' not found in program.')
-				if (ctlname[0:1] == 'k') and (ctlname[-3:] == '_cc'):
-					val = self.getValue(ctlname)
-					self.padControlChanges.append(str(val))
-		if cc in self.padControlChanges:
-			index = self.padControlChanges.index(cc) + 1
-			if cc in self.padControlChanges[index:]:
-				self.warning('Cannot retrieve knob when a control change is set twice or more', ': ' + str(self.padControlChanges))
-			return index
-		return 0
+			self.warning('Control change ' + str(value) + ' is set twice or more', ': ' + names)
 
 	def _midiNoteOn(self, channel, note, velocity):
-		padnum = self._padFromNote(note)
-		if padnum > 0:
-			pad = self.findChildren(QWidget, 'p' + str(padnum))
-			if len(pad) > 0:
-				pad[0].lightOn(velocity[9:])
+		pad = self.midiMap.find(NOTE_ON, channel, note)
+		if pad is not None:
+			self.uiFrame.lightOn(pad, pad.velocityTable[velocity])
 		else:
-			self.warning('Cannot retrieve pad from note ' + str(note), ' in ' + str(self.padNotes))
+			self.warning('Cannot retrieve pad from note ' + str(note))
 
 	def _midiNoteOff(self, channel, note, velocity):
-		padnum = self._padFromNote(note)
-		if padnum > 0:
-			pad = self.findChildren(QWidget, 'p' + str(padnum))
-			if len(pad) > 0:
-				pad[0].lightOff()
+		pad = self.midiMap.find(NOTE_ON, channel, note)
+		if pad is not None:
+			self.uiFrame.lightOff(pad)
 
 	def _midiControlChange(self, channel, control, value):
-		knum = self._kFromControlChange(control)
-		if knum > 0:
-			k = self.findChildren(QWidget, 'k' + str(knum))
-			if len(k) > 0:
-				k[0].setValue(value)
+		knob = self.midiMap.find(CONTROL_CHANGE, channel, control)
+		if knob is not None:
+			self.uiFrame.setKnob(knob, value)
 
 	def _midiProgramChange(self, channel, program):
-		padnum = self._padFromProgramChange(program)
-		if padnum > 0:
-			pad = self.findChildren(QWidget, 'p' + str(padnum))
-			if len(pad) > 0:
-				pad[0].lightOn(0)
-				QTimer.singleShot(200, lambda: pad[0].lightOff())
+		pad = self.midiMap.find(PROGRAM_CHANGE, channel, program)
+		if pad is not None:
+			self.uiFrame.lightOn(pad, 0)
+			QTimer.singleShot(200, lambda: self.uiFrame.lightOff(pad))
 		else:
-			self.warning('Cannot retrieve pad from program change with program' + str(self.padProgramChanges))
+			self.warning('Cannot retrieve pad from program change ' + str(program))
 
 	def _midiSysex(self, data):
-		data = data[6: -1].split(',')
-		Debug.dbg('Received ' + str(data))
-		self.setProgram(data[len(self.io.pad['get_program'].split(',')) - 1:])
-
-	# Set an UI value.
-	def setValueOld(self, varname, value):
-		try: 
-			if varname == 'pid':
-				if value != 0: # value is zero when loading a program file
-					self._controls[varname + str(value)].select()
-			elif '_' in varname and varname[varname.rindex('_') - len(varname) + 1:] in ['red1', 'red2', 'green1', 'green2', 'blue1', 'blue2']:
-				color = varname[varname.rindex('_') - len(varname) + 1:]
-				padid = varname[0:varname.index('_')]
-				onoff = varname[varname.index('_') + 1:varname.rindex('_')]
-				pad = self._controls[padid]
-				setattr(pad, onoff + '_' + color, value)
-				pad.lightOff()
+		if self.reader is not None and self.reader.handleSysex(data):
+			return
+		codec = self.profile.codec
+		if codec is None or not codec.matches(data):
+			Debug.dbg('Ignored SysEx message: ' + str(len(data)) + ' bytes')
+			return
+		try:
+			program = codec.decode(data)
+			self.setProgram(program)
+			self.io.rememberProgram(program[0], program)
+		except PadException as e:
+			self.warning(str(e))
+
+	def _programRead(self, pid, program):
+		self.io.rememberProgram(pid, program)
+		if pid == self._applyPid:
+			self._applyPid = None
+			try:
+				self.setProgram(program)
+			except PadException as e:
+				self.warning(str(e))
+
+	def _programsRead(self, programs, failed):
+		if len(failed) > 0:
+			self.warning(tr(u'No answer from the device for program', None) + ' ' + ', '.join(str(pid) for pid in sorted(failed)))
+
+	# Getter and setter of each program value, in program order, bound once to the controls
+	def _bindProgram(self):
+		self._getters = []
+		self._setters = []
+		for var in self.profile.vars:
+			if var.kind == devprofile.VAR_PID:
+				self._getters.append(lambda: 0)
+				self._setters.append(self._selectProgram)
+			elif var.kind == devprofile.VAR_SPIN:
+				spin = self._controls[var.name]
+				self._getters.append(spin.value)
+				self._setters.append(spin.setValue)
+			elif var.kind == devprofile.VAR_COMBO:
+				combo = self._controls[var.name]
+				self._getters.append(combo.currentIndex)
+				self._setters.append(combo.setCurrentIndex)
 			else:
-				ctl = self.findChildren(QWidget, varname)
-				if len(ctl) > 0:
-					ctl = ctl[0]
-					if isinstance(ctl, QSpinBox):
-						ctl.setValue(int(value))
-					elif isinstance(ctl, QComboBox):
-						ctl.setCurrentIndex(int(value))
-				else:
-					Debug.dbg('setValue: ' + varname + ' not found in ' + str(self))
-		except Exception as e:
-			Debug.dbg('Unable to set ' + varname + ' = ' + str(value) + ' ' + str(e))
+				pad = self._controls[var.ctlid]
+				self._getters.append(lambda pad = pad, attr = var.attr: getattr(pad, attr))
+				self._setters.append(lambda value, pad = pad, attr = var.attr: pad.setColorValue(attr, value))
+
+	def _selectProgram(self, pid):
+		if pid != 0: # pid is zero when loading a program file
+			self._controls['pid' + str(pid)].select()
 
 	# Set an UI value.
 	def setValue(self, varname, value):
-		try: 
-			if varname == 'pid':
-				if value != 0: # value is zero when loading a program file
-					self._controls[varname + str(value)].select()
-			else:
-				ctl = self._controls[varname]
-				if isinstance(ctl, QSpinBox):
-					ctl.setValue(int(value))
-				elif isinstance(ctl, QComboBox):
-					ctl.setCurrentIndex(int(value))
-				elif isinstance(ctl, Pad):
-					v = varname[len(ctl.pad_id) + 2:]
-					setattr(ctl, v, value)
-				else:
-					Debug.dbg('setValue: ' + varname + ' not found in ' + str(self))
+		try:
+			self._setters[self.profile.offsets[varname]](int(value))
 		except Exception as e:
 			Debug.dbg('Unable to set ' + varname + ' = ' + str(value) + ': ' + str(e))
 
 	def getValue(self, varname):
-		if varname not in  self._controls:
+		if varname not in self.profile.offsets:
 			return None
-		ctl = self._controls[varname]
-		if isinstance(ctl, QSpinBox):
-			val = ctl.value()
-		elif isinstance(ctl, QComboBox):
-			val = ctl.currentIndex()
-		elif isinstance(ctl, Pad):
-			val = getattr(ctl, varname[len(ctl.pad_id) + 2:])
-		return val
+		return self._getters[self.profile.offsets[varname]]()
 
 	def close(self):
 		self.io.close()
 
 	def program(self):
-		pgm = []
-		for i in range(0, len(self._program)):
-			varname = self._program[i]
-			val = self.getValue(varname)
-			pgm.append(val)
-		return(pgm)
-
-	def sendToRam(self):
+		return [get() for get in self._getters]
+
+	# Programs already on the device are not sent again, unless Shift is pressed or force is True
+	def sendToRam(self, force = False):
 		if self.io.isConnected:
-			self.io.sendProgram(0, self.program())
+			self._sendProgram(0, force)
 			self.unselPrograms()
 
-	def sendProgram(self, pid):
+	def sendProgram(self, pid, force = False):
 		if self.io.isConnected:
-			msg = self.io.sendProgram(pid, self.program())
-			self.statusbar.setText(self.out_symbol + ' ' + msg)
+			self._sendProgram(int(pid), force)
+
+	def _sendProgram(self, pid, force):
+		force = force or QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier == Qt.KeyboardModifier.ShiftModifier
+		try:
+			event = self.io.sendProgram(pid, self.program(), force)
+		except PadException as e:
+			self.warning(str(e))
+			return
+		if self.showMidiMessages:
+			if event is None:
+				self.statusbar.setText(tr(u'Program already on the device, not sent (Shift+click to send it anyway)', None))
+			else:
+				self.uiFrame.setStatus()
 
 	def setProgram(self, pgm):
-		if 'program' not in self.io.pad:
+		if not self.profile.hasProgram():
 			raise PadException('"program" not found in JSON file.')
-		if len(pgm) != len(self._program):
+		if len(pgm) != len(self._setters):
 			raise PadException('received a program with a different size than expected according to JSON file.')
 
 		self.settingProgram = True
 		self.unselPrograms()
-		for i in range(0, len(self._program)):
+		for i, value in enumerate(pgm):
 			try:
-				varname = self._program[i]
-				self.setValue(varname, int(pgm[i]))
+				self._setters[i](int(value))
 			except Exception as e:
-				raise PadException(varname + ' not found in program: ' + str(e))
+				Debug.dbg('Unable to set ' + self.profile.program[i] + ' = ' + str(value) + ': ' + str(e))
 		self.settingProgram = False
+		self.indexControls()
 
 
 	def getProgram(self, pid):
 		if self.io.isConnected:
 			self.unselPrograms()
-			self.io.getProgram(pid)
+			if self.reader is None:
+				self.io.getProgram(pid)
+			else:
+				self._applyPid = int(pid)
+				self.reader.read([pid])
+
+	# Read all the programs of the device at once, show the first one
+	def getAllPrograms(self):
+		if self.io.isConnected and self.reader is not None:
+			self.unselPrograms()
+			self._applyPid = 1
+			self.reader.read(range(1, self.nbPrograms + 1))
 
 	def unselPrograms(self):
 		if not self.settingProgram:
 			for p in range(1, self.nbPrograms + 1):
 				self._controls['pid' + str(p)].unsel()
-			self.padNotes = [] # reinit
-			self.padProgramChanges = []
-			self.padControlChanges = []
 
 	def plugged(self):
 		self.setEnabled(True)
@@ -665,81 +852,187 @@ QToolTip {
 				Fsettings.set(_DSARW, True)
 
 	def unplugged(self):
+		if self.reader is not None:
+			self.reader.cancel()
 		self.retranslateUi()
 		self.setEnabled(False)
 
 	def setEnabled(self, enabled : bool):
 		for pg in self.programs:
 			pg.setEnabled(enabled)
-		self.btnToRam.setEnabled(enabled)
+		if getattr(self, 'btnToRam', False):
+			self.btnToRam.setEnabled(enabled)
+		if getattr(self, 'btnGetAll', False):
+			self.btnGetAll.setEnabled(enabled and self.reader is not None)
 
 	def showOptionsDialog(self, event):
+		from pad.ui.options import FreepadOptionsWindow # not needed before
 		dialog = FreepadOptionsWindow(self)
 		dialog.setupUi(self.midiname)
 		dialog.exec()
 
+	def showMonitor(self, event = None):
+		if self.monitor is None:
+			from pad.ui.monitor import MidiMonitor # not needed before
+			self.monitor = MidiMonitor(self.io.log, self)
+			self.monitor.setupUi(self.midiname)
+		self.monitor.show()
+		self.monitor.raise_()
+
+	def showSequencer(self, event = None):
+		if self.sequencer is None:
+			from pad.ui.sequencer import SequencerWindow # not needed before
+			self.sequencer = SequencerWindow(self, self)
+			self.sequencer.setupUi(self.midiname)
+		self.sequencer.show()
+		self.sequencer.raise_()
+
+	def closeEvent(self, event):
+		self.stopMidi()
+		return QWidget.closeEvent(self, event)
+
+	# On close, and for the windows still open when the application quits.
+	# The sequencer and clock threads send through PadIO, they must not outlive the window;
+	# the clock sends STOP to the MIDI output. The recording is written before returning: its
+	# writer is a daemon thread, killed when the process exits.
+	# The ports shared with the other windows are released, the window is deleted on close.
+	def stopMidi(self):
+		if self.sequencer is not None:
+			self.sequencer.stop()
+		self.io.stopClock()
+		self.io.stopRecording(True)
+		self.io.close()
+
+	# Start or stop recording the MIDI messages of the device and of Freepad
+	def record(self, checked):
+		if not checked:
+			self.io.stopRecording()
+			return
+		filename, _ = QFileDialog.getSaveFileName(self, tr(u'Record MIDI', None),
+			str(Path(Fsettings.get('lastDir', str(Path.home()))).joinpath('freepad-' + self.midiname.lower().replace(' ', '') + '.mid')),
+			'MIDI (*.mid)')
+		if filename == '':
+			self.btnRecord.setChecked(False)
+			return
+		self.io.startRecording(filename)
+
+	def _recordingFinished(self, recorder):
+		if recorder.error is not None:
+			self.warning('Unable to record "' + recorder.filename + '"', ': ' + str(recorder.error))
+		elif recorder.dropped > 0:
+			self.warning(str(recorder.dropped) + ' messages not recorded')
+		Debug.dbg(str(recorder.recorded) + ' MIDI messages recorded in "' + recorder.filename + '"')
+
 	def _sendNoteOn(self, mc, note, velocity):
 		if mc == 16:
 			mc = self.mc.currentIndex()
-		msg = self.io.sendNoteOn(mc, note, velocity)
-		if self.showMidiMessages and msg is not None:
-			self.statusbar.setText(self.out_symbol + ' ' + msg)
+		event = self.io.sendNoteOn(mc, note, velocity)
+		if self.showMidiMessages and event is not None:
+			self.uiFrame.setStatus()
 
 	def _sendNoteOff(self, mc, note, velocity):
 		if mc == 16:
 			mc = self.mc.currentIndex()
-		msg = self.io.sendNoteOff(mc, note, velocity)
-		if self.showMidiMessages and msg is not None:
-			self.statusbar.setText(self.out_symbol + ' ' + msg)
+		event = self.io.sendNoteOff(mc, note, velocity)
+		if self.showMidiMessages and event is not None:
+			self.uiFrame.setStatus()
 
 	def _sendControlChange(self, mc, cc, val):
 		if mc == 16:
 			mc = self.mc.currentIndex()
-		msg = self.io.sendControlChange(mc, cc, val)
-		if self.showMidiMessages and msg is not None:
-			self.statusbar.setText(self.out_symbol + ' ' + msg)
+		event = self.io.sendControlChange(mc, cc, val)
+		if self.showMidiMessages and event is not None:
+			self.uiFrame.setStatus()
+
+	def _releaseControlChange(self, mc, cc):
+		self.io.releaseControlChange(self.mc.currentIndex() if mc == 16 else mc, cc)
+
+	# Messages sent later by PadIO (rate limited control changes)
+	def _sentMidi(self, event):
+		if self.showMidiMessages:
+			self.uiFrame.setStatus()
 
 	def _sendProgramChange(self, mc, pc):
 		if mc == 16:
 			mc = self.mc.currentIndex()
-		msg = self.io.sendProgramChange(mc, pc)
-		if self.showMidiMessages and msg is not None:
-			self.statusbar.setText(self.out_symbol + ' ' + msg)
+		event = self.io.sendProgramChange(mc, pc)
+		if self.showMidiMessages and event is not None:
+			self.uiFrame.setStatus()
 
 	def valueChanged(self, value):
 		self.unselPrograms()
 
 	def _padKeyChanged(self, pad_id, key):
 		self.padKeymap[pad_id] = key.lower()
+		self._indexKeys()
+
+	# Qt key codes of letters are the upper case ones
+	def _indexKeys(self):
+		keyPads = {}
+		for pad_id, key in self.padKeymap.items():
+			code = key.upper()
+			if len(code) == 1 and ord(code) < 256:
+				keyPads.setdefault(ord(code), []).append(self._controls['p' + pad_id])
+		self.keyPads = {code: tuple(pads) for code, pads in keyPads.items()}
 
 	def retranslateUi(self):
 		virtual = '' if self.io.isConnected else 'virtual '
 		self.setWindowTitle(tr(u'Freepad ' + virtual + self.midiname, None))
 		if getattr(self, 'btnToRam', False):
 			self.btnToRam.setText(tr(u'Send to RAM', None))
+		if getattr(self, 'btnGetAll', False):
+			self.btnGetAll.setText(tr(u'Get all programs', None))
+		if getattr(self, 'btnMonitor', False):
+			self.btnMonitor.setToolTip(tr(u'MIDI monitor', None))
+			self.btnRecord.setToolTip(tr(u'Record the MIDI messages to a MIDI file', None))
+			self.btnSequencer.setToolTip(tr(u'Step sequencer', None))
+			self.btnLibrary.setToolTip(tr(u'Preset library', None))
 		self.labelMC.setText(tr(u'Midi channel', None))
 
 	def keyPressEvent(self, event):
-		self.shiftPressed = (event.modifiers() & Qt.KeyboardModifier.ShiftModifier == Qt.KeyboardModifier.ShiftModifier)
-		self.ctrlPressed = (event.modifiers() & Qt.KeyboardModifier.ControlModifier == Qt.KeyboardModifier.ControlModifier)
-		if not self.shiftPressed and not self.ctrlPressed:
-			self._keyEvent(event, 'noteOn')
-		elif self.shiftPressed:
-			self._keyEvent(event, 'programChange')
+		if event.isAutoRepeat() or not self.hasFocus():
+			return
+		pads = self.keyPads.get(event.key())
+		if pads is None or event.key() in self.heldKeys:
+			return
+		modifiers = event.modifiers()
+		self.shiftPressed = (modifiers & Qt.KeyboardModifier.ShiftModifier == Qt.KeyboardModifier.ShiftModifier)
+		self.ctrlPressed = (modifiers & Qt.KeyboardModifier.ControlModifier == Qt.KeyboardModifier.ControlModifier)
+		self.heldKeys[event.key()] = pads
+		# all the MIDI first, then the lights at the next frame
+		if self.shiftPressed:
+			velocities = [pad.playProgram() for pad in pads]
 		elif self.ctrlPressed:
-			self._keyEvent(event, 'controlChange')
+			velocities = [pad.playControl() for pad in pads]
+		else:
+			velocities = [pad.playNote() for pad in pads]
+		for pad, velocity in zip(pads, velocities):
+			self.heldPads[pad] = self.heldPads.get(pad, 0) + 1
+			self.uiFrame.lightOn(pad, velocity)
 
 	def keyReleaseEvent(self, event):
-		self._keyEvent(event, 'noteOff')
-
-	def _keyEvent(self, event, callback):
-		if not event.isAutoRepeat() and self.hasFocus():
-			kc = event.key()
-			if kc in range(0, 256):
-				key = chr(kc).lower()
-				if key in self.padKeymap.values():
-					for pad_id in [pad_id for pad_id, k in self.padKeymap.items() if k == key]:
-						getattr(self._controls['p' + pad_id], callback)()
-
-
-
+		if not event.isAutoRepeat():
+			self._releaseKey(event.key())
+
+	# A pad played by several held keys is released with the last one
+	def _releaseKey(self, code):
+		pads = self.heldKeys.pop(code, None)
+		if pads is None:
+			return
+		released = []
+		for pad in pads:
+			held = self.heldPads.get(pad, 1) - 1
+			if held > 0:
+				self.heldPads[pad] = held
+			else:
+				self.heldPads.pop(pad, None)
+				pad.stopNote()
+				released.append(pad)
+		for pad in released:
+			self.uiFrame.lightOff(pad)
+
+	# Key releases are not received without the focus: release the held keys, no note stays on
+	def focusOutEvent(self, event):
+		for code in list(self.heldKeys):
+			self._releaseKey(code)
+		return QWidget.focusOutEvent(self, event)
@@ -0,0 +1,113 @@
+import os
+
+from qtpy.QtCore import Qt
+from qtpy.QtWidgets import QFileDialog, QHBoxLayout, QHeaderView, QLabel, QLineEdit, QPushButton, \
+	QSizePolicy, QSpacerItem, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWidget
+from qtpy.QtGui import QIcon
+
+from pad.path import FREEPAD_ICON_PATH
+from pad.freepad_settings import Fsettings
+from pad.ui.common import Creator, tr
+from pad.preset import bundledDir
+
+#
+# Preset library window of a FreepadWindow: searches the catalog of pad.library,
+# a click loads the preset. The directories are scanned again when the window is shown.
+# User directories are saved in the presetDirs setting, separated by os.pathsep.
+#
+
+class PresetLibraryWindow(QWidget, Creator):
+	def __init__(self, fpw, library, parent = None):
+		super().__init__(parent, Qt.WindowType.Window)
+		self.setWindowIcon(QIcon(FREEPAD_ICON_PATH))
+		self.fpw = fpw
+		self.library = library
+		self.model = fpw.profile.midiname
+
+	def setupUi(self, title):
+		self.title = title
+		self.resize(520, 420)
+		self.createObj(u'vLayout', QVBoxLayout(self))
+		self.createObj(u'hlSearch', QHBoxLayout())
+		self.createObj(u'leSearch', QLineEdit())
+		self.leSearch.setClearButtonEnabled(True)
+		self.hlSearch.addWidget(self.leSearch)
+		self.createObj(u'btnAddDir', QPushButton())
+		self.hlSearch.addWidget(self.btnAddDir)
+		self.createObj(u'btnRescan', QPushButton())
+		self.hlSearch.addWidget(self.btnRescan)
+		self.vLayout.addLayout(self.hlSearch)
+
+		self.createObj(u'twPresets', QTreeWidget())
+		self.twPresets.setColumnCount(3)
+		self.twPresets.setRootIsDecorated(False)
+		self.twPresets.setUniformRowHeights(True)
+		self.twPresets.header().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+		self.twPresets.setColumnWidth(0, 160)
+		self.twPresets.setColumnWidth(1, 200)
+		self.vLayout.addWidget(self.twPresets)
+
+		self.createObj(u'hlStatus', QHBoxLayout())
+		self.createObj(u'lblCount', QLabel())
+		self.hlStatus.addWidget(self.lblCount)
+		self.hlStatus.addItem(QSpacerItem(1, 1, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
+		self.vLayout.addLayout(self.hlStatus)
+
+		self.retranslateUi()
+		self.leSearch.textChanged.connect(self.search)
+		self.btnAddDir.clicked.connect(self.addDirectory)
+		self.btnRescan.clicked.connect(self.rescan)
+		self.twPresets.itemClicked.connect(self.load)
+		self.leSearch.returnPressed.connect(self.loadFirst)
+
+	def retranslateUi(self):
+		self.setWindowTitle(tr(u'Freepad ' + self.title + ' presets', None))
+		self.leSearch.setPlaceholderText(tr(u'Search a name, a note (36, C2) or a control change (cc74)', None))
+		self.btnAddDir.setText(tr(u'Add a folder', None))
+		self.btnRescan.setText(tr(u'Rescan', None))
+		self.twPresets.setHeaderLabels([tr(u'Preset', None), tr(u'Matches', None), tr(u'Folder', None)])
+
+	@staticmethod
+	def userDirectories():
+		return [d for d in str(Fsettings.get('presetDirs', '')).split(os.pathsep) if d != '']
+
+	def roots(self):
+		return [str(bundledDir(self.model))] + self.userDirectories()
+
+	def addDirectory(self):
+		path = QFileDialog.getExistingDirectory(self, tr(u'Presets folder', None), Fsettings.get('lastDir', os.getenv('HOME')))
+		if path == '':
+			return
+		path = os.path.abspath(path)
+		dirs = self.userDirectories()
+		if path not in dirs:
+			Fsettings.set('presetDirs', os.pathsep.join(dirs + [path]))
+		self.rescan()
+
+	def rescan(self):
+		self.library.scan(self.fpw.profile, self.roots())
+		self.search()
+
+	def search(self):
+		results = self.library.search(self.model, self.leSearch.text())
+		self.twPresets.clear()
+		items = []
+		for path, name, matches in results:
+			item = QTreeWidgetItem([name, ', '.join(matches), os.path.dirname(path)])
+			item.setData(0, Qt.ItemDataRole.UserRole, path)
+			item.setToolTip(2, path)
+			items.append(item)
+		self.twPresets.addTopLevelItems(items)
+		self.lblCount.setText(tr(u'{} presets', None).format(len(items)))
+
+	def load(self, item, column = 0):
+		self.fpw.openPreset(item.data(0, Qt.ItemDataRole.UserRole))
+
+	def loadFirst(self):
+		if self.twPresets.topLevelItemCount() > 0:
+			self.load(self.twPresets.topLevelItem(0))
+
+	def showEvent(self, event):
+		self.rescan()
+		self.leSearch.setFocus()
+		return QWidget.showEvent(self, event)
@@ -0,0 +1,60 @@
+#
+# Reverse index from MIDI values (note, control change, program change) to the controls using them.
+# Updated control by control when a value or a channel is edited, so incoming messages
+# find their control with a dict lookup. Values set twice or more are detected here.
+#
+class MidiMap(object):
+	def __init__(self):
+		self._byChannel = {} # (kind, channel, value) -> [controls]
+		self._byValue = {} # (kind, value) -> [controls]
+		self._keys = {} # (kind, control) -> (channel, value)
+		self.conflicts = {} # (kind, channel, value) -> [controls], values set twice or more
+
+	def clear(self):
+		self._byChannel.clear()
+		self._byValue.clear()
+		self._keys.clear()
+		self.conflicts.clear()
+
+	# Index control for kind. Return the controls sharing the same channel and value,
+	# when this change creates a conflict.
+	def set(self, kind, control, channel, value):
+		key = self._keys.get((kind, control))
+		if key == (channel, value):
+			return []
+		if key is not None:
+			self.remove(kind, control)
+		self._keys[(kind, control)] = (channel, value)
+		self._byValue.setdefault((kind, value), []).append(control)
+		controls = self._byChannel.setdefault((kind, channel, value), [])
+		controls.append(control)
+		if len(controls) > 1:
+			self.conflicts[(kind, channel, value)] = controls
+			return controls
+		return []
+
+	def remove(self, kind, control):
+		key = self._keys.pop((kind, control), None)
+		if key is None:
+			return
+		channel, value = key
+		controls = self._byValue[(kind, value)]
+		controls.remove(control)
+		if len(controls) == 0:
+			del self._byValue[(kind, value)]
+		controls = self._byChannel[(kind, channel, value)]
+		controls.remove(control)
+		if len(controls) == 0:
+			del self._byChannel[(kind, channel, value)]
+		if len(controls) < 2:
+			self.conflicts.pop((kind, channel, value), None)
+
+	# First control using value on channel. When no control matches the channel,
+	# fall back to the value alone: the device may not send on the channel shown in the UI.
+	def find(self, kind, channel, value):
+		controls = self._byChannel.get((kind, channel, value))
+		if controls is None:
+			controls = self._byValue.get((kind, value))
+			if controls is None:
+				return None
+		return controls[0]
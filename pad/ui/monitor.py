@@ -0,0 +1,264 @@
+import time
+from collections import deque
+
+from qtpy.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer
+from qtpy.QtWidgets import QCheckBox, QComboBox, QHBoxLayout, QHeaderView, QPushButton, \
+	QSizePolicy, QSpacerItem, QTableView, QVBoxLayout, QWidget
+from qtpy.QtGui import QIcon
+
+from pad.path import FREEPAD_ICON_PATH
+from pad.ui.common import Creator, tr
+from pad.midilog import IN, OUT
+from pad.midievent import NOTE_ON, NOTE_OFF, POLYTOUCH, CONTROL_CHANGE, PROGRAM_CHANGE, SYSEX
+
+#
+# MIDI monitor: a table of the MidiLog of the hub, refreshed a few times per second.
+# The model only keeps the sequence numbers of the rows (none without filter), the
+# cells are formatted when the view asks for them, that is for the visible rows only.
+#
+
+COLUMNS = ['time', 'direction', 'port', 'type', 'data']
+
+# type filter -> message kinds, None for all
+TYPE_FILTERS = [
+	('all', None),
+	('notes', (NOTE_ON, NOTE_OFF, POLYTOUCH)),
+	('control_change', (CONTROL_CHANGE,)),
+	('program_change', (PROGRAM_CHANGE,)),
+	('sysex', (SYSEX,)),
+	('other', ())
+]
+_FILTERED_KINDS = (NOTE_ON, NOTE_OFF, POLYTOUCH, CONTROL_CHANGE, PROGRAM_CHANGE, SYSEX)
+
+class MidiLogModel(QAbstractTableModel):
+	def __init__(self, log, parent = None):
+		super().__init__(parent)
+		self.log = log
+		self.direction = None # IN, OUT or None for both
+		self.port = None # port number or None
+		self.kinds = None # message kinds, () for the other kinds, None for all
+		self.channel = None # 0..15 or None
+		self._rows = None # seq of each row, None without filter
+		self._first = log.first() # rows are the records from _first to _end without filter
+		self._end = log.total
+		self._clears = log.clears # the rows are gone when the log is cleared, by any monitor
+		self._headers = []
+
+	def setHeaders(self, headers):
+		self._headers = headers
+		self.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, len(COLUMNS) - 1)
+
+	def filtered(self):
+		return self.direction is not None or self.port is not None or self.kinds is not None or self.channel is not None
+
+	def accepts(self, seq):
+		direction, port, status = self.log.key(seq)
+		if self.direction is not None and direction != self.direction:
+			return False
+		if self.port is not None and port != self.port:
+			return False
+		kind = status & 0xF0 if status < 0xF0 else status
+		if self.kinds is not None:
+			if len(self.kinds) == 0:
+				if kind in _FILTERED_KINDS:
+					return False
+			elif kind not in self.kinds:
+				return False
+		if self.channel is not None and (status >= 0xF0 or status & 0x0F != self.channel):
+			return False
+		return True
+
+	def setFilter(self, direction = None, port = None, kinds = None, channel = None):
+		self.beginResetModel()
+		self.direction = direction
+		self.port = port
+		self.kinds = kinds
+		self.channel = channel
+		self._clears = self.log.clears
+		self._first = self.log.first()
+		self._end = self.log.total
+		if self.filtered():
+			self._rows = deque((seq for seq in range(self._first, self._end) if self.accepts(seq)), self.log.capacity)
+		else:
+			self._rows = None
+		self.endResetModel()
+
+	def clear(self):
+		self.log.clear()
+		self.setFilter(self.direction, self.port, self.kinds, self.channel)
+
+	# Add the new records, drop the overwritten ones
+	def refresh(self):
+		log = self.log
+		if log.clears != self._clears:
+			self.setFilter(self.direction, self.port, self.kinds, self.channel)
+			return
+		first = log.first()
+		end = log.total
+		if self._rows is None:
+			dropped = min(first, self._end) - self._first
+			if dropped > 0:
+				self.beginRemoveRows(QModelIndex(), 0, dropped - 1)
+				self._first += dropped
+				self.endRemoveRows()
+			if first > self._first: # no row left, and records not shown overwritten
+				self._first = self._end = first
+			if end > self._end:
+				self.beginInsertRows(QModelIndex(), self._end - self._first, end - self._first - 1)
+				self._end = end
+				self.endInsertRows()
+			return
+		rows = self._rows
+		dropped = 0
+		while dropped < len(rows) and rows[dropped] < first:
+			dropped += 1
+		if dropped > 0:
+			self.beginRemoveRows(QModelIndex(), 0, dropped - 1)
+			for i in range(dropped):
+				rows.popleft()
+			self.endRemoveRows()
+		added = [seq for seq in range(max(self._end, first), end) if self.accepts(seq)]
+		self._first = first
+		self._end = end
+		if len(added) > 0:
+			self.beginInsertRows(QModelIndex(), len(rows), len(rows) + len(added) - 1)
+			rows.extend(added)
+			self.endInsertRows()
+
+	def rowCount(self, parent = QModelIndex()):
+		if parent.isValid():
+			return 0
+		return self._end - self._first if self._rows is None else len(self._rows)
+
+	def columnCount(self, parent = QModelIndex()):
+		return 0 if parent.isValid() else len(COLUMNS)
+
+	def headerData(self, section, orientation, role = Qt.ItemDataRole.DisplayRole):
+		if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal and section < len(self._headers):
+			return self._headers[section]
+		return None
+
+	def data(self, index, role = Qt.ItemDataRole.DisplayRole):
+		if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+			return None
+		seq = self._first + index.row() if self._rows is None else self._rows[index.row()]
+		log = self.log
+		try:
+			column = index.column()
+			if column == 0:
+				t = log.wallTime(seq)
+				return time.strftime('%H:%M:%S', time.localtime(t)) + '.{:03d}'.format(int(1000 * (t % 1)))
+			if column == 1:
+				return '-\u25B6' if log.direction(seq) == IN else '\u25C0-'
+			if column == 2:
+				return log.portName(seq)
+			event = log.event(seq)
+			if column == 3:
+				return event.type
+			return ' '.join('{:02X}'.format(b) for b in event.bytes())
+		except IndexError: # overwritten since the last refresh
+			return ''
+
+class MidiMonitor(QWidget, Creator):
+	def __init__(self, log, parent = None):
+		super().__init__(parent, Qt.WindowType.Window)
+		self.setWindowIcon(QIcon(FREEPAD_ICON_PATH))
+		self.log = log
+		self.model = MidiLogModel(log, self)
+		self.timer = QTimer(self)
+		self.timer.setInterval(100)
+		self.timer.timeout.connect(self.refresh)
+
+	def setupUi(self, title):
+		self.title = title
+		self.resize(640, 400)
+		self.createObj(u'vLayout', QVBoxLayout(self))
+		self.createObj(u'hlFilters', QHBoxLayout())
+		self.createObj(u'cbDirection', QComboBox())
+		for d in (None, IN, OUT):
+			self.cbDirection.addItem('', d)
+		self.createObj(u'cbPort', QComboBox())
+		self.cbPort.addItem('', None)
+		self.createObj(u'cbType', QComboBox())
+		for name, kinds in TYPE_FILTERS:
+			self.cbType.addItem('', name)
+		self.createObj(u'cbChannel', QComboBox())
+		self.cbChannel.addItem('', None)
+		for ch in range(16):
+			self.cbChannel.addItem(str(ch + 1), ch)
+		self.createObj(u'cbPause', QCheckBox())
+		self.createObj(u'btnClear', QPushButton())
+		for w in (self.cbDirection, self.cbPort, self.cbType, self.cbChannel):
+			self.hlFilters.addWidget(w)
+		self.hlFilters.addItem(QSpacerItem(1, 1, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
+		self.hlFilters.addWidget(self.cbPause)
+		self.hlFilters.addWidget(self.btnClear)
+		self.vLayout.addLayout(self.hlFilters)
+
+		self.createObj(u'tvLog', QTableView())
+		self.tvLog.setModel(self.model)
+		self.tvLog.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+		self.tvLog.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+		self.tvLog.setWordWrap(False)
+		# fixed row heights: the view never measures the rows
+		vh = self.tvLog.verticalHeader()
+		vh.setVisible(False)
+		vh.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+		vh.setDefaultSectionSize(self.fontMetrics().height() + 4)
+		hh = self.tvLog.horizontalHeader()
+		hh.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+		hh.setStretchLastSection(True)
+		for column, width in enumerate([100, 40, 140, 110]):
+			self.tvLog.setColumnWidth(column, width)
+		self.vLayout.addWidget(self.tvLog)
+
+		self.retranslateUi()
+		self.cbDirection.currentIndexChanged.connect(self.filterChanged)
+		self.cbPort.currentIndexChanged.connect(self.filterChanged)
+		self.cbType.currentIndexChanged.connect(self.filterChanged)
+		self.cbChannel.currentIndexChanged.connect(self.filterChanged)
+		self.btnClear.clicked.connect(self.model.clear)
+		self._updatePorts()
+
+	def retranslateUi(self):
+		self.setWindowTitle(tr(u'Freepad ' + self.title + ' MIDI monitor', None))
+		self.cbDirection.setItemText(0, tr(u'In and out', None))
+		self.cbDirection.setItemText(1, tr(u'In', None))
+		self.cbDirection.setItemText(2, tr(u'Out', None))
+		self.cbPort.setItemText(0, tr(u'All ports', None))
+		for i, text in enumerate([tr(u'All types', None), tr(u'Notes', None), tr(u'Control changes', None),
+				tr(u'Program changes', None), tr(u'SysEx', None), tr(u'Other', None)]):
+			self.cbType.setItemText(i, text)
+		self.cbChannel.setItemText(0, tr(u'All channels', None))
+		self.cbPause.setText(tr(u'Pause', None))
+		self.btnClear.setText(tr(u'Clear', None))
+		self.model.setHeaders([tr(u'Time', None), '', tr(u'Port', None), tr(u'Type', None), tr(u'Data', None)])
+
+	def _updatePorts(self):
+		for n in range(self.cbPort.count() - 1, len(self.log.ports)):
+			self.cbPort.addItem(self.log.ports[n], n)
+
+	def filterChanged(self):
+		self.model.setFilter(self.cbDirection.currentData(), self.cbPort.currentData(),
+			TYPE_FILTERS[self.cbType.currentIndex()][1], self.cbChannel.currentData())
+		self.tvLog.scrollToBottom()
+
+	def refresh(self):
+		self._updatePorts()
+		if self.cbPause.isChecked():
+			return
+		bar = self.tvLog.verticalScrollBar()
+		follow = bar.value() == bar.maximum()
+		self.model.refresh()
+		if follow:
+			self.tvLog.scrollToBottom()
+
+	def showEvent(self, event):
+		self.model.setFilter(self.model.direction, self.model.port, self.model.kinds, self.model.channel)
+		self.timer.start()
+		self.tvLog.scrollToBottom()
+		return QWidget.showEvent(self, event)
+
+	def hideEvent(self, event):
+		self.timer.stop()
+		return QWidget.hideEvent(self, event)
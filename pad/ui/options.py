@@ -1,16 +1,18 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
 
-from qtpy.QtCore import QDir, QMetaObject
-from qtpy.QtWidgets import QCheckBox, QComboBox, QDialog, QFileDialog, QFormLayout, QGroupBox, \
-	QHBoxLayout, QLabel, QLineEdit, QSizePolicy, QSpacerItem, QTabWidget, QTextBrowser, \
-	QRadioButton, QPushButton, QVBoxLayout, QStyle, QWidget
+from qtpy.QtCore import QDir, QMetaObject, QTimer
+from qtpy.QtWidgets import QCheckBox, QComboBox, QDialog, QDoubleSpinBox, QFileDialog, QFormLayout, QGroupBox, \
+	QHBoxLayout, QHeaderView, QLabel, QLineEdit, QSizePolicy, QSpacerItem, QSpinBox, QTableWidget, QTableWidgetItem, \
+	QTabWidget, QTextBrowser, QRadioButton, QPushButton, QVBoxLayout, QStyle, QWidget
 from qtpy.QtGui import QDesktopServices, QIcon
 
 from pad.path import FREEPAD_PATH, FREEPAD_ICON_PATH
 from pad.freepad_settings import Fsettings
-from pad.ui.common import Creator, Debug, tr
-from pad.padio import Mid
+from pad.ui.common import Creator, Debug, PadException, tr
+from pad.padio import MIDI_INPUT_MODES
+from pad.ratelimit import formatIntervals, parseIntervals
+from pad.velocity import CURVES, VelocityCurve, formatPoints, parsePoints
 
 class FreepadOptionsWindow(QDialog, Creator):
 	def __init__(self, fpw, parent = None):
@@ -92,7 +94,7 @@ class FreepadOptionsWindow(QDialog, Creator):
 		self.createObj(u'lblMidiOutputPort', QLabel())
 		self.createObj('cbMidiOutputPort', QComboBox())
 		self.cbMidiOutputPort.addItem(MIDI_OUTPUT_PORT)
-		for port in Mid.get_output_names():
+		for port in self.fpw.io.monitor.outputNames:
 			self.cbMidiOutputPort.addItem(port)
 		self.cbMidiOutputPort.setCurrentText(Fsettings.get('midiOutputPort', MIDI_OUTPUT_PORT))
 		self.cbMidiOutputPort.currentTextChanged.connect(self.setMidiOutputPort)
@@ -100,6 +102,78 @@ class FreepadOptionsWindow(QDialog, Creator):
 		self.formLayout.setWidget(2, QFormLayout.LabelRole, self.lblMidiOutputPort)
 		self.formLayout.setWidget(2, QFormLayout.FieldRole, self.cbMidiOutputPort)
 
+		self.createObj(u'lblMidiInputMode', QLabel())
+		self.createObj('cbMidiInputMode', QComboBox())
+		for mode in MIDI_INPUT_MODES:
+			self.cbMidiInputMode.addItem('', mode)
+		self.cbMidiInputMode.setCurrentIndex(MIDI_INPUT_MODES.index(self.fpw.io.inputMode))
+		self.cbMidiInputMode.currentIndexChanged.connect(self.setMidiInputMode)
+		self.formLayout.setWidget(3, QFormLayout.LabelRole, self.lblMidiInputMode)
+		self.formLayout.setWidget(3, QFormLayout.FieldRole, self.cbMidiInputMode)
+
+		# Global velocity curve, saved with the preset
+		curve = self.fpw.globalCurve()
+		self.createObj(u'lblVelocityCurve', QLabel())
+		self.createObj(u'hlVelocityCurve', QHBoxLayout())
+		self.createObj('cbVelocityCurve', QComboBox())
+		for name in CURVES:
+			self.cbVelocityCurve.addItem('', name)
+		self.cbVelocityCurve.setCurrentIndex(CURVES.index(curve.curve))
+		self.createObj(u'leVelocityCurve', QLineEdit())
+		self._showCurveParameter(curve)
+		self.hlVelocityCurve.addWidget(self.cbVelocityCurve)
+		self.hlVelocityCurve.addWidget(self.leVelocityCurve)
+		self.hlVelocityCurve.setStretch(1, 1)
+		self.cbVelocityCurve.currentIndexChanged.connect(self.velocityCurveChanged)
+		self.leVelocityCurve.editingFinished.connect(self.setVelocityCurve)
+		self.formLayout.setWidget(4, QFormLayout.LabelRole, self.lblVelocityCurve)
+		self.formLayout.setLayout(4, QFormLayout.FieldRole, self.hlVelocityCurve)
+
+		# Control change output rate limit
+		limiter = self.fpw.io.ccLimiter
+		self.createObj(u'lblCcRate', QLabel())
+		self.createObj(u'hlCcRate', QHBoxLayout())
+		self.createObj('spCcRate', QSpinBox())
+		self.spCcRate.setRange(0, 1000)
+		self.spCcRate.setValue(limiter.interval)
+		self.createObj('spCcSmoothing', QSpinBox())
+		self.spCcSmoothing.setRange(0, 5000)
+		self.spCcSmoothing.setValue(limiter.smoothing)
+		self.createObj(u'leCcRates', QLineEdit())
+		self.leCcRates.setText(formatIntervals(limiter.intervals))
+		self.hlCcRate.addWidget(self.spCcRate)
+		self.hlCcRate.addWidget(self.spCcSmoothing)
+		self.hlCcRate.addWidget(self.leCcRates)
+		self.hlCcRate.setStretch(2, 1)
+		self.spCcRate.valueChanged.connect(self.setCcRateLimit)
+		self.spCcSmoothing.valueChanged.connect(self.setCcRateLimit)
+		self.leCcRates.editingFinished.connect(self.setCcRateLimit)
+		self.formLayout.setWidget(5, QFormLayout.LabelRole, self.lblCcRate)
+		self.formLayout.setLayout(5, QFormLayout.FieldRole, self.hlCcRate)
+
+		# MIDI clock sent to the MIDI output, and tempo of the clock received from the device
+		clock = self.fpw.io.clockOut
+		self.createObj(u'lblClock', QLabel())
+		self.createObj(u'hlClock', QHBoxLayout())
+		self.createObj(u'cbClockOut', QCheckBox())
+		self.cbClockOut.setChecked(clock.running())
+		self.createObj('spClockTempo', QDoubleSpinBox())
+		self.spClockTempo.setRange(20.0, 300.0)
+		self.spClockTempo.setDecimals(1)
+		self.spClockTempo.setValue(float(Fsettings.get('clockTempo', clock.tempo)))
+		self.createObj(u'lblClockIn', QLabel())
+		self.hlClock.addWidget(self.cbClockOut)
+		self.hlClock.addWidget(self.spClockTempo)
+		self.hlClock.addWidget(self.lblClockIn)
+		self.hlClock.setStretch(2, 1)
+		self.cbClockOut.toggled.connect(self.setClockOut)
+		self.spClockTempo.valueChanged.connect(self.setClockTempo)
+		self.formLayout.setWidget(6, QFormLayout.LabelRole, self.lblClock)
+		self.formLayout.setLayout(6, QFormLayout.FieldRole, self.hlClock)
+		self.clockTimer = QTimer(self)
+		self.clockTimer.setInterval(500)
+		self.clockTimer.timeout.connect(self.refreshClock)
+
 		self.vLayoutOptions.addLayout(self.formLayout)
 
 		self.cbToolbar = QCheckBox(self.tabOptions)
@@ -108,11 +182,17 @@ class FreepadOptionsWindow(QDialog, Creator):
 		self.cbToolbar.stateChanged.connect(self.setShowMidiMessages)
 		self.vLayoutOptions.addWidget(self.cbToolbar)
 
+		self.createObj(u'cbThru', QCheckBox(self.tabOptions))
+		self.cbThru.setChecked(bool(self.fpw.presetOptions.get('thru', {}).get('enabled', False)))
+		self.cbThru.toggled.connect(self.fpw.setThruEnabled)
+		self.vLayoutOptions.addWidget(self.cbThru)
+
 		self.verticalSpacer = QSpacerItem(1, 1, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding)
 		
 		self.vLayoutOptions.addItem(self.verticalSpacer)
 		
 		self.tabWidget.addTab(self.tabOptions, "")
+		self.setupDiagnostics()
 		self.tabHelp = QWidget()
 		self.tabHelp.setObjectName(u"tabHelp")
 		self.vLayoutHelp = QVBoxLayout(self.tabHelp)
@@ -125,13 +205,15 @@ class FreepadOptionsWindow(QDialog, Creator):
 		self.tHelp.setSearchPaths([str(FREEPAD_PATH.joinpath('help'))])
 		self.vLayoutHelp.addWidget(self.tHelp)
 		self.tabWidget.addTab(self.tabHelp, "")
-		self.loadHelp()
+		self.helpLoaded = False # loaded when the help tab is shown
 		
 		self.vLayout.addWidget(self.tabWidget)
 
 		self.retranslateUi()
 		
 		self.tabWidget.setCurrentIndex(0)
+		self.refreshClock()
+		self.clockTimer.start()
 
 		self.leDrums.textChanged.connect(lambda t: Fsettings.set('lastkits', t))
 		self.leControls.textChanged.connect(lambda t: Fsettings.set('lastcontrols', t))
@@ -139,6 +221,7 @@ class FreepadOptionsWindow(QDialog, Creator):
 		self.btnControls.clicked.connect(lambda e: self.loadKit(u'controls'))
 		self.rbDoremi.toggled.connect(self.setNoteStyle)
 		self.tHelp.anchorClicked.connect(self.openLinkInBrowser)
+		self.tabWidget.currentChanged.connect(self.tabChanged)
 		QMetaObject.connectSlotsByName(self)
 	# setupUi
 
@@ -149,25 +232,111 @@ class FreepadOptionsWindow(QDialog, Creator):
 		self.rbDoremi.setText(tr(u"Do Ré Mi", None))
 		self.rbCDE.setText(tr(u"C D E ", None))
 		self.cbToolbar.setText(tr(u"&Show midi messages", None))
+		self.cbThru.setText(tr(u"Midi &thru: forward the device messages to the midi output (saved with the preset)", None))
 		self.lblMidiOutputPort.setText(tr('Midi output'))
+		self.lblMidiInputMode.setText(tr('Midi input'))
+		self.lblVelocityCurve.setText(tr('Velocity curve'))
+		for i, text in enumerate([tr('Linear'), tr('Logarithmic'), tr('Exponential'), tr('Fixed'), tr('Custom')]):
+			self.cbVelocityCurve.setItemText(i, text)
+		self.leVelocityCurve.setPlaceholderText(tr('strength, velocity or input:output points'))
+		self.lblCcRate.setText(tr('Control change rate'))
+		self.spCcRate.setSpecialValueText(tr('No limit'))
+		self.spCcRate.setSuffix(tr(' ms'))
+		self.spCcRate.setToolTip(tr('Minimum time between two values of a control, the latest value is sent'))
+		self.spCcSmoothing.setSpecialValueText(tr('No smoothing'))
+		self.spCcSmoothing.setSuffix(tr(' ms'))
+		self.spCcSmoothing.setToolTip(tr('Time to move to the latest value, by steps'))
+		self.leCcRates.setPlaceholderText(tr('per control, cc:ms cc:ms...'))
+		self.lblClock.setText(tr('Midi clock'))
+		self.cbClockOut.setText(tr('Send'))
+		self.spClockTempo.setSuffix(tr(' bpm'))
+		self.cbMidiInputMode.setItemText(0, tr('Immediate (MIDI thread)'))
+		self.cbMidiInputMode.setItemText(1, tr('Polling (8 ms)'))
 		self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabOptions), tr(u"Options", None))
+		self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabDiagnostics), tr(u"Diagnostics", None))
 		self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabHelp), tr(u"Help", None))
+		self.tDiag.setHorizontalHeaderLabels([tr(u"Section", None), tr(u"Name", None), tr(u"Count", None),
+			tr(u"Mean (ms)", None), tr(u"p50 (ms)", None), tr(u"p99 (ms)", None), tr(u"Max (ms)", None)])
+		self.btnDiagReset.setText(tr(u"Reset", None))
+		self.btnDiagExport.setText(tr(u"Export CSV", None))
 		# retranslateUi
 
 	def setNoteStyle(self, note_style):
 		Fsettings.set('noteStyle', int(note_style))
-		for line in self.fpw.device['layout']['main']:
-			for ctl in line:
-				if ctl[0:1] != 'p' or ctl == 'pid':
-					continue
-				pad = self.fpw._controls[ctl]
-				pad.noteStyle = note_style
-				pad.noteChanged(pad.spNote.value())
+		for pad in self.fpw._pads:
+			pad.noteStyle = note_style
+			pad.noteChanged(pad.spNote.value())
 
 	def setMidiOutputPort(self, port_name):
 		Fsettings.set('midiOutputPort', port_name)
 		self.fpw.io.setMidiOutPort(port_name)
 
+	def setMidiInputMode(self, index):
+		mode = MIDI_INPUT_MODES[index]
+		Fsettings.set('midiInputMode', mode)
+		self.fpw.io.setInputMode(mode)
+
+	# Parameter of the curve: strength of log and exp, velocity of fixed, points of custom
+	def _showCurveParameter(self, curve):
+		if curve.curve in ('log', 'exp'):
+			self.leVelocityCurve.setText(str(curve.amount))
+		elif curve.curve == 'fixed':
+			self.leVelocityCurve.setText(str(curve.value))
+		elif curve.curve == 'custom':
+			self.leVelocityCurve.setText(formatPoints(curve.points))
+		else:
+			self.leVelocityCurve.setText('')
+		self.leVelocityCurve.setEnabled(curve.curve != 'linear')
+
+	def velocityCurveChanged(self, index):
+		self._showCurveParameter(VelocityCurve(CURVES[index]))
+		self.setVelocityCurve()
+
+	def setVelocityCurve(self):
+		name = self.cbVelocityCurve.currentData()
+		text = self.leVelocityCurve.text().strip()
+		try:
+			if name in ('log', 'exp'):
+				curve = VelocityCurve(name, amount = float(text))
+			elif name == 'fixed':
+				curve = VelocityCurve(name, value = int(text))
+			elif name == 'custom':
+				curve = VelocityCurve(name, points = parsePoints(text))
+			else:
+				curve = VelocityCurve(name)
+		except (ValueError, PadException) as e:
+			self.fpw.warning(tr('Bad velocity curve'), ': ' + str(e))
+			return
+		self.fpw.setGlobalCurve(curve)
+
+	def setCcRateLimit(self):
+		try:
+			intervals = parseIntervals(self.leCcRates.text())
+		except ValueError as e:
+			self.fpw.warning(tr('Bad control change rates'), ': ' + str(e))
+			return
+		text = formatIntervals(intervals)
+		Fsettings.set('ccRateLimit', self.spCcRate.value())
+		Fsettings.set('ccSmoothing', self.spCcSmoothing.value())
+		Fsettings.set('ccRateLimits', text)
+		self.fpw.io.setCcRateLimit(self.spCcRate.value(), self.spCcSmoothing.value(), text)
+
+	def setClockOut(self, checked):
+		if not checked:
+			self.fpw.io.stopClock()
+		elif not self.fpw.io.startClock(self.spClockTempo.value()):
+			self.fpw.warning(tr('No MIDI output for the clock'))
+			self.cbClockOut.setChecked(False)
+
+	def setClockTempo(self, tempo):
+		Fsettings.set('clockTempo', tempo)
+		self.fpw.io.clockOut.tempo = tempo
+
+	# Tempo of the clock received, while the options tab is shown
+	def refreshClock(self):
+		bpm = self.fpw.io.stats.clock.bpm()
+		self.lblClockIn.setText(tr('Received') + ': ' + ('{:.1f}'.format(bpm) + tr(' bpm') if bpm > 0 else tr('none')))
+
 	def setShowMidiMessages(self, val):
 		value = (val == 2)
 		Fsettings.set('showMidiMessages', str(value))
@@ -204,7 +373,74 @@ class FreepadOptionsWindow(QDialog, Creator):
 				filename = dialog.selectedFiles()[0]
 		return filename
 
+	# MIDI counters and latencies of PadIO, refreshed while the tab is shown
+	def setupDiagnostics(self):
+		self.tabDiagnostics = QWidget()
+		self.tabDiagnostics.setObjectName(u"tabDiagnostics")
+		self.vLayoutDiag = QVBoxLayout(self.tabDiagnostics)
+		self.vLayoutDiag.setObjectName(u"vLayoutDiag")
+		self.createObj(u'tDiag', QTableWidget(0, 7))
+		self.tDiag.verticalHeader().setVisible(False)
+		self.tDiag.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+		self.tDiag.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+		self.vLayoutDiag.addWidget(self.tDiag)
+		self.createObj(u'hlDiag', QHBoxLayout())
+		self.hlDiag.addItem(QSpacerItem(1, 1, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
+		self.createObj(u'btnDiagReset', QPushButton())
+		self.hlDiag.addWidget(self.btnDiagReset)
+		self.createObj(u'btnDiagExport', QPushButton())
+		self.hlDiag.addWidget(self.btnDiagExport)
+		self.vLayoutDiag.addLayout(self.hlDiag)
+		self.tabWidget.addTab(self.tabDiagnostics, "")
+		self.diagTimer = QTimer(self)
+		self.diagTimer.setInterval(500)
+		self.diagTimer.timeout.connect(self.refreshDiagnostics)
+		self.btnDiagReset.clicked.connect(self.resetDiagnostics)
+		self.btnDiagExport.clicked.connect(self.exportDiagnostics)
+
+	def refreshDiagnostics(self):
+		rows = self.fpw.io.stats.rows()
+		self.tDiag.setRowCount(len(rows))
+		for r, row in enumerate(rows):
+			for c, value in enumerate(row):
+				item = self.tDiag.item(r, c)
+				if item is None:
+					item = QTableWidgetItem()
+					self.tDiag.setItem(r, c, item)
+				item.setText(str(value))
+
+	def resetDiagnostics(self):
+		self.fpw.io.stats.reset()
+		self.refreshDiagnostics()
+
+	def exportDiagnostics(self):
+		filename, _ = QFileDialog.getSaveFileName(self, tr(u"Export MIDI statistics", None),
+			'freepad-' + self.title.lower().replace(' ', '') + '-midi.csv', 'CSV (*.csv)')
+		if filename == '':
+			return
+		try:
+			with open(filename, 'w', newline = '') as f:
+				f.write(self.fpw.io.stats.toCsv())
+				f.close()
+		except Exception as e:
+			Debug.dbg('Unable to write "' + filename + '": ' + str(e))
+
+	def tabChanged(self, index):
+		if self.tabWidget.widget(index) is self.tabHelp and not self.helpLoaded:
+			self.loadHelp()
+		if self.tabWidget.widget(index) is self.tabOptions:
+			self.refreshClock()
+			self.clockTimer.start()
+		else:
+			self.clockTimer.stop()
+		if self.tabWidget.widget(index) is self.tabDiagnostics:
+			self.refreshDiagnostics()
+			self.diagTimer.start()
+		else:
+			self.diagTimer.stop()
+
 	def loadHelp(self):
+		self.helpLoaded = True
 		with open(str(FREEPAD_PATH.joinpath('help').joinpath('freepad.html')), 'r') as fp:
 			html = fp.read()
 			fp.close()
@@ -0,0 +1,209 @@
+from qtpy.QtCore import QRect, QSize, Qt, Signal
+from qtpy.QtWidgets import QHBoxLayout, QLabel, QPushButton, QSizePolicy, QSpacerItem, QSpinBox, \
+	QVBoxLayout, QWidget
+from qtpy.QtGui import QColor, QIcon, QPainter
+
+from pad.path import FREEPAD_ICON_PATH
+from pad.ui.common import Creator, tr, FREEPAD_BORD_COLOR
+from pad.sequencer import MAX_STEPS, Sequencer
+from pad import velocity as curves
+
+#
+# Step sequencer window of a FreepadWindow: one row per pad of the main layout.
+# Click a step to set or clear it, scroll on a step to change its velocity.
+#
+
+class StepGrid(QWidget):
+	cellChanged = Signal(int, int) # row, step
+
+	CELL = 22
+	LABEL = 90
+
+	def __init__(self, pattern, names, defaultVelocity, parent = None):
+		super().__init__(parent)
+		self.pattern = pattern
+		self.names = names
+		self.defaultVelocity = defaultVelocity # defaultVelocity(row)
+		self.current = -1 # step playing
+		self.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
+
+	def sizeHint(self):
+		return QSize(self.LABEL + self.CELL * self.pattern.steps + 1, self.CELL * self.pattern.rows + 1)
+
+	def setCurrent(self, step):
+		if step != self.current:
+			self.current = step
+			self.update()
+
+	def _cell(self, pos):
+		row = pos.y() // self.CELL
+		step = (pos.x() - self.LABEL) // self.CELL
+		if pos.x() < self.LABEL or not 0 <= row < self.pattern.rows or not 0 <= step < self.pattern.steps:
+			return None
+		return row, step
+
+	def mousePressEvent(self, event):
+		cell = self._cell(event.position().toPoint() if hasattr(event, 'position') else event.pos())
+		if cell is not None:
+			row, step = cell
+			self.pattern.set(row, step, 0 if self.pattern.get(row, step) > 0 else self.defaultVelocity(row))
+			self.cellChanged.emit(row, step)
+			self.update()
+
+	def wheelEvent(self, event):
+		cell = self._cell(event.position().toPoint() if hasattr(event, 'position') else event.pos())
+		if cell is not None and self.pattern.get(*cell) > 0:
+			delta = 8 if event.angleDelta().y() > 0 else -8
+			self.pattern.set(cell[0], cell[1], max(1, self.pattern.get(*cell) + delta))
+			self.cellChanged.emit(*cell)
+			self.update()
+
+	def paintEvent(self, event):
+		qp = QPainter(self)
+		c = self.CELL
+		border = QColor(FREEPAD_BORD_COLOR)
+		for row in range(self.pattern.rows):
+			y = row * c
+			qp.setPen(self.palette().text().color())
+			qp.drawText(QRect(0, y, self.LABEL - 4, c), Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, self.names[row])
+			for step in range(self.pattern.steps):
+				x = self.LABEL + step * c
+				velocity = self.pattern.get(row, step)
+				if velocity > 0:
+					color = QColor(60 + int(195 * velocity / 127), 40, 0)
+				else:
+					color = QColor(32, 32, 34) if (step // 4) % 2 == 0 else QColor(44, 44, 46)
+				if step == self.current:
+					color = color.lighter(160)
+				qp.fillRect(x + 1, y + 1, c - 2, c - 2, color)
+				qp.setPen(border)
+				qp.drawRect(x, y, c - 1, c - 1)
+
+class SequencerWindow(QWidget, Creator):
+	def __init__(self, fpw, parent = None):
+		super().__init__(parent, Qt.WindowType.Window)
+		self.setWindowIcon(QIcon(FREEPAD_ICON_PATH))
+		self.fpw = fpw
+		# rows in pad number order
+		self.pads = sorted(fpw._pads, key = lambda pad: int(pad.pad_id) if pad.pad_id.isdigit() else 0)
+		self.sequencer = Sequencer(fpw.io, len(self.pads), parent = self)
+		self._lit = set() # pads lit by the last step
+		options = fpw.presetOptions.get('sequencer', {})
+		try:
+			self.sequencer.fromDict(options)
+			rows = options.get('rows', {})
+			for row, pad in enumerate(self.pads):
+				if pad.objectName() in rows:
+					self.sequencer.pattern.setRow(row, rows[pad.objectName()])
+		except (TypeError, ValueError) as e:
+			fpw.warning('Bad sequencer options', ': ' + str(e))
+
+	def setupUi(self, title):
+		self.title = title
+		seq = self.sequencer
+		self.createObj(u'vLayout', QVBoxLayout(self))
+		self.createObj(u'hlTransport', QHBoxLayout())
+		self.createObj(u'btnPlay', QPushButton())
+		self.btnPlay.setCheckable(True)
+		self.hlTransport.addWidget(self.btnPlay)
+		for name, lo, hi, value, suffix in [('spTempo', 20, 300, int(seq.tempo), ' bpm'),
+				('spSwing', 0, 75, int(100 * seq.swing), ' %'), ('spGate', 5, 100, int(100 * seq.gate), ' %'),
+				('spSteps', 1, MAX_STEPS, seq.pattern.steps, '')]:
+			spin = self.createObj(name, QSpinBox())
+			spin.setRange(lo, hi)
+			spin.setValue(value)
+			spin.setSuffix(suffix)
+			spin.valueChanged.connect(self.settingsChanged)
+			self.createObj('lbl' + name[2:], QLabel())
+			self.hlTransport.addWidget(getattr(self, 'lbl' + name[2:]))
+			self.hlTransport.addWidget(spin)
+		self.hlTransport.addItem(QSpacerItem(1, 1, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum))
+		self.createObj(u'lblLate', QLabel())
+		self.hlTransport.addWidget(self.lblLate)
+		self.createObj(u'btnClear', QPushButton())
+		self.hlTransport.addWidget(self.btnClear)
+		self.vLayout.addLayout(self.hlTransport)
+
+		names = [pad.cbName.lineEdit().text() for pad in self.pads]
+		self.createObj(u'grid', StepGrid(seq.pattern, names, lambda row: self.pads[row].level.defaultVelocity))
+		self.grid.setFixedSize(self.grid.sizeHint())
+		self.vLayout.addWidget(self.grid, 0, Qt.AlignmentFlag.AlignLeft)
+		self.vLayout.addItem(QSpacerItem(1, 1, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding))
+
+		self.retranslateUi()
+		self.btnPlay.toggled.connect(self.play)
+		self.btnClear.clicked.connect(self.clear)
+		self.grid.cellChanged.connect(lambda row, step: self._save())
+		seq.stepPlayed.connect(self.stepPlayed, Qt.ConnectionType.QueuedConnection)
+		seq.stopped.connect(self._stopped, Qt.ConnectionType.QueuedConnection)
+
+	def retranslateUi(self):
+		self.setWindowTitle(tr(u'Freepad ' + self.title + ' sequencer', None))
+		self.btnPlay.setText(tr(u'Play', None))
+		self.lblTempo.setText(tr(u'Tempo', None))
+		self.lblSwing.setText(tr(u'Swing', None))
+		self.lblGate.setText(tr(u'Gate', None))
+		self.lblSteps.setText(tr(u'Steps', None))
+		self.btnClear.setText(tr(u'Clear', None))
+
+	# (channel, note, velocity table) of each pad, read by the sequencer thread
+	def _updateNotes(self):
+		self.sequencer.setNotes([(self.fpw._channel(pad), pad.spNote.value(),
+			None if pad.velocityTable is curves.IDENTITY else pad.velocityTable) for pad in self.pads])
+
+	def settingsChanged(self):
+		seq = self.sequencer
+		seq.tempo = float(self.spTempo.value())
+		seq.swing = self.spSwing.value() / 100
+		seq.gate = self.spGate.value() / 100
+		if seq.pattern.steps != self.spSteps.value():
+			seq.pattern.steps = self.spSteps.value()
+			self.grid.setFixedSize(self.grid.sizeHint())
+			self.grid.update()
+		self._save()
+
+	# Saved with the next preset
+	def _save(self):
+		options = self.sequencer.toDict()
+		options['rows'] = {pad.objectName(): list(self.sequencer.pattern.row(row)) for row, pad in enumerate(self.pads)}
+		self.fpw.presetOptions['sequencer'] = options
+
+	def clear(self):
+		self.sequencer.pattern.clear()
+		self.grid.update()
+		self._save()
+
+	def play(self, checked):
+		if checked:
+			self._updateNotes()
+			self.sequencer.start()
+			self.btnPlay.setText(tr(u'Stop', None))
+		else:
+			self.sequencer.stop()
+
+	# Lights follow the playback through the frame coalescer of the window
+	def stepPlayed(self, step):
+		self._updateNotes()
+		self.grid.setCurrent(step)
+		pattern = self.sequencer.pattern
+		lit = set()
+		for row, pad in enumerate(self.pads):
+			velocity = pattern.get(row, step)
+			if velocity > 0:
+				self.fpw.uiFrame.lightOn(pad, pad.velocityTable[velocity])
+				lit.add(pad)
+		for pad in self._lit - lit:
+			self.fpw.uiFrame.lightOff(pad)
+		self._lit = lit
+		self.lblLate.setText(tr(u'Late', None) + ' ' + '{:.1f}'.format(1000 * self.sequencer.late) + ' ms')
+
+	def _stopped(self):
+		self.grid.setCurrent(-1)
+		for pad in self._lit:
+			self.fpw.uiFrame.lightOff(pad)
+		self._lit = set()
+		self.btnPlay.setChecked(False)
+		self.btnPlay.setText(tr(u'Play', None))
+
+	def stop(self):
+		self.sequencer.stop()
@@ -0,0 +1,108 @@
+import math
+
+from pad.base import PadException
+
+#
+# Velocity curves, precomputed into 128 entries tables when they change.
+# Velocity 0 (note off) is kept, other velocities are mapped to 1..127.
+# Stored in the "velocity" options of the presets:
+#	"velocity": {
+#		"global": {"curve": "log", "amount": 3},
+#		"pads": {"p1": {"curve": "fixed", "value": 100}, "p2": {"curve": "custom", "points": [[0, 0], [64, 100], [127, 127]]}}
+#	}
+#
+
+CURVES = ['linear', 'log', 'exp', 'fixed', 'custom']
+
+IDENTITY = bytes(range(128))
+
+class VelocityError(PadException):
+	pass
+
+class VelocityCurve(object):
+	__slots__ = ('curve', 'amount', 'value', 'points', 'table')
+
+	def __init__(self, curve = 'linear', amount = 3.0, value = 100, points = None):
+		if curve not in CURVES:
+			raise VelocityError('Unknown velocity curve "' + str(curve) + '"')
+		if not isinstance(amount, (int, float)) or amount <= 0:
+			raise VelocityError('The velocity curve amount must be greater than 0')
+		if not isinstance(value, int) or not 1 <= value <= 127:
+			raise VelocityError('The fixed velocity must be from 1 to 127')
+		self.curve = curve
+		self.amount = amount # log and exp curves strength
+		self.value = value # fixed velocity
+		self.points = self._checkPoints(points if points is not None else [[0, 0], [127, 127]])
+		self.table = self._compile()
+
+	@staticmethod
+	def _checkPoints(points):
+		try:
+			points = sorted([int(i), int(o)] for i, o in points)
+		except (TypeError, ValueError):
+			raise VelocityError('Velocity curve points must be [input, output] pairs') from None
+		for i, o in points:
+			if not 0 <= i <= 127 or not 0 <= o <= 127:
+				raise VelocityError('Velocity curve points must be from 0 to 127')
+		if len(points) == 0:
+			raise VelocityError('A custom velocity curve needs points')
+		return points
+
+	def _compile(self):
+		if self.curve == 'linear':
+			return IDENTITY
+		if self.curve == 'fixed':
+			return bytes([0] + [self.value] * 127)
+		out = [0] * 128
+		a = self.amount
+		for v in range(1, 128):
+			x = v / 127
+			if self.curve == 'log':
+				y = math.log1p(a * x) / math.log1p(a)
+			elif self.curve == 'exp':
+				y = math.expm1(a * x) / math.expm1(a)
+			else:
+				y = self._interpolate(v) / 127
+			out[v] = min(127, max(1, round(127 * y)))
+		return bytes(out)
+
+	# Piecewise linear between the points, from (0, 0) to (127, 127) when not given
+	def _interpolate(self, v):
+		points = self.points
+		if points[0][0] > 0:
+			points = [[0, 0]] + points
+		if points[-1][0] < 127:
+			points = points + [[127, 127]]
+		for (x0, y0), (x1, y1) in zip(points, points[1:]):
+			if v <= x1:
+				return y0 + (y1 - y0) * (v - x0) / (x1 - x0) if x1 > x0 else y1
+		return points[-1][1]
+
+	def isLinear(self):
+		return self.table is IDENTITY
+
+	def toDict(self):
+		d = {'curve': self.curve}
+		if self.curve in ('log', 'exp'):
+			d['amount'] = self.amount
+		elif self.curve == 'fixed':
+			d['value'] = self.value
+		elif self.curve == 'custom':
+			d['points'] = self.points
+		return d
+
+	@staticmethod
+	def fromDict(d):
+		if not isinstance(d, dict):
+			raise VelocityError('A velocity curve must be an object')
+		return VelocityCurve(d.get('curve', 'linear'), d.get('amount', 3.0), d.get('value', 100), d.get('points'))
+
+# "0:0 64:100 127:127" <-> [[0, 0], [64, 100], [127, 127]]
+def parsePoints(text):
+	try:
+		return [[int(a), int(b)] for a, b in (p.split(':') for p in text.replace(',', ' ').split())]
+	except ValueError:
+		raise VelocityError('Velocity curve points must be written "input:output input:output..."') from None
+
+def formatPoints(points):
+	return ' '.join(str(i) + ':' + str(o) for i, o in points)